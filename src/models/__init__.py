@@ -3,11 +3,13 @@
 
 This package contains models representing various aspects of the Shelly
 device status, including light status, input status, meter status, MQTT
-status, temperature status, and more. These models are used for data
-validation and serialization.
+status, temperature status, and more, as well as the device settings.
+These models are used for data validation and serialization.
 """
 
+from .device_info import DeviceInfo
 from .light import LightStatus
+from .settings import Settings
 from .status import Status
 
-__all__ = ["Status", "LightStatus"]
\ No newline at end of file
+__all__ = ["Status", "LightStatus", "DeviceInfo", "Settings"]
@@ -0,0 +1,54 @@
+"""
+Device Info Model.
+
+This module defines the `DeviceInfo` model, representing the answer of the
+unauthenticated `/shelly` endpoint that identifies a Shelly device.
+"""
+
+from pydantic import BaseModel, Field
+
+
+class DeviceInfo(BaseModel):
+    """
+    A model representing the identity of a Shelly device.
+
+    Attributes
+    ----------
+    type : str
+        The model identifier of the device (e.g. "SHDM-2" for a Dimmer2).
+    mac : str
+        The MAC address of the device.
+    auth : bool
+        Whether the HTTP API requires authentication.
+    fw : str
+        The firmware version.
+    num_outputs : int
+        The number of outputs.
+    num_meters : int
+        The number of power meters.
+    """
+
+    type: str = Field(
+        ...,
+        description="The model identifier of the device (e.g. SHDM-2)",
+    )
+    mac: str = Field(
+        ...,
+        description="The MAC address of the device",
+    )
+    auth: bool = Field(
+        False,
+        description="Whether the HTTP API requires authentication",
+    )
+    fw: str = Field(
+        "",
+        description="The firmware version",
+    )
+    num_outputs: int = Field(
+        0,
+        description="The number of outputs",
+    )
+    num_meters: int = Field(
+        0,
+        description="The number of power meters",
+    )
@@ -0,0 +1,106 @@
+"""
+Settings Models.
+
+This module defines the `Settings` model, representing the configuration
+of a Shelly device as returned by its `/settings` endpoint, including the
+device identity, MQTT and light channel settings.
+"""
+
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from models.settings.device import DeviceSettings
+from models.settings.light import LightSettings
+from models.settings.mqtt import MQTTSettings
+
+
+class Settings(BaseModel):
+    """
+    A model representing the configuration of a Shelly device.
+
+    Attributes
+    ----------
+    device : DeviceSettings
+        The identity of the device.
+    mqtt : MQTTSettings
+        The MQTT configuration.
+    name : Optional[str]
+        The name of the device.
+    fw : str
+        The firmware version.
+    discoverable : bool
+        Whether the device can be discovered.
+    timezone : str
+        The timezone of the device.
+    lat : float
+        The latitude of the device, used for sunrise and sunset.
+    lng : float
+        The longitude of the device, used for sunrise and sunset.
+    mode : str
+        The light mode (default is "white").
+    calibrated : bool
+        Whether the calibration is done.
+    min_brightness : int
+        The minimum brightness in percent.
+    lights : List[LightSettings]
+        The configuration of the light channels.
+    """
+
+    device: DeviceSettings = Field(
+        ...,
+        description="The identity of the device",
+    )
+    mqtt: MQTTSettings = Field(
+        default_factory=MQTTSettings,
+        description="The MQTT configuration",
+        repr=False,
+    )
+    name: Optional[str] = Field(
+        None,
+        description="The name of the device",
+    )
+    fw: str = Field(
+        "",
+        description="The firmware version",
+        repr=False,
+    )
+    discoverable: bool = Field(
+        True,
+        description="Whether the device can be discovered",
+        repr=False,
+    )
+    timezone: str = Field(
+        "",
+        description="The timezone of the device",
+        repr=False,
+    )
+    lat: float = Field(
+        0.0,
+        description="The latitude of the device",
+        repr=False,
+    )
+    lng: float = Field(
+        0.0,
+        description="The longitude of the device",
+        repr=False,
+    )
+    mode: str = Field(
+        "white",
+        description="The light mode",
+        repr=False,
+    )
+    calibrated: bool = Field(
+        False,
+        description="Whether the calibration is done",
+        repr=False,
+    )
+    min_brightness: int = Field(
+        0,
+        description="The minimum brightness in percent",
+        repr=False,
+    )
+    lights: List[LightSettings] = Field(
+        default_factory=list,
+        description="The configuration of the light channels",
+    )
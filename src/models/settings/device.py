@@ -0,0 +1,50 @@
+"""
+Device Settings Model.
+
+This module defines the `DeviceSettings` model, representing the identity
+section of the settings of a Shelly device.
+"""
+
+from pydantic import BaseModel, Field
+
+
+class DeviceSettings(BaseModel):
+    """
+    A model representing the identity of a Shelly device.
+
+    Attributes
+    ----------
+    type : str
+        The model identifier of the device (e.g. "SHDM-2").
+    mac : str
+        The MAC address of the device.
+    hostname : str
+        The hostname of the device.
+    num_outputs : int
+        The number of outputs.
+    num_meters : int
+        The number of power meters.
+    """
+
+    type: str = Field(
+        ...,
+        description="The model identifier of the device (e.g. SHDM-2)",
+    )
+    mac: str = Field(
+        ...,
+        description="The MAC address of the device",
+    )
+    hostname: str = Field(
+        "",
+        description="The hostname of the device",
+    )
+    num_outputs: int = Field(
+        1,
+        description="The number of outputs",
+        repr=False,
+    )
+    num_meters: int = Field(
+        1,
+        description="The number of power meters",
+        repr=False,
+    )
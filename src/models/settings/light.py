@@ -0,0 +1,81 @@
+"""
+Light Settings Model.
+
+This module defines the `LightSettings` model, representing the
+configuration of a light channel of a Shelly device.
+"""
+
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class LightSettings(BaseModel):
+    """
+    A model representing the configuration of a light channel.
+
+    Attributes
+    ----------
+    name : Optional[str]
+        The name of the channel.
+    is_on : bool
+        Whether the light is on.
+    brightness : int
+        The brightness of the light in percent.
+    transition : int
+        The transition time in milliseconds.
+    default_state : str
+        The state after power-on ("off", "on", "last" or "switch").
+    auto_on : float
+        Seconds after which the light turns on again, 0 to disable.
+    auto_off : float
+        Seconds after which the light turns off again, 0 to disable.
+    schedule : bool
+        Whether the device schedule is enabled.
+    schedule_rules : List[str]
+        The weekly schedule rules run by the device.
+    """
+
+    name: Optional[str] = Field(
+        None,
+        description="The name of the channel",
+    )
+    is_on: bool = Field(
+        False,
+        description="Whether the light is on",
+        alias="ison",
+    )
+    brightness: int = Field(
+        0,
+        description="The brightness of the light in percent",
+    )
+    transition: int = Field(
+        0,
+        description="The transition time in milliseconds",
+        repr=False,
+    )
+    default_state: str = Field(
+        "last",
+        description="The state after power-on (off, on, last or switch)",
+        repr=False,
+    )
+    auto_on: float = Field(
+        0,
+        description="Seconds after which the light turns on again, 0 to disable",
+        repr=False,
+    )
+    auto_off: float = Field(
+        0,
+        description="Seconds after which the light turns off again, 0 to disable",
+        repr=False,
+    )
+    schedule: bool = Field(
+        False,
+        description="Whether the device schedule is enabled",
+        repr=False,
+    )
+    schedule_rules: List[str] = Field(
+        default_factory=list,
+        description="The weekly schedule rules run by the device",
+        repr=False,
+    )
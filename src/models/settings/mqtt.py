@@ -0,0 +1,78 @@
+"""
+MQTT Settings Model.
+
+This module defines the `MQTTSettings` model, representing the MQTT
+configuration of a Shelly device.
+"""
+
+from pydantic import BaseModel, Field
+
+
+class MQTTSettings(BaseModel):
+    """
+    A model representing the MQTT configuration.
+
+    Attributes
+    ----------
+    enable : bool
+        Whether MQTT is enabled.
+    server : str
+        The broker address as ``host:port``.
+    user : str
+        The broker username.
+    id : str
+        The id of the device in its MQTT topics.
+    clean_session : bool
+        Whether the device connects with a clean session.
+    keep_alive : int
+        The keep-alive interval in seconds.
+    max_qos : int
+        The maximum QoS level used.
+    retain : bool
+        Whether published messages are retained.
+    update_period : int
+        The interval in seconds of periodic status updates.
+    """
+
+    enable: bool = Field(
+        False,
+        description="Whether MQTT is enabled",
+    )
+    server: str = Field(
+        "",
+        description="The broker address as host:port",
+    )
+    user: str = Field(
+        "",
+        description="The broker username",
+        repr=False,
+    )
+    id: str = Field(
+        "",
+        description="The id of the device in its MQTT topics",
+    )
+    clean_session: bool = Field(
+        True,
+        description="Whether the device connects with a clean session",
+        repr=False,
+    )
+    keep_alive: int = Field(
+        60,
+        description="The keep-alive interval in seconds",
+        repr=False,
+    )
+    max_qos: int = Field(
+        0,
+        description="The maximum QoS level used",
+        repr=False,
+    )
+    retain: bool = Field(
+        False,
+        description="Whether published messages are retained",
+        repr=False,
+    )
+    update_period: int = Field(
+        30,
+        description="The interval in seconds of periodic status updates",
+        repr=False,
+    )
@@ -17,6 +17,7 @@ from models.status.update import UpdateStatus
 from models.status.wifi_status import WifiStatus
 from models.status.cloud import CloudStatus
 
+
 class Status(BaseModel):
     """
     A model representing the overall status of a Shelly device.
@@ -152,9 +153,7 @@ class Status(BaseModel):
         repr=False,
     )
     temperature: TempStatus = Field(
-        ...,
-        description="The temperature status",
-        alias="tmp"
+        ..., description="The temperature status", alias="tmp"
     )
     calibrated: bool = Field(
         ...,
@@ -186,17 +185,13 @@ class Status(BaseModel):
     over_temperature: bool = Field(
         ...,
         description="Whether an overtemperature condition has occurred",
-        alias="overtemperature"
-    )
-    load_error: int = Field(
-        ...,
-        description="The load error",
-        alias="loaderror"
+        alias="overtemperature",
     )
+    load_error: int = Field(..., description="The load error", alias="loaderror")
     over_power: bool = Field(
         ...,
         description="Whether an over power condition has occurred",
-        alias="overpower"
+        alias="overpower",
     )
     debug: int = Field(
         ...,
@@ -234,99 +229,80 @@ class Status(BaseModel):
         repr=False,
     )
 
-if __name__ == '__main__':
 
-    status_json = {
-      "wifi_sta": {
+# A status payload as returned by the /status endpoint of a Dimmer2.
+SAMPLE_STATUS = {
+    "wifi_sta": {
         "connected": True,
         "ssid": "13 Claps",
         "ip": "192.168.1.99",
-        "rssi": -51
-      },
-      "cloud": {
-        "enabled": False,
-        "connected": False
-      },
-      "mqtt": {
-        "connected": True
-      },
-      "time": "14:16",
-      "unixtime": 1723929401,
-      "serial": 124,
-      "has_update": False,
-      "mac": "EC64C9C2EFE2",
-      "cfg_changed_cnt": 0,
-      "actions_stats": {
-        "skipped": 0
-      },
-      "lights": [
-        {
-          "ison": False,
-          "source": "http",
-          "has_timer": False,
-          "timer_started": 0,
-          "timer_duration": 0,
-          "timer_remaining": 0,
-          "mode": "white",
-          "brightness": 100,
-          "transition": 0
-        }
-      ],
-      "meters": [
+        "rssi": -51,
+    },
+    "cloud": {"enabled": False, "connected": False},
+    "mqtt": {"connected": True},
+    "time": "14:16",
+    "unixtime": 1723929401,
+    "serial": 124,
+    "has_update": False,
+    "mac": "EC64C9C2EFE2",
+    "cfg_changed_cnt": 0,
+    "actions_stats": {"skipped": 0},
+    "lights": [
         {
-          "power": 0.0,
-          "overpower": 0.0,
-          "is_valid": True,
-          "timestamp": 1723904201,
-          "counters": [
-            0.0,
-            0.0,
-            0.0
-          ],
-          "total": 244
+            "ison": False,
+            "source": "http",
+            "has_timer": False,
+            "timer_started": 0,
+            "timer_duration": 0,
+            "timer_remaining": 0,
+            "mode": "white",
+            "brightness": 100,
+            "transition": 0,
         }
-      ],
-      "inputs": [
-        {
-          "input": 0,
-          "event": "",
-          "event_cnt": 0
-        },
+    ],
+    "meters": [
         {
-          "input": 0,
-          "event": "",
-          "event_cnt": 0
+            "power": 0.0,
+            "overpower": 0.0,
+            "is_valid": True,
+            "timestamp": 1723904201,
+            "counters": [0.0, 0.0, 0.0],
+            "total": 244,
         }
-      ],
-      "tmp": {
-        "tC": 36.65,
-        "tF": 97.98,
-        "is_valid": True
-      },
-      "calibrated": False,
-      "calib_progress": 0,
-      "calib_status": 0,
-      "calib_running": 0,
-      "wire_mode": 1,
-      "forced_neutral": False,
-      "overtemperature": False,
-      "loaderror": 0,
-      "overpower": False,
-      "debug": 0,
-      "update": {
+    ],
+    "inputs": [
+        {"input": 0, "event": "", "event_cnt": 0},
+        {"input": 0, "event": "", "event_cnt": 0},
+    ],
+    "tmp": {"tC": 36.65, "tF": 97.98, "is_valid": True},
+    "calibrated": False,
+    "calib_progress": 0,
+    "calib_status": 0,
+    "calib_running": 0,
+    "wire_mode": 1,
+    "forced_neutral": False,
+    "overtemperature": False,
+    "loaderror": 0,
+    "overpower": False,
+    "debug": 0,
+    "update": {
         "status": "idle",
         "has_update": False,
         "new_version": "20230913-114008/v1.14.0-gcb84623",
         "old_version": "20230913-114008/v1.14.0-gcb84623",
-        "beta_version": "20231107-164738/v1.14.1-rc1-g0617c15"
-      },
-      "ram_total": 49672,
-      "ram_free": 36320,
-      "fs_size": 233681,
-      "fs_free": 112197,
-      "uptime": 7400
-    }
-    status = Status(**status_json)
+        "beta_version": "20231107-164738/v1.14.1-rc1-g0617c15",
+    },
+    "ram_total": 49672,
+    "ram_free": 36320,
+    "fs_size": 233681,
+    "fs_free": 112197,
+    "uptime": 7400,
+}
+
+
+if __name__ == "__main__":
+
+    status = Status(**SAMPLE_STATUS)
     print(status)
     print(status.model_dump_json())
     print(status.model_dump())
@@ -0,0 +1,388 @@
+"""
+Alerting Module.
+
+This module evaluates threshold rules over the state of a whole fleet. The
+readings of one polling round are turned into one NumPy array per field and
+every `Rule` is evaluated on all devices at once, so the cost of a round is
+a few array operations per rule rather than a Python loop per device.
+
+Rules debounce (a breach must last ``for_seconds`` before the alert fires)
+and use hysteresis (an alert resolves only once the reading is past the
+``clear`` threshold for ``clear_for`` seconds), so readings hovering around
+a threshold do not flap::
+
+    alerts = FleetAlerts()
+    alerts.add_listener(print)
+    poller.add_listener(alerts.evaluate_samples)
+
+NumPy is an optional dependency, installed with the ``alerting`` extra.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+import threading
+import time
+from typing import Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+from loguru import logger
+
+try:
+    import numpy as np
+except ImportError as error:  # pragma: no cover
+    raise ImportError(
+        "shelly.alerting requires numpy, install shelly[alerting]"
+    ) from error
+
+from .fleet import StatusSample
+
+# How a reading breaches a threshold, and how it recovers from the breach.
+BREACHES = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal}
+RECOVERIES = {
+    ">": np.less_equal,
+    ">=": np.less,
+    "<": np.greater_equal,
+    "<=": np.greater,
+}
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    A declarative threshold rule.
+
+    Attributes
+    ----------
+    name : str
+        The name of the alert.
+    column : str
+        The `StatusSample` field the rule reads, e.g. "temperature".
+    op : str
+        How the reading breaches the threshold: ">", ">=", "<" or "<=".
+    threshold : float
+        The threshold, or a fraction of ``relative_to``.
+    relative_to : Optional[str]
+        The field the thresholds are fractions of, e.g. "overpower"; devices
+        without a positive value of it are not evaluated.
+    clear : Optional[float]
+        The threshold past which the alert resolves, by default
+        ``threshold``.
+    for_seconds : float
+        How long the threshold must be breached before the alert fires.
+    clear_for : float
+        How long the reading must be past ``clear`` before the alert
+        resolves.
+    """
+
+    name: str
+    column: str
+    op: str
+    threshold: float
+    relative_to: Optional[str] = None
+    clear: Optional[float] = None
+    for_seconds: float = 0.0
+    clear_for: float = 0.0
+
+    def __post_init__(self) -> None:
+        """
+        Validates the operator.
+        """
+        if self.op not in BREACHES:
+            raise ValueError(f"Unknown operator {self.op!r} in rule {self.name}")
+
+
+DEFAULT_RULES = (
+    Rule(
+        "high_temperature",
+        "temperature",
+        ">",
+        70.0,
+        clear=65.0,
+        for_seconds=30.0,
+        clear_for=30.0,
+    ),
+    Rule(
+        "near_over_power",
+        "power",
+        ">",
+        0.9,
+        relative_to="overpower",
+        clear=0.85,
+        for_seconds=10.0,
+    ),
+    Rule("over_temperature", "over_temperature", ">", 0.5),
+    Rule("over_power", "over_power", ">", 0.5),
+    Rule("load_error", "load_error", ">", 0.5),
+)
+
+
+class Alert(NamedTuple):
+    """
+    A change of an alert.
+
+    Attributes
+    ----------
+    rule : str
+        The name of the rule.
+    device : str
+        The MAC address of the device.
+    firing : bool
+        True if the alert fired, False if it resolved.
+    value : float
+        The reading that changed the alert.
+    timestamp : float
+        When the alert changed, in seconds since the epoch.
+    """
+
+    rule: str
+    device: str
+    firing: bool
+    value: float
+    timestamp: float
+
+
+class FleetAlerts:
+    """
+    Evaluates threshold rules on every device of a fleet at once.
+
+    Attributes
+    ----------
+    rules : Sequence[Rule]
+        The rules.
+
+    Methods
+    -------
+    add_listener(callback)
+        Calls a function with the alerts that changed in a round.
+    evaluate(devices, columns, now) -> List[Alert]
+        Evaluates the rules on readings given as arrays.
+    evaluate_samples(samples, now) -> List[Alert]
+        Evaluates the rules on a batch of `StatusSample` tuples.
+    active() -> List[Alert]
+        Returns the alerts currently firing.
+    """
+
+    def __init__(
+        self,
+        rules: Sequence[Rule] = DEFAULT_RULES,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """
+        Initializes the FleetAlerts instance.
+
+        Parameters
+        ----------
+        rules : Sequence[Rule], optional
+            The rules, by default `DEFAULT_RULES`.
+        clock : Callable[[], float], optional
+            Returns the current time, by default `time.time`.
+        """
+        self.rules = tuple(rules)
+        self._clock = clock
+        self._listeners: List[Callable[[List[Alert]], None]] = []
+        self._lock = threading.Lock()
+        self._index: Dict[str, int] = {}
+        self._devices: List[str] = []
+        self._last_devices: List[str] = []
+        self._last_slots = np.empty(0, dtype=np.intp)
+        # One row per rule and one column per device.
+        self._active = np.zeros((len(self.rules), 0), dtype=bool)
+        self._pending = np.empty((len(self.rules), 0))
+        self._clearing = np.empty((len(self.rules), 0))
+        self._since = np.empty((len(self.rules), 0))
+        self._values = np.empty((len(self.rules), 0))
+
+    def add_listener(self, callback: Callable[[List[Alert]], None]) -> None:
+        """
+        Calls a function with the alerts that changed in a round.
+
+        Parameters
+        ----------
+        callback : Callable[[List[Alert]], None]
+            Called with the fired and resolved alerts, if any.
+        """
+        self._listeners.append(callback)
+
+    def _slots(self, devices: Sequence[str]) -> np.ndarray:
+        """
+        Returns the state columns of devices, adding columns for new ones.
+        """
+        devices = list(devices)
+        if devices == self._last_devices:
+            return self._last_slots
+        index = self._index
+        for device in devices:
+            if device not in index:
+                index[device] = len(self._devices)
+                self._devices.append(device)
+        if len(self._devices) > self._active.shape[1]:
+            grow = (
+                max(len(self._devices), 2 * self._active.shape[1])
+                - self._active.shape[1]
+            )
+            rules = len(self.rules)
+            self._active = np.hstack(
+                [self._active, np.zeros((rules, grow), dtype=bool)]
+            )
+            self._pending = np.hstack([self._pending, np.full((rules, grow), np.nan)])
+            self._clearing = np.hstack([self._clearing, np.full((rules, grow), np.nan)])
+            self._since = np.hstack([self._since, np.full((rules, grow), np.nan)])
+            self._values = np.hstack([self._values, np.full((rules, grow), np.nan)])
+        self._last_devices = devices
+        self._last_slots = np.fromiter(
+            (index[device] for device in devices), np.intp, len(devices)
+        )
+        return self._last_slots
+
+    def evaluate(
+        self,
+        devices: Sequence[str],
+        columns: Mapping[str, np.ndarray],
+        now: Optional[float] = None,
+    ) -> List[Alert]:
+        """
+        Evaluates the rules on readings given as arrays.
+
+        Parameters
+        ----------
+        devices : Sequence[str]
+            The devices the readings belong to.
+        columns : Mapping[str, np.ndarray]
+            One array per field with one reading per device. An optional
+            boolean "ok" array marks stale readings, which neither fire nor
+            resolve alerts.
+        now : Optional[float], optional
+            The time of the readings, by default the current time.
+
+        Returns
+        -------
+        List[Alert]
+            The alerts that fired or resolved.
+        """
+        now = self._clock() if now is None else now
+        alerts: List[Alert] = []
+        with self._lock:
+            slots = self._slots(devices)
+            fresh = np.asarray(columns.get("ok", True), dtype=bool)
+            for row, rule in enumerate(self.rules):
+                value = np.asarray(columns[rule.column], dtype=float)
+                limit: object = rule.threshold
+                clear: object = rule.threshold if rule.clear is None else rule.clear
+                known = fresh
+                if rule.relative_to is not None:
+                    reference = np.asarray(columns[rule.relative_to], dtype=float)
+                    known = known & (reference > 0)
+                    limit, clear = reference * limit, reference * clear
+                breached = BREACHES[rule.op](value, limit) & known
+                recovered = RECOVERIES[rule.op](value, clear) & known
+                active = self._active[row, slots]
+                # fmin keeps the start of a breach that is still going on, and
+                # stale readings leave both timers as they were.
+                pending = self._pending[row, slots]
+                clearing = self._clearing[row, slots]
+                pending = np.where(
+                    breached & ~active,
+                    np.fmin(pending, now),
+                    np.where(known, np.nan, pending),
+                )
+                clearing = np.where(
+                    recovered & active,
+                    np.fmin(clearing, now),
+                    np.where(known, np.nan, clearing),
+                )
+                fire = breached & ~active & (now - pending >= rule.for_seconds)
+                resolve = recovered & active & (now - clearing >= rule.clear_for)
+                self._pending[row, slots] = np.where(fire, np.nan, pending)
+                self._clearing[row, slots] = np.where(resolve, np.nan, clearing)
+                self._active[row, slots] = (active | fire) & ~resolve
+                self._values[row, slots] = np.where(
+                    known, value, self._values[row, slots]
+                )
+                self._since[row, slots[fire]] = now
+                for position in np.flatnonzero(fire | resolve):
+                    alerts.append(
+                        Alert(
+                            rule.name,
+                            devices[position],
+                            bool(fire[position]),
+                            float(value[position]),
+                            now,
+                        )
+                    )
+        for alert in alerts:
+            if alert.firing:
+                logger.warning(
+                    "Alert {} fired on {} at {}", alert.rule, alert.device, alert.value
+                )
+            else:
+                logger.info(
+                    "Alert {} resolved on {} at {}",
+                    alert.rule,
+                    alert.device,
+                    alert.value,
+                )
+        if alerts:
+            for listener in self._listeners:
+                try:
+                    listener(alerts)
+                except Exception:
+                    logger.exception("Alert listener {} failed", listener)
+        return alerts
+
+    def evaluate_samples(
+        self, samples: Sequence[StatusSample], now: Optional[float] = None
+    ) -> List[Alert]:
+        """
+        Evaluates the rules on a batch of `StatusSample` tuples, see
+        `ShardedPoller.add_listener`.
+
+        Parameters
+        ----------
+        samples : Sequence[StatusSample]
+            The samples of one polling round.
+        now : Optional[float], optional
+            The time of the samples, by default the current time.
+
+        Returns
+        -------
+        List[Alert]
+            The alerts that fired or resolved.
+        """
+        samples = [sample for sample in samples if sample.mac]
+        if not samples:
+            return []
+        fields = dict(zip(StatusSample._fields, zip(*samples)))
+        columns = {
+            name: np.array(fields[name], dtype=bool if name == "ok" else float)
+            for name in {
+                "ok",
+                *(rule.column for rule in self.rules),
+                *(
+                    rule.relative_to
+                    for rule in self.rules
+                    if rule.relative_to is not None
+                ),
+            }
+        }
+        return self.evaluate(fields["mac"], columns, now)
+
+    def active(self) -> List[Alert]:
+        """
+        Returns the alerts currently firing.
+
+        Returns
+        -------
+        List[Alert]
+            The alerts, with the latest reading and the time they fired.
+        """
+        with self._lock:
+            rows, slots = np.nonzero(self._active)
+            return [
+                Alert(
+                    self.rules[row].name,
+                    self._devices[slot],
+                    True,
+                    float(self._values[row, slot]),
+                    float(self._since[row, slot]),
+                )
+                for row, slot in zip(rows, slots)
+            ]
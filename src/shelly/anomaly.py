@@ -0,0 +1,394 @@
+"""
+Anomaly Module.
+
+This module detects anomalies in the power draw of devices as samples
+stream in. Per device it keeps an exponentially weighted moving average and
+variance of ``meters[0].power``, so every sample costs O(1) time and memory
+and the common case allocates nothing but the arithmetic results:
+
+- a reading more than ``z_threshold`` standard deviations off the average
+  is held back from the average; if ``step_samples`` such readings in a row
+  agree, the load changed and a "load_changed" event re-bases the average,
+  otherwise the reading was a transient and is ignored;
+- a power of about zero for ``step_samples`` readings while the light is on
+  with a brightness above zero emits "lamp_failed", and power coming back
+  afterwards "lamp_recovered".
+
+Changes of the on state or brightness change the expected power, so they
+restart the average after ``settle_samples`` readings::
+
+    detector = PowerAnomalyDetector()
+    detector.add_listener(print)
+    dimmer.add_listener(detector.listener)
+"""
+
+from __future__ import annotations
+import math
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from models import Status
+from .dimmer2 import Dimmer2
+from .fleet import StatusSample
+
+LAMP_FAILED = "lamp_failed"
+LAMP_RECOVERED = "lamp_recovered"
+LOAD_CHANGED = "load_changed"
+
+
+class PowerEvent(NamedTuple):
+    """
+    An anomaly in the power draw of a device.
+
+    Attributes
+    ----------
+    kind : str
+        "lamp_failed", "lamp_recovered" or "load_changed".
+    device : str
+        The device key.
+    power : float
+        The power in watts that triggered the event; for "load_changed" the
+        average of the readings at the new level.
+    expected : float
+        The average power in watts before the event.
+    zscore : float
+        How many standard deviations the power is off the average.
+    timestamp : float
+        The time of the triggering reading, in seconds since the epoch.
+    """
+
+    kind: str
+    device: str
+    power: float
+    expected: float
+    zscore: float
+    timestamp: float
+
+
+class _PowerState:
+    """
+    The running statistics of one device.
+    """
+
+    __slots__ = (
+        "is_on",
+        "brightness",
+        "settle",
+        "count",
+        "mean",
+        "var",
+        "pending",
+        "pending_sum",
+        "low",
+        "failed",
+    )
+
+    def __init__(self) -> None:
+        """
+        Initializes the _PowerState instance.
+        """
+        self.is_on = False
+        self.brightness = -1
+        self.settle = 0
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.pending = 0
+        self.pending_sum = 0.0
+        self.low = 0
+        self.failed = False
+
+
+class PowerAnomalyDetector:
+    """
+    Detects lamp failures and load changes in streaming power readings.
+
+    Attributes
+    ----------
+    alpha : float
+        The weight of a new reading in the moving average and variance.
+    z_threshold : float
+        How many standard deviations off the average a reading is an
+        outlier.
+    step_samples : int
+        The number of agreeing readings that confirm a load change or a
+        failed lamp.
+    settle_samples : int
+        The number of readings ignored after the on state or brightness
+        changed, while the dimmer ramps.
+    warmup : int
+        The number of readings averaged before outliers are detected.
+    failed_power : float
+        The power in watts at or below which a lit lamp counts as failed.
+    min_std : float
+        The smallest standard deviation in watts used for z-scores, so
+        a perfectly steady load does not turn meter noise into outliers.
+    relative_std : float
+        The smallest standard deviation as a fraction of the average.
+
+    Methods
+    -------
+    add_listener(callback)
+        Calls a function with every event.
+    update(device, power, is_on, brightness, timestamp) -> Optional[PowerEvent]
+        Processes one reading.
+    listener(dimmer, status)
+        Processes the status of a `Dimmer2`, see `Dimmer2.add_listener`.
+    update_samples(samples) -> List[PowerEvent]
+        Processes a batch of `StatusSample` tuples.
+    baseline(device) -> Optional[Tuple[float, float]]
+        Returns the average power and its standard deviation.
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.05,
+        z_threshold: float = 4.0,
+        step_samples: int = 3,
+        settle_samples: int = 2,
+        warmup: int = 5,
+        failed_power: float = 0.5,
+        min_std: float = 0.5,
+        relative_std: float = 0.02,
+    ) -> None:
+        """
+        Initializes the PowerAnomalyDetector instance.
+
+        Parameters
+        ----------
+        alpha : float, optional
+            The weight of a new reading, by default 0.05.
+        z_threshold : float, optional
+            The z-score of an outlier, by default 4.0.
+        step_samples : int, optional
+            The readings confirming an event, by default 3.
+        settle_samples : int, optional
+            The readings ignored after a light change, by default 2.
+        warmup : int, optional
+            The readings averaged before detecting outliers, by default 5.
+        failed_power : float, optional
+            The power of a failed lamp in watts, by default 0.5.
+        min_std : float, optional
+            The smallest standard deviation in watts, by default 0.5.
+        relative_std : float, optional
+            The smallest standard deviation relative to the average, by
+            default 0.02.
+        """
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.step_samples = step_samples
+        self.settle_samples = settle_samples
+        self.warmup = warmup
+        self.failed_power = failed_power
+        self.min_std = min_std
+        self.relative_std = relative_std
+        self._states: Dict[str, _PowerState] = {}
+        self._listeners: List[Callable[[PowerEvent], None]] = []
+
+    def add_listener(self, callback: Callable[[PowerEvent], None]) -> None:
+        """
+        Calls a function with every event.
+
+        Parameters
+        ----------
+        callback : Callable[[PowerEvent], None]
+            Called on the thread that passed the triggering reading.
+        """
+        self._listeners.append(callback)
+
+    def _emit(
+        self,
+        kind: str,
+        device: str,
+        power: float,
+        state: _PowerState,
+        zscore: float,
+        timestamp: float,
+    ) -> PowerEvent:
+        """
+        Creates, logs and dispatches an event.
+        """
+        event = PowerEvent(kind, device, power, state.mean, zscore, timestamp)
+        logger.warning(
+            "Power anomaly on {}: {} at {:.1f} W, expected {:.1f} W",
+            device,
+            kind,
+            power,
+            state.mean,
+        )
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception:
+                logger.exception("Anomaly listener {} failed", listener)
+        return event
+
+    def update(
+        self,
+        device: str,
+        power: float,
+        is_on: bool,
+        brightness: int,
+        timestamp: float,
+    ) -> Optional[PowerEvent]:
+        """
+        Processes one reading of a device.
+
+        Readings of one device must not be passed from several threads at
+        the same time.
+
+        Parameters
+        ----------
+        device : str
+            The device key.
+        power : float
+            The power in watts.
+        is_on : bool
+            Whether the light is on.
+        brightness : int
+            The brightness of the light in percent.
+        timestamp : float
+            The time of the reading.
+
+        Returns
+        -------
+        Optional[PowerEvent]
+            The event the reading triggered, if any.
+        """
+        state = self._states.get(device)
+        if state is None:
+            state = self._states[device] = _PowerState()
+        if is_on != state.is_on or brightness != state.brightness:
+            if not is_on:
+                state.failed = False
+            state.is_on = is_on
+            state.brightness = brightness
+            state.settle = self.settle_samples
+            state.count = state.pending = state.low = 0
+            return None
+        if state.settle:
+            state.settle -= 1
+            return None
+        if is_on and brightness > 0 and power <= self.failed_power:
+            # A failed lamp says nothing about the load, keep the average.
+            state.low += 1
+            if state.low >= self.step_samples and not state.failed:
+                state.failed = True
+                return self._emit(LAMP_FAILED, device, power, state, 0.0, timestamp)
+            return None
+        state.low = 0
+        event = None
+        if state.failed:
+            state.failed = False
+            event = self._emit(LAMP_RECOVERED, device, power, state, 0.0, timestamp)
+            state.count = 0
+        count = state.count
+        if count == 0:
+            state.mean = power
+            state.var = 0.0
+            state.count = 1
+            state.pending = 0
+            return event
+        diff = power - state.mean
+        if count >= self.warmup:
+            floor = self.min_std + self.relative_std * abs(state.mean)
+            zscore = diff / max(math.sqrt(state.var), floor)
+            if abs(zscore) > self.z_threshold:
+                # Hold outliers back until they prove to be a new level.
+                if state.pending and (
+                    state.pending_sum / state.pending > state.mean
+                ) != (diff > 0):
+                    state.pending = 0
+                if not state.pending:
+                    state.pending_sum = 0.0
+                state.pending += 1
+                state.pending_sum += power
+                if state.pending < self.step_samples:
+                    return event
+                level = state.pending_sum / state.pending
+                event = self._emit(
+                    LOAD_CHANGED, device, level, state, zscore, timestamp
+                )
+                state.mean = level
+                state.pending = 0
+                return event
+        state.pending = 0
+        # Plain averages while warming up, then exponential weights.
+        alpha = max(self.alpha, 1.0 / (count + 1))
+        increment = alpha * diff
+        state.mean += increment
+        state.var = (1.0 - alpha) * (state.var + diff * increment)
+        state.count = count + 1
+        return event
+
+    def listener(self, dimmer: Dimmer2, status: Status) -> None:
+        """
+        Processes the status of a `Dimmer2`, see `Dimmer2.add_listener`.
+
+        Parameters
+        ----------
+        dimmer : Dimmer2
+            The device.
+        status : Status
+            Its new status.
+        """
+        light = status.lights[0]
+        self.update(
+            dimmer.ip,
+            status.meters[0].power,
+            light.is_on,
+            light.brightness,
+            time.time(),
+        )
+
+    def update_samples(self, samples: Sequence[StatusSample]) -> List[PowerEvent]:
+        """
+        Processes a batch of `StatusSample` tuples, see
+        `ShardedPoller.add_listener`.
+
+        Parameters
+        ----------
+        samples : Sequence[StatusSample]
+            The samples; failed polls are skipped.
+
+        Returns
+        -------
+        List[PowerEvent]
+            The events the samples triggered.
+        """
+        events = []
+        update = self.update
+        for sample in samples:
+            if sample.ok:
+                event = update(
+                    sample.ip,
+                    sample.power,
+                    sample.is_on,
+                    sample.brightness,
+                    sample.timestamp,
+                )
+                if event is not None:
+                    events.append(event)
+        return events
+
+    def baseline(self, device: str) -> Optional[Tuple[float, float]]:
+        """
+        Returns the average power of a device and its standard deviation.
+
+        Parameters
+        ----------
+        device : str
+            The device key.
+
+        Returns
+        -------
+        Optional[Tuple[float, float]]
+            The average and standard deviation in watts, or None while no
+            reading was averaged since the last light change.
+        """
+        state = self._states.get(device)
+        if state is None or state.count == 0:
+            return None
+        return state.mean, math.sqrt(state.var)
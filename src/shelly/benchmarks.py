@@ -0,0 +1,347 @@
+"""
+Benchmarks Module.
+
+This module provides the performance baseline of the client: `Status`
+parsing, `get_status` round-trips, `change_state` latency, polling
+throughput for growing fleets, schedule evaluation and memory per managed
+device. Network benchmarks run against the local device simulator. The
+results are emitted as JSON so that releases can be compared::
+
+    python -m shelly.benchmarks --output bench.json
+"""
+
+from __future__ import annotations
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import gc
+from importlib.metadata import PackageNotFoundError, version
+import platform
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+import click
+import httpx
+import orjson
+import pendulum
+from loguru import logger
+from pendulum import WeekDay
+
+from models import Status
+from models.status import SAMPLE_STATUS
+from .dimmer2 import Dimmer2
+from .scheduling import Repeater, WeekOfMonth, When, nth_weekday_in_month
+from .simulator import SimulatedFleet, SimulatorConfig
+
+DEVICE_COUNTS = (1, 10, 100, 1000)
+
+# Polling through `Dimmer2` slower than this fraction of plain per-device
+# clients, or a fleet size slower than this fraction of the best smaller
+# one, is flagged in the results.
+POLLING_MIN_RATIO = 0.5
+
+
+def measure(fn: Callable[[], object], number: int, warmup: int = 3) -> Dict[str, float]:
+    """
+    Times individual calls of a function.
+
+    Parameters
+    ----------
+    fn : Callable[[], object]
+        The function to time.
+    number : int
+        The number of timed calls.
+    warmup : int, optional
+        The number of untimed calls made first, by default 3.
+
+    Returns
+    -------
+    Dict[str, float]
+        The call count, throughput and latency percentiles in microseconds.
+    """
+    for _ in range(warmup):
+        fn()
+    samples: List[int] = []
+    for _ in range(number):
+        start = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - start)
+    samples.sort()
+    total = sum(samples)
+    return {
+        "calls": number,
+        "ops_per_sec": number / (total / 1e9) if total else 0.0,
+        "mean_us": total / number / 1e3,
+        "min_us": samples[0] / 1e3,
+        "p50_us": samples[len(samples) // 2] / 1e3,
+        "p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))] / 1e3,
+        "max_us": samples[-1] / 1e3,
+    }
+
+
+@contextmanager
+def simulated_fleet(
+    count: int, config: Optional[SimulatorConfig] = None
+) -> Iterator[SimulatedFleet]:
+    """
+    Serves a simulated fleet from a background event loop.
+
+    Parameters
+    ----------
+    count : int
+        The number of simulated devices.
+    config : SimulatorConfig, optional
+        The network behaviour, by default no added latency.
+
+    Yields
+    ------
+    SimulatedFleet
+        The running fleet.
+    """
+    config = config or SimulatorConfig(latency=0.0, jitter=0.0, max_connections=64)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    fleet = SimulatedFleet(count, config=config)
+    asyncio.run_coroutine_threadsafe(fleet.start(), loop).result()
+    try:
+        yield fleet
+    finally:
+        asyncio.run_coroutine_threadsafe(fleet.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def bench_parse(number: int) -> Dict[str, Dict[str, float]]:
+    """
+    Benchmarks parsing the sample `Status` payload.
+    """
+    raw = orjson.dumps(SAMPLE_STATUS)
+    return {
+        "status_from_dict": measure(lambda: Status(**SAMPLE_STATUS), number),
+        "status_from_json": measure(lambda: Status.model_validate_json(raw), number),
+        "status_from_orjson": measure(lambda: Status(**orjson.loads(raw)), number),
+    }
+
+
+def bench_requests(number: int) -> Dict[str, Dict[str, float]]:
+    """
+    Benchmarks `get_status` and `change_state` round-trips to one device.
+    """
+    with simulated_fleet(1) as fleet:
+        dimmer = Dimmer2(fleet.addresses[0], autostart=False)
+        brightness = iter(range(number * 2))
+        return {
+            "get_status": measure(dimmer.get_status, number),
+            "change_state": measure(
+                lambda: dimmer.change_state(brightness=next(brightness) % 100),
+                number,
+            ),
+        }
+
+
+def _poll_rounds(
+    poll: Callable[[object], object],
+    targets: Sequence[object],
+    rounds: int,
+    workers: int,
+) -> float:
+    """
+    Polls every target once to warm up, then times ``rounds`` rounds.
+
+    Returns
+    -------
+    float
+        The seconds the timed rounds took.
+    """
+    with ThreadPoolExecutor(max_workers=min(workers, len(targets))) as executor:
+        list(executor.map(poll, targets))
+        start = time.perf_counter()
+        for _ in range(rounds):
+            list(executor.map(poll, targets))
+        return time.perf_counter() - start
+
+
+def _poll_client(client: httpx.Client) -> Status:
+    """
+    Polls a device with a plain client, the reference for `Dimmer2`.
+    """
+    response = client.get("status")
+    response.raise_for_status()
+    return Status.model_validate_json(response.content)
+
+
+def bench_polling(
+    counts: Sequence[int], rounds: int, workers: int
+) -> Dict[str, Dict[str, object]]:
+    """
+    Benchmarks polling throughput for growing numbers of devices.
+
+    Every fleet size is polled through `Dimmer2.get_status` and, as a
+    reference, through one plain ``httpx.Client`` per device. Results are
+    flagged when `Dimmer2` falls below `POLLING_MIN_RATIO` of the reference,
+    or when throughput collapses compared to the best smaller fleet.
+    """
+    results: Dict[str, Dict[str, object]] = {}
+    best = 0.0
+    for count in counts:
+        with simulated_fleet(count) as fleet:
+            dimmers = [Dimmer2(address, autostart=False) for address in fleet.addresses]
+            elapsed = _poll_rounds(Dimmer2.get_status, dimmers, rounds, workers)
+            for dimmer in dimmers:
+                dimmer.close()
+            clients = [
+                httpx.Client(base_url=f"http://{address}/", verify=False)
+                for address in fleet.addresses
+            ]
+            reference = _poll_rounds(_poll_client, clients, rounds, workers)
+            for client in clients:
+                client.close()
+        polls_per_sec = count * rounds / elapsed
+        reference_per_sec = count * rounds / reference
+        flags = []
+        if polls_per_sec < POLLING_MIN_RATIO * reference_per_sec:
+            flags.append("slower_than_per_device_clients")
+        if polls_per_sec < POLLING_MIN_RATIO * best:
+            flags.append("throughput_collapse")
+        for flag in flags:
+            logger.warning(f"Polling {count} devices: {flag}")
+        best = max(best, polls_per_sec)
+        results[str(count)] = {
+            "devices": count,
+            "rounds": rounds,
+            "polls_per_sec": polls_per_sec,
+            "round_ms": elapsed / rounds * 1e3,
+            "per_device_client_polls_per_sec": reference_per_sec,
+            "per_device_client_round_ms": reference / rounds * 1e3,
+            "flags": flags,
+        }
+    return results
+
+
+def bench_scheduling(number: int) -> Dict[str, Dict[str, float]]:
+    """
+    Benchmarks schedule evaluation.
+    """
+    start = pendulum.now().add(days=3)
+    repeater = Repeater(WeekDay.MONDAY, start=start)
+    when = When(
+        "07:00",
+        repeater=Repeater(WeekDay.MONDAY, week_of_month=WeekOfMonth.first),
+    )
+    return {
+        "repeater_next": measure(lambda: repeater.next, number),
+        "when_next_run_nth_weekday": measure(when.next_run, number),
+        "nth_weekday_in_month": measure(
+            lambda: nth_weekday_in_month(WeekDay.MONDAY, 2, 2024, WeekOfMonth.third),
+            number,
+        ),
+    }
+
+
+def bench_memory(count: int) -> Dict[str, float]:
+    """
+    Measures the memory held per managed device with a parsed status.
+    """
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    dimmers = []
+    for index in range(count):
+        dimmer = Dimmer2(f"127.0.0.1:{10000 + index}", autostart=False)
+        dimmer._status = Status(**SAMPLE_STATUS)
+        dimmers.append(dimmer)
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"devices": count, "bytes_per_device": (after - before) / count}
+
+
+def run_benchmarks(
+    number: int = 1000,
+    counts: Sequence[int] = DEVICE_COUNTS,
+    rounds: int = 3,
+    workers: int = 64,
+) -> Dict[str, object]:
+    """
+    Runs the whole benchmark suite.
+
+    Parameters
+    ----------
+    number : int, optional
+        The number of timed calls of the micro benchmarks, by default 1000.
+    counts : Sequence[int], optional
+        The fleet sizes of the polling benchmark, by default 1 to 1,000.
+    rounds : int, optional
+        The number of polling rounds per fleet size, by default 3.
+    workers : int, optional
+        The number of polling threads, by default 64.
+
+    Returns
+    -------
+    Dict[str, object]
+        The environment and results, ready to be dumped as JSON.
+    """
+    try:
+        package_version = version("shelly")
+    except PackageNotFoundError:
+        package_version = "unknown"
+    results: Dict[str, object] = {}
+    for name, run in (
+        ("parse", lambda: bench_parse(number)),
+        ("requests", lambda: bench_requests(max(1, number // 10))),
+        ("polling", lambda: bench_polling(counts, rounds, workers)),
+        ("scheduling", lambda: bench_scheduling(number)),
+        ("memory", lambda: bench_memory(max(counts))),
+    ):
+        logger.info(f"Running {name} benchmarks")
+        results[name] = run()
+    return {
+        "version": package_version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": int(time.time()),
+        "results": results,
+    }
+
+
+@click.command()
+@click.option("--output", type=click.Path(dir_okay=False), help="Write JSON here.")
+@click.option(
+    "--number", default=1000, show_default=True, help="Calls per micro benchmark."
+)
+@click.option(
+    "--devices", "counts", multiple=True, type=int, help="Fleet sizes to poll."
+)
+@click.option(
+    "--rounds", default=3, show_default=True, help="Polling rounds per fleet size."
+)
+@click.option(
+    "--with-logging", is_flag=True, help="Keep the client's log output enabled."
+)
+def main(
+    output: Optional[str],
+    number: int,
+    counts: Sequence[int],
+    rounds: int,
+    with_logging: bool,
+) -> None:
+    """
+    Runs the benchmark suite and prints or writes the JSON results.
+    """
+    if not with_logging:
+        logger.disable("shelly.dimmer2")
+    report = run_benchmarks(number, counts or DEVICE_COUNTS, rounds)
+    data = orjson.dumps(report, option=orjson.OPT_INDENT_2)
+    if output:
+        with open(output, "wb") as file:
+            file.write(data)
+    else:
+        click.echo(data.decode())
+
+
+if __name__ == "__main__":
+    main()
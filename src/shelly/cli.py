@@ -0,0 +1,410 @@
+"""
+CLI Module.
+
+This module provides the ``shelly`` command for bulk operations on many
+devices. Every subcommand runs the per-device work on a thread pool and
+prints each result as soon as it completes, so acting on a floor of devices
+takes about as long as its slowest device rather than the sum of all::
+
+    shelly set --brightness 40 --from devices.txt
+    shelly status --format jsonl 192.168.1.99 192.168.1.100
+    shelly watch --from devices.txt
+    shelly bench --requests 50 --from devices.txt
+
+Devices are given as arguments and/or read from a file with one address
+per line (``-`` reads standard input); blank lines and ``#`` comments are
+ignored. The exit status is 1 if any device failed.
+"""
+
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TextIO,
+)
+
+import click
+import httpx
+import orjson
+from loguru import logger
+
+from .benchmarks import measure
+from .dimmer2 import Dimmer2
+from .fleet import StatusSample, poll
+from .log_config import configure_logging
+
+Row = Dict[str, Any]
+
+STATUS_TEMPLATE = (
+    "{ip:<21}  {mac:<12}  {state:<3}  {brightness:>3}%  {power:>7.1f} W"
+    "  {temperature:>5.1f} °C  {rssi:>4} dBm"
+)
+SET_TEMPLATE = "{ip:<21}  ok  {ms:>7.1f} ms"
+BENCH_TEMPLATE = (
+    "{ip:<21}  {calls:>5}  p50 {p50_ms:>7.1f} ms  p99 {p99_ms:>7.1f} ms"
+    "  max {max_ms:>7.1f} ms"
+)
+
+
+def read_addresses(addresses: Sequence[str], source: Optional[TextIO]) -> List[str]:
+    """
+    Collects the device addresses of a command.
+
+    Parameters
+    ----------
+    addresses : Sequence[str]
+        The addresses given as arguments.
+    source : Optional[TextIO]
+        A file with one address per line, if any.
+
+    Returns
+    -------
+    List[str]
+        The addresses without duplicates, in the order given.
+    """
+    collected = list(addresses)
+    if source is not None:
+        for line in source:
+            address = line.partition("#")[0].strip()
+            if address:
+                collected.append(address)
+    return list(dict.fromkeys(collected))
+
+
+def run_concurrently(
+    addresses: Sequence[str], work: Callable[[str], Row], concurrency: int
+) -> Iterator[Row]:
+    """
+    Runs a function for every device and yields its results as they complete.
+
+    Parameters
+    ----------
+    addresses : Sequence[str]
+        The device addresses.
+    work : Callable[[str], Row]
+        Returns the result row of a device; it must not raise.
+    concurrency : int
+        The number of devices worked on at the same time.
+
+    Yields
+    ------
+    Row
+        The result rows, in completion order.
+    """
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(concurrency, len(addresses)))
+    ) as executor:
+        for future in as_completed(
+            [executor.submit(work, address) for address in addresses]
+        ):
+            yield future.result()
+
+
+def emit(row: Row, output: str, template: str) -> None:
+    """
+    Prints a result row as a JSON line or as a line of a table.
+    """
+    if output == "jsonl":
+        click.echo(orjson.dumps(row).decode())
+    elif row.get("error"):
+        click.echo(f"{row['ip']:<21}  error: {row['error']}")
+    else:
+        click.echo(template.format(**row))
+
+
+def status_row(sample: StatusSample) -> Row:
+    """
+    Returns the result row of a status poll.
+    """
+    row = sample._asdict()
+    row["state"] = "on" if sample.is_on else "off"
+    return row
+
+
+def devices_options(function: Callable) -> Callable:
+    """
+    Adds the device selection and concurrency options to a command.
+    """
+    for option in reversed(
+        (
+            click.argument("addresses", nargs=-1),
+            click.option(
+                "--from",
+                "source",
+                type=click.File("r"),
+                help="File with one device address per line, - for stdin.",
+            ),
+            click.option(
+                "--concurrency",
+                default=64,
+                show_default=True,
+                help="Devices worked on at once.",
+            ),
+            click.option(
+                "--timeout",
+                default=2.0,
+                show_default=True,
+                help="Request timeout in seconds.",
+            ),
+        )
+    ):
+        function = option(function)
+    return function
+
+
+def format_option(function: Callable) -> Callable:
+    """
+    Adds the output format option to a command.
+    """
+    return click.option(
+        "--format",
+        "output",
+        type=click.Choice(["table", "jsonl"]),
+        default="table",
+        show_default=True,
+        help="Print a table or one JSON object per line.",
+    )(function)
+
+
+def _devices(addresses: Sequence[str], source: Optional[TextIO]) -> List[str]:
+    """
+    Collects the device addresses of a command, failing if there are none.
+    """
+    devices = read_addresses(addresses, source)
+    if not devices:
+        raise click.UsageError("No devices given, pass addresses or --from FILE.")
+    return devices
+
+
+def _finish(rows: Iterable[Row], output: str, template: str) -> None:
+    """
+    Prints result rows as they arrive and exits with 1 if any failed.
+    """
+    failed = 0
+    for row in rows:
+        emit(row, output, template)
+        failed += not row.get("ok", True)
+    if failed:
+        sys.exit(1)
+
+
+@click.group()
+@click.option("--verbose", is_flag=True, help="Print the client's log messages.")
+@click.option(
+    "--log-dir", type=click.Path(file_okay=False), help="Also write log files here."
+)
+def main(verbose: bool, log_dir: Optional[str]) -> None:
+    """
+    Bulk operations on Shelly Dimmer2 devices.
+    """
+    try:
+        # Loguru's default sink would print every debug line of the client.
+        logger.remove(0)
+    except ValueError:
+        pass
+    configure_logging(directory=log_dir, console="INFO" if verbose else None)
+
+
+@main.command()
+@devices_options
+@format_option
+def status(
+    addresses: Sequence[str],
+    source: Optional[TextIO],
+    concurrency: int,
+    timeout: float,
+    output: str,
+) -> None:
+    """
+    Prints the status of devices.
+    """
+
+    def work(address: str) -> Row:
+        dimmer = Dimmer2(address, autostart=False, timeout=timeout)
+        try:
+            return status_row(poll(dimmer))
+        finally:
+            dimmer.close()
+
+    _finish(
+        run_concurrently(_devices(addresses, source), work, concurrency),
+        output,
+        STATUS_TEMPLATE,
+    )
+
+
+@main.command(name="set")
+@devices_options
+@format_option
+@click.option(
+    "--turn", type=click.Choice(["on", "off", "toggle"]), help="Switch the light."
+)
+@click.option(
+    "--brightness", type=click.IntRange(0, 100), help="Brightness in percent."
+)
+@click.option(
+    "--transition", type=click.IntRange(0, 5000), help="Transition in milliseconds."
+)
+def set_state(
+    addresses: Sequence[str],
+    source: Optional[TextIO],
+    concurrency: int,
+    timeout: float,
+    output: str,
+    turn: Optional[str],
+    brightness: Optional[int],
+    transition: Optional[int],
+) -> None:
+    """
+    Changes the light of devices.
+    """
+    if turn is None and brightness is None:
+        raise click.UsageError("Nothing to set, pass --turn and/or --brightness.")
+
+    def work(address: str) -> Row:
+        dimmer = Dimmer2(address, autostart=False, timeout=timeout)
+        start = time.perf_counter()
+        try:
+            dimmer.change_state(turn=turn, brightness=brightness, transition=transition)
+        except httpx.HTTPError as e:
+            return {"ip": address, "ok": False, "error": str(e) or type(e).__name__}
+        finally:
+            dimmer.close()
+        return {"ip": address, "ok": True, "ms": (time.perf_counter() - start) * 1e3}
+
+    _finish(
+        run_concurrently(_devices(addresses, source), work, concurrency),
+        output,
+        SET_TEMPLATE,
+    )
+
+
+@main.command()
+@devices_options
+@format_option
+@click.option(
+    "--interval", default=1.0, show_default=True, help="Seconds between polls."
+)
+@click.option(
+    "--count", default=0, show_default=True, help="Polling rounds, 0 for no limit."
+)
+def watch(
+    addresses: Sequence[str],
+    source: Optional[TextIO],
+    concurrency: int,
+    timeout: float,
+    output: str,
+    interval: float,
+    count: int,
+) -> None:
+    """
+    Polls devices and prints their status whenever it changes.
+    """
+    dimmers = [
+        Dimmer2(address, autostart=False, timeout=timeout)
+        for address in _devices(addresses, source)
+    ]
+    shown: Dict[str, tuple] = {}
+    rounds = 0
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(concurrency, len(dimmers)))
+    ) as executor:
+        try:
+            while not count or rounds < count:
+                started = time.monotonic()
+                for future in as_completed(
+                    [executor.submit(poll, dimmer) for dimmer in dimmers]
+                ):
+                    sample = future.result()
+                    # Whole watts, so meter noise does not count as a change.
+                    key = (
+                        sample.ok,
+                        sample.is_on,
+                        sample.brightness,
+                        round(sample.power),
+                        sample.over_power,
+                        sample.over_temperature,
+                        sample.load_error,
+                    )
+                    if shown.get(sample.ip) != key:
+                        shown[sample.ip] = key
+                        emit(status_row(sample), output, STATUS_TEMPLATE)
+                rounds += 1
+                if not count or rounds < count:
+                    time.sleep(max(0.0, interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for dimmer in dimmers:
+                dimmer.close()
+
+
+@main.command()
+@devices_options
+@format_option
+@click.option(
+    "--requests", default=20, show_default=True, help="Status requests per device."
+)
+def bench(
+    addresses: Sequence[str],
+    source: Optional[TextIO],
+    concurrency: int,
+    timeout: float,
+    output: str,
+    requests: int,
+) -> None:
+    """
+    Measures the status request latency of devices under concurrent load.
+    """
+    devices = _devices(addresses, source)
+
+    def work(address: str) -> Row:
+        dimmer = Dimmer2(address, autostart=False, timeout=timeout)
+
+        def request() -> None:
+            dimmer._request("GET", "status").raise_for_status()
+
+        try:
+            result = measure(request, requests, warmup=1)
+        except httpx.HTTPError as e:
+            return {"ip": address, "ok": False, "error": str(e) or type(e).__name__}
+        finally:
+            dimmer.close()
+        return {
+            "ip": address,
+            "ok": True,
+            "calls": result["calls"],
+            "p50_ms": result["p50_us"] / 1e3,
+            "p99_ms": result["p99_us"] / 1e3,
+            "max_ms": result["max_us"] / 1e3,
+        }
+
+    started = time.perf_counter()
+    rows: List[Row] = []
+    try:
+        for row in run_concurrently(devices, work, concurrency):
+            rows.append(row)
+            emit(row, output, BENCH_TEMPLATE)
+    finally:
+        elapsed = time.perf_counter() - started
+        calls = sum(row.get("calls", 0) for row in rows)
+        click.echo(
+            f"{len(rows)} devices, {calls} requests in {elapsed:.2f}s"
+            f" ({calls / elapsed:.0f} req/s)",
+            err=True,
+        )
+    if any(not row["ok"] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
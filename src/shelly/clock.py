@@ -0,0 +1,222 @@
+"""
+Clock Module.
+
+This module provides the clocks the scheduling code reads time from. A
+`SystemClock` reads the wall clock, a `VirtualClock` only moves when told
+to and can fast-forward through months of schedules in seconds. Both can
+freeze the time for the duration of a scheduler tick so that every rule
+evaluated in that tick sees the same, single time read.
+"""
+
+from __future__ import annotations
+import abc
+from contextlib import contextmanager
+import threading
+from typing import Iterator, Optional, Union
+
+import pendulum
+from pendulum import Duration, FixedTimezone, Timezone
+from pendulum.datetime import DateTime
+
+
+class Clock(abc.ABC):
+    """
+    Base class of the clocks used by the scheduling code.
+
+    Attributes
+    ----------
+    tz : Timezone or FixedTimezone
+        The timezone of the returned times.
+
+    Methods
+    -------
+    now() -> DateTime
+        Returns the current time, or the tick time inside `tick()`.
+    today() -> DateTime
+        Returns the start of the current day.
+    tick()
+        Freezes `now()` for the duration of a scheduler iteration.
+    wait(event, timeout) -> bool
+        Waits for an event or until the timeout elapses.
+    """
+
+    def __init__(self, tz: Optional[Union[Timezone, FixedTimezone]] = None) -> None:
+        """
+        Initializes the Clock instance.
+
+        Parameters
+        ----------
+        tz : Timezone or FixedTimezone, optional
+            The timezone of the returned times, by default the local timezone.
+        """
+        if tz is None:
+            tz = pendulum.local_timezone()
+            if not isinstance(tz, Timezone):
+                tz = pendulum.UTC
+        self.tz = tz
+        self._local = threading.local()
+
+    @abc.abstractmethod
+    def _read(self) -> DateTime:
+        """
+        Reads the underlying time source.
+        """
+
+    def now(self) -> DateTime:
+        """
+        Returns the current time.
+
+        Returns
+        -------
+        DateTime
+            The tick time when called inside `tick()`, otherwise a fresh read.
+        """
+        frozen = getattr(self._local, "frozen", None)
+        if frozen is not None:
+            return frozen
+        return self._read()
+
+    def today(self) -> DateTime:
+        """
+        Returns the start of the current day.
+
+        Returns
+        -------
+        DateTime
+            Midnight of the current day.
+        """
+        return self.now().start_of("day")
+
+    @contextmanager
+    def tick(self) -> Iterator[DateTime]:
+        """
+        Freezes `now()` for the current thread until the block exits.
+
+        Nested ticks keep the time of the outermost tick.
+
+        Yields
+        ------
+        DateTime
+            The tick time.
+        """
+        frozen = getattr(self._local, "frozen", None)
+        if frozen is not None:
+            yield frozen
+            return
+        self._local.frozen = self._read()
+        try:
+            yield self._local.frozen
+        finally:
+            self._local.frozen = None
+
+    def wait(self, event: threading.Event, timeout: float) -> bool:
+        """
+        Waits for an event or until the timeout elapses.
+
+        Parameters
+        ----------
+        event : threading.Event
+            The event to wait for.
+        timeout : float
+            The maximum time to wait in seconds.
+
+        Returns
+        -------
+        bool
+            True if the event is set.
+        """
+        return event.wait(timeout)
+
+
+class SystemClock(Clock):
+    """
+    A clock reading the wall clock.
+    """
+
+    def _read(self) -> DateTime:
+        return pendulum.now(tz=self.tz)
+
+
+class VirtualClock(Clock):
+    """
+    A clock that only moves when advanced, for simulations and load tests.
+
+    Methods
+    -------
+    set(moment)
+        Moves the clock to a given moment.
+    advance(delta)
+        Moves the clock forward.
+    """
+
+    def __init__(
+        self,
+        start: Optional[DateTime] = None,
+        tz: Optional[Union[Timezone, FixedTimezone]] = None,
+    ) -> None:
+        """
+        Initializes the VirtualClock instance.
+
+        Parameters
+        ----------
+        start : DateTime, optional
+            The initial time, by default the current wall clock time.
+        tz : Timezone or FixedTimezone, optional
+            The timezone of the returned times, by default the local timezone.
+        """
+        super().__init__(tz)
+        self._lock = threading.Lock()
+        self._now: DateTime = (start or pendulum.now()).in_timezone(self.tz)
+
+    def _read(self) -> DateTime:
+        return self._now
+
+    def set(self, moment: DateTime) -> None:
+        """
+        Moves the clock to a given moment.
+
+        Parameters
+        ----------
+        moment : DateTime
+            The new time; moving backwards is not allowed.
+
+        Raises
+        ------
+        ValueError
+            If the moment is before the current time.
+        """
+        with self._lock:
+            if moment < self._now:
+                raise ValueError(f"Cannot move clock back to {moment}")
+            self._now = moment.in_timezone(self.tz)
+
+    def advance(self, delta: Union[Duration, float]) -> DateTime:
+        """
+        Moves the clock forward.
+
+        Parameters
+        ----------
+        delta : Union[Duration, float]
+            The duration, or a number of seconds.
+
+        Returns
+        -------
+        DateTime
+            The new time.
+        """
+        if not isinstance(delta, Duration):
+            delta = pendulum.duration(seconds=delta)
+        with self._lock:
+            self._now = self._now + delta
+            return self._now
+
+    def wait(self, event: threading.Event, timeout: float) -> bool:
+        """
+        Advances the clock by the timeout unless the event is already set.
+        """
+        if not event.is_set():
+            self.advance(timeout)
+        return event.is_set()
+
+
+system_clock = SystemClock()
@@ -0,0 +1,204 @@
+"""
+Device Schedule Module.
+
+This module compiles `ScheduledEvent`s into the weekly schedule rules that
+Shelly Gen1 devices run on their own (``schedule_rules`` in
+``/settings/light/0``) and pushes them to the devices in bulk. Only plain
+weekday schedules can be expressed as device rules; nth-weekday,
+day-of-month and interval schedules, and any rule that fails to push, are
+left to the host-side `Scheduler`.
+
+A rule holds the wall-clock time of its event in the host timezone
+(`When.tz`), but the device runs it in the timezone configured on the
+device, so both must agree or the rules fire shifted by the difference.
+"""
+
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+import httpx
+from loguru import logger
+from pendulum.datetime import DateTime
+from pendulum.day import WeekDay as PDWeekDay
+
+from .dimmer2 import Dimmer2
+from .scheduler import Scheduler
+from .scheduling import Repeater, ScheduledEvent
+
+MAX_RULES = 20  # conservative per-device limit of Gen1 firmware
+
+
+@dataclass
+class CompiledSchedules:
+    """
+    The result of compiling scheduled events into device rules.
+
+    Attributes
+    ----------
+    rules : Dict[str, List[str]]
+        The device rules, keyed by the IP address of the device.
+    devices : Dict[str, Dimmer2]
+        The devices the rules belong to, keyed by IP address.
+    events : Dict[str, List[ScheduledEvent]]
+        The events covered by the rules of each device.
+    host : List[ScheduledEvent]
+        The events the devices cannot express, to run on the host.
+    """
+
+    rules: Dict[str, List[str]] = field(default_factory=dict)
+    devices: Dict[str, Dimmer2] = field(default_factory=dict)
+    events: Dict[str, List[ScheduledEvent]] = field(default_factory=dict)
+    host: List[ScheduledEvent] = field(default_factory=list)
+
+
+def device_rule_key(
+    event: ScheduledEvent, now_: DateTime
+) -> Optional[Tuple[str, PDWeekDay, str]]:
+    """
+    Returns the ``(HHMM, weekday, action)`` of an event a device can run.
+
+    Parameters
+    ----------
+    event : ScheduledEvent
+        The event to check.
+    now_ : DateTime
+        The current time; events that have not started yet are not eligible.
+
+    Returns
+    -------
+    Optional[Tuple[str, PDWeekDay, str]]
+        The rule parts, or None if the event has to run on the host.
+    """
+    when, repeater = event.when, event.when.repeater
+    if not isinstance(repeater, Repeater) or not repeater.by_weekday:
+        return None
+    if when.end is not None or repeater.expires is not None:
+        return None
+    if when.start > now_ or (repeater.start is not None and repeater.start > now_):
+        return None
+    if when.time.second:
+        return None
+    command = event.command
+    if set(command) != {"turn"} or command["turn"] not in ("on", "off"):
+        return None
+    assert isinstance(repeater.interval, PDWeekDay)
+    hhmm = f"{when.time.hour:02d}{when.time.minute:02d}"
+    return hhmm, repeater.interval, str(command["turn"])
+
+
+def compile_schedules(
+    events: List[ScheduledEvent], now_: Optional[DateTime] = None
+) -> CompiledSchedules:
+    """
+    Compiles scheduled events into device schedule rules.
+
+    Events with the same device, time and action are merged into one rule
+    covering all their weekdays, numbered from Monday as 0, e.g.
+    ``0700-01234-on``. The time is taken in the host timezone and run in
+    the device timezone. Beyond `MAX_RULES` rules per device, the events
+    of the remaining rules are left to the host.
+
+    Parameters
+    ----------
+    events : List[ScheduledEvent]
+        The events to compile.
+    now_ : DateTime, optional
+        The current time, by default read from the clock of each event.
+
+    Returns
+    -------
+    CompiledSchedules
+        The device rules and the events left to the host.
+    """
+    compiled = CompiledSchedules()
+    days: Dict[str, Dict[Tuple[str, str], Set[int]]] = {}
+    covered: Dict[str, Dict[Tuple[str, str], List[ScheduledEvent]]] = {}
+    for event in events:
+        key = device_rule_key(event, now_ or event.when.clock.now())
+        if key is None:
+            compiled.host.append(event)
+            continue
+        hhmm, weekday, action = key
+        ip = event.dimmer.ip
+        compiled.devices[ip] = event.dimmer
+        days.setdefault(ip, {}).setdefault((hhmm, action), set()).add(int(weekday))
+        covered.setdefault(ip, {}).setdefault((hhmm, action), []).append(event)
+
+    for ip, rules in days.items():
+        ordered = sorted(rules.items())
+        for (hhmm, action), weekdays in ordered[:MAX_RULES]:
+            digits = "".join(str(day) for day in sorted(weekdays))
+            compiled.rules.setdefault(ip, []).append(f"{hhmm}-{digits}-{action}")
+            compiled.events.setdefault(ip, []).extend(covered[ip][(hhmm, action)])
+        for rule_key, _ in ordered[MAX_RULES:]:
+            compiled.host.extend(covered[ip][rule_key])
+    return compiled
+
+
+def push_schedules(
+    compiled: CompiledSchedules, max_workers: int = 32
+) -> Dict[str, bool]:
+    """
+    Pushes the compiled rules to their devices in parallel.
+
+    The rules replace any schedule rules already on the device.
+
+    Parameters
+    ----------
+    compiled : CompiledSchedules
+        The compiled rules.
+    max_workers : int, optional
+        The maximum number of devices updated in parallel, by default 32.
+
+    Returns
+    -------
+    Dict[str, bool]
+        Whether the push succeeded, keyed by device IP address.
+    """
+
+    def push(ip: str) -> bool:
+        try:
+            compiled.devices[ip].set_schedule_rules(compiled.rules[ip])
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to push schedule rules to {ip}: {e}")
+            return False
+        return True
+
+    ips = list(compiled.rules)
+    if not ips:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(ips))) as executor:
+        return dict(zip(ips, executor.map(push, ips)))
+
+
+def deploy_schedules(
+    events: List[ScheduledEvent], scheduler: Scheduler
+) -> CompiledSchedules:
+    """
+    Runs events on the devices where possible and on the host otherwise.
+
+    Events that cannot be compiled, or whose device rejected the push, are
+    added to ``scheduler``.
+
+    Parameters
+    ----------
+    events : List[ScheduledEvent]
+        The events to deploy.
+    scheduler : Scheduler
+        The host-side scheduler used as fallback.
+
+    Returns
+    -------
+    CompiledSchedules
+        The compiled rules and the events left to the host.
+    """
+    compiled = compile_schedules(events, scheduler.clock.now())
+    for ip, pushed in push_schedules(compiled, scheduler.max_workers).items():
+        if not pushed:
+            compiled.host.extend(compiled.events.pop(ip))
+            del compiled.rules[ip]
+    for event in compiled.host:
+        scheduler.schedule(event)
+    return compiled
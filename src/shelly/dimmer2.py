@@ -8,32 +8,47 @@ periodically update the device status.
 """
 
 from __future__ import annotations
-from pathlib import Path
+import os
+import ssl
 import threading
 import time
-from typing import Optional
+from typing import Callable, List, Optional
 
 import httpx
 from loguru import logger
 from paho.mqtt.client import Client
 from paho.mqtt.enums import CallbackAPIVersion  # type: ignore
 
-from models import LightStatus, Status
+from models import LightStatus, Settings, Status
+from .health import BreakerState, CircuitBreaker, CircuitOpenError
+from .log_config import ChangeSampler, ensure_logging
+from .metrics import DeviceMetrics
+from .mqtt_commands import CommandError, MQTTCommandTransport
+from .request_queue import Priority, RequestQueue
+from .state_cache import StateCache
 
-log_dir = Path(__file__).parents[2] / "logs"
-logger.level("STATUS", no=15, color="<blue>")
-logger.add(
-    log_dir / "dimmer2.log",
-    rotation="10MB",
-    level="DEBUG",
-)
-logger.level("POWER", no=25, color="<yellow>")
-logger.add(
-    sink=log_dir / "dimmer_power.log",
-    rotation="20MB",
-    retention=20,
-    level="POWER",
-)
+_ssl_context: Optional[ssl.SSLContext] = None
+_ssl_context_lock = threading.Lock()
+
+
+def ssl_context() -> ssl.SSLContext:
+    """
+    Returns the SSL context shared by the HTTP clients of all devices.
+
+    Building the default context loads the CA bundle and takes tens of
+    milliseconds, far longer than creating the rest of a client, so the
+    clients of a fleet share one.
+
+    Returns
+    -------
+    ssl.SSLContext
+        The shared context.
+    """
+    global _ssl_context
+    with _ssl_context_lock:
+        if _ssl_context is None:
+            _ssl_context = httpx.create_ssl_context()
+        return _ssl_context
 
 
 def time_ms() -> float:
@@ -63,6 +78,11 @@ class LightControl:
     url : str
         The URL for sending commands to the light control of the Dimmer2
         device.
+    transport : Optional[MQTTCommandTransport]
+        The MQTT transport used for state changes, if any; HTTP is used
+        without one and whenever it fails.
+    mqtt_id : Optional[str]
+        The MQTT id of the device, by default derived from its MAC address.
     """
 
     brightness_increment = 10
@@ -79,6 +99,8 @@ class LightControl:
         self.ip: str = dimmer.ip
         self.url: str = f"http://{self.ip}/light/0"
         self.dimmer: Dimmer2 = dimmer
+        self.transport: Optional[MQTTCommandTransport] = None
+        self.mqtt_id: Optional[str] = None
 
     def __bool__(self) -> bool:
         """
@@ -152,7 +174,10 @@ class LightControl:
         self.change_state(turn=turn, brightness=brightness, transition=transition)
 
     def on(
-        self, brightness: Optional[int] = None, transition: Optional[int] = None
+        self,
+        brightness: Optional[int] = None,
+        transition: Optional[int] = None,
+        auto_off: Optional[int] = None,
     ) -> None:
         """
         Turns the light on.
@@ -163,12 +188,20 @@ class LightControl:
             The brightness level to set, by default None.
         transition : Optional[int], optional
             The transition time, by default None.
+        auto_off : Optional[int], optional
+            Seconds after which the device turns the light off again by
+            itself, by default None.
         """
         turn = "on"
-        self.change_state(turn=turn, brightness=brightness, transition=transition)
+        self.change_state(
+            turn=turn, brightness=brightness, transition=transition, timer=auto_off
+        )
 
     def off(
-        self, brightness: Optional[int] = None, transition: Optional[int] = None
+        self,
+        brightness: Optional[int] = None,
+        transition: Optional[int] = None,
+        auto_on: Optional[int] = None,
     ) -> None:
         """
         Turns the light off.
@@ -179,15 +212,21 @@ class LightControl:
             The brightness level to set, by default None.
         transition : Optional[int], optional
             The transition time, by default None.
+        auto_on : Optional[int], optional
+            Seconds after which the device turns the light on again by
+            itself, by default None.
         """
         turn = "off"
-        self.change_state(turn=turn, brightness=brightness, transition=transition)
+        self.change_state(
+            turn=turn, brightness=brightness, transition=transition, timer=auto_on
+        )
 
     def change_state(
         self,
         turn: Optional[str] = None,
         brightness: Optional[int] = None,
         transition: Optional[int] = None,
+        timer: Optional[int] = None,
     ) -> None:
         """
         Changes the state of the light.
@@ -200,15 +239,72 @@ class LightControl:
             The brightness level to set, by default None.
         transition : Optional[int], optional
             The transition time, by default None.
-        """
-        payload = {"turn": turn, "transition": transition, "brightness": brightness}
-        logger.log("STATUS", f"Changing state: {payload}")
+        timer : Optional[int], optional
+            A device-side flip-back timer in seconds: the device reverts the
+            turn action by itself once it elapses, by default None.
+        """
+        payload = {
+            "turn": turn,
+            "transition": transition,
+            "brightness": brightness,
+            "timer": timer,
+        }
+        logger.log("STATUS", "Changing state: {}", payload)
 
         payload = {k: v for k, v in payload.items() if v is not None}
-        httpx.put(
-            url=self.url,
-            params=payload,
+        # The JSON set command of Gen1 devices has no flip-back timer, and a
+        # toggle cannot be repeated over HTTP if only its acknowledgement
+        # got lost.
+        if (
+            self.transport is not None
+            and "timer" not in payload
+            and payload.get("turn") != "toggle"
+        ):
+            try:
+                self._send_mqtt(payload)
+                return
+            except CommandError as e:
+                logger.warning("MQTT command to {} failed, using HTTP: {}", self.ip, e)
+        self.dimmer._request(
+            "PUT", "light/0", params=payload, priority=Priority.command
+        ).raise_for_status()
+
+    def _send_mqtt(self, payload: dict) -> None:
+        """
+        Sends a state change over MQTT and applies the acknowledged state.
+        """
+        assert self.transport is not None
+        mqtt_id = self.mqtt_id
+        if mqtt_id is None:
+            if self.dimmer.cached_status is None:
+                raise CommandError("MQTT id unknown until the status was fetched")
+            mqtt_id = f"shellydimmer2-{self.dimmer.cached_status.mac}"
+        start = time.perf_counter_ns()
+        state = self.transport.send(mqtt_id, payload)
+        self.dimmer._metrics.observe("mqtt/light/0/set", time.perf_counter_ns() - start)
+        self.dimmer._apply_light_state(state)
+
+    def set_schedule_rules(self, rules: List[str], enabled: bool = True) -> None:
+        """
+        Replaces the weekly schedule rules run by the device itself.
+
+        Parameters
+        ----------
+        rules : List[str]
+            The rules in Shelly format, e.g. ``"0700-01234-on"``.
+        enabled : bool, optional
+            Whether the device schedule is enabled, by default True.
+        """
+        params = {
+            "schedule": str(enabled).lower(),
+            "schedule_rules": ",".join(rules),
+        }
+        logger.log("STATUS", "Setting schedule rules: {}", params)
+        response = self.dimmer._request(
+            "GET", "settings/light/0", params=params, priority=Priority.command
         )
+        self.dimmer.invalidate_settings()
+        response.raise_for_status()
 
 
 class Dimmer2:
@@ -225,6 +321,21 @@ class Dimmer2:
         The MQTT client for communication.
     http_refresh : int
         The interval in milliseconds for refreshing the device status.
+    timeout : float
+        The timeout in seconds of requests to the device.
+    probe_timeout : float
+        The timeout in seconds of the liveness probe sent before the first
+        request once an unreachable device's backoff has elapsed.
+    log_interval : float
+        The seconds after which an unchanged status payload and power
+        reading are logged again; changes are always logged, 0 logs every
+        poll.
+    max_in_flight : int
+        The maximum number of requests sent to the device at the same time;
+        further requests wait in a `RequestQueue`.
+    state_cache : Optional[StateCache]
+        Where the last status is persisted and loaded from at construction,
+        shared by all devices if set on the class.
     _status : Optional[Status]
         The current status of the device.
 
@@ -234,16 +345,56 @@ class Dimmer2:
         Fetches and updates the status of the device from the network.
     get(endpoint: str) -> str
         Fetches data from a specific endpoint of the device.
+    settings -> Settings
+        Returns the device settings, fetched only when they changed.
+    invalidate_settings()
+        Forces the next access of `settings` to fetch them again.
+    metrics() -> dict
+        Returns a snapshot of the request metrics of the device.
+    health() -> dict
+        Returns the circuit breaker and request queue state of the device.
+    use_mqtt(transport, mqtt_id)
+        Sends state changes over MQTT, falling back to HTTP.
+    add_listener(callback)
+        Calls a function with every newly fetched status.
+    remove_listener(callback)
+        Stops calling a function added with `add_listener`.
+    start_status_loop()
+        Starts the background status update loop.
     stop_status_loop()
         Stops the background status update loop.
+    close()
+        Stops the status loop and closes the connections to the device.
+    is_stale -> bool
+        Whether the status was loaded from the state cache and not fetched.
+    status_age -> Optional[float]
+        Returns the seconds since the status was fetched.
+    poll_error -> Optional[str]
+        Returns why the last status refresh failed.
 
 
     """
 
     _status: Optional[Status] = None
     http_refresh: int = 1000  # in milliseconds
-
-    def __init__(self, device_ip: str = "192.168.1.99") -> None:
+    timeout: float = 2.0  # in seconds
+    probe_timeout: float = 0.5  # in seconds
+    log_interval: float = 60.0  # in seconds
+    max_in_flight: int = 1  # concurrent requests per device
+    state_cache: Optional[StateCache] = None
+    _status_at: Optional[float] = None
+    _stale: bool = False
+    _poll_error: Optional[str] = None
+    _http_client: Optional[httpx.Client] = None
+    _http_client_pid: int = 0
+
+    def __init__(
+        self,
+        device_ip: str = "192.168.1.99",
+        autostart: bool = True,
+        timeout: Optional[float] = None,
+        state_cache: Optional[StateCache] = None,
+    ) -> None:
         """
         Initializes the Dimmer2 instance.
 
@@ -251,14 +402,41 @@ class Dimmer2:
         ----------
         device_ip : str, optional
             The IP address of the device, by default "192.168.1.99".
+        autostart : bool, optional
+            Whether to start the background status update loop right away,
+            by default True.
+        timeout : Optional[float], optional
+            The timeout in seconds of requests to the device, by default
+            `Dimmer2.timeout`.
+        state_cache : Optional[StateCache], optional
+            Serves the last persisted status until the first poll succeeds
+            and persists new ones, by default `Dimmer2.state_cache`.
         """
         self.ip = device_ip
         self.url = f"http://{device_ip}/"
+        if timeout is not None:
+            self.timeout = timeout
+        self._metrics = DeviceMetrics()
+        self._breaker = CircuitBreaker()
+        self._queue = RequestQueue(self.max_in_flight)
+        self._payload_sampler = ChangeSampler(self.log_interval)
+        self._power_sampler = ChangeSampler(self.log_interval)
+        self._listeners: List[Callable[[Dimmer2, Status], None]] = []
+        self._settings: Optional[Settings] = None
+        self._settings_count: Optional[int] = None
+        self._settings_lock = threading.Lock()
+        self._http_client_lock = threading.Lock()
+        ensure_logging()
+        if state_cache is not None:
+            self.state_cache = state_cache
+        if self.state_cache is not None:
+            self._warm_start(self.state_cache)
         self._light_control = LightControl(self)
         self.mqtt = Client(CallbackAPIVersion.VERSION1)
         self._stop_event = threading.Event()
-        self._status_thread = threading.Thread(target=self._status_loop, daemon=True)
-        self._status_thread.start()
+        self._status_thread: Optional[threading.Thread] = None
+        if autostart:
+            self.start_status_loop()
 
     @property
     def device_id(self) -> str:
@@ -292,14 +470,143 @@ class Dimmer2:
         """
         Fetches and updates the status of the device from the network.
         """
-        logger.debug(f"Refreshing status for {self.device_id}")
+        logger.trace("Refreshing status for {}", self.device_id)
         try:
-            response = httpx.get(f"{self.url}status")
-            logger.debug(f"Response: {response.json()}")
-            self._status = Status(**response.json())
-            logger.log("POWER", f"Watts: {self._status.meters[0].power}")
+            response = self._request("GET", "status", priority=Priority.poll)
+            response.raise_for_status()
+            status = Status.model_validate_json(response.content)
+        except CircuitOpenError as e:
+            self._poll_error = f"{type(e).__name__}: {e}"
+            logger.debug("Skipped status refresh: {}", e)
+            return
         except httpx.HTTPError as e:
-            logger.error(f"Failed to get status: {e}")
+            self._poll_error = f"{type(e).__name__}: {e}"
+            logger.error("Failed to get status: {}", e)
+            return
+        except ValueError as e:
+            self._poll_error = f"{type(e).__name__}: {e}"
+            self._metrics.increment("parse_errors")
+            logger.error("Failed to parse status: {}", e)
+            return
+        self._poll_error = None
+        self._status = status
+        self._status_at = time.time()
+        self._stale = False
+        # Uptime and clocks change on every poll, compare what matters.
+        if self._payload_sampler(
+            (
+                status.lights,
+                status.meters[0].power,
+                status.inputs,
+                status.temperature,
+                status.over_temperature,
+                status.over_power,
+                status.load_error,
+            )
+        ):
+            logger.opt(lazy=True).debug("Response: {}", lambda: response.text)
+        power = status.meters[0].power
+        if self._power_sampler(power):
+            logger.log("POWER", "Watts: {}", power)
+        for listener in self._listeners:
+            try:
+                listener(self, status)
+            except Exception:
+                logger.exception("Status listener {} failed", listener)
+
+    @property
+    def settings(self) -> Settings:
+        """
+        Gets the device settings, fetching them only when they changed.
+
+        The settings are cached together with the configuration change
+        counter of the last polled status (``cfg_changed_cnt``) and fetched
+        again once a poll reports a different counter.
+
+        Returns
+        -------
+        Settings
+            The settings of the device.
+
+        Raises
+        ------
+        httpx.HTTPError
+            If the settings have to be fetched and the request fails.
+        """
+        with self._settings_lock:
+            count = None if self._status is None else self._status.config_change_count
+            if self._settings is None or count != self._settings_count:
+                response = self._request("GET", "settings")
+                response.raise_for_status()
+                try:
+                    self._settings = Settings.model_validate_json(response.content)
+                except ValueError:
+                    self._metrics.increment("parse_errors")
+                    raise
+                self._settings_count = count
+            return self._settings
+
+    def invalidate_settings(self) -> None:
+        """
+        Forces the next access of `settings` to fetch them again.
+        """
+        with self._settings_lock:
+            self._settings = None
+
+    def use_mqtt(
+        self, transport: Optional[MQTTCommandTransport], mqtt_id: Optional[str] = None
+    ) -> None:
+        """
+        Sends state changes over MQTT, falling back to HTTP.
+
+        Parameters
+        ----------
+        transport : Optional[MQTTCommandTransport]
+            The transport, or None to use HTTP only.
+        mqtt_id : Optional[str], optional
+            The MQTT id of the device, by default ``shellydimmer2-<MAC>``.
+        """
+        self._light_control.transport = transport
+        self._light_control.mqtt_id = mqtt_id
+
+    def _apply_light_state(self, state: dict) -> None:
+        """
+        Updates the cached light status with an acknowledged light state.
+        """
+        status = self._status
+        if status is None:
+            return
+        try:
+            light = LightStatus.model_validate(state)
+        except ValueError:
+            return
+        self._status = status.model_copy(update={"lights": [light, *status.lights[1:]]})
+
+    def add_listener(self, callback: Callable[[Dimmer2, Status], None]) -> None:
+        """
+        Calls a function with every newly fetched status.
+
+        The function runs on the polling thread, right after the status was
+        fetched, and should return quickly.
+
+        Parameters
+        ----------
+        callback : Callable[[Dimmer2, Status], None]
+            The function, called with the device and its new status.
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[Dimmer2, Status], None]) -> None:
+        """
+        Stops calling a function added with `add_listener`.
+
+        Parameters
+        ----------
+        callback : Callable[[Dimmer2, Status], None]
+            The function.
+        """
+        if callback in self._listeners:
+            self._listeners.remove(callback)
 
     def get(self, endpoint: str) -> str:
         """
@@ -315,9 +622,238 @@ class Dimmer2:
         str
             The response from the device as a string.
         """
-        response = httpx.get(self.url + endpoint)
+        response = self._request("GET", endpoint)
         return response.text
 
+    def _request(
+        self,
+        method: str,
+        endpoint: str,
+        params: Optional[dict] = None,
+        priority: Priority = Priority.query,
+    ) -> httpx.Response:
+        """
+        Sends a request to the device unless its circuit breaker is open.
+
+        Requests wait in the queue of the device for a free slot, commands
+        before queries before polls, and a poll of an endpoint that is
+        already queued shares the response of the queued one.
+
+        Transport errors, such as timeouts and refused connections, count as
+        failures of the device. While the breaker is open requests fail
+        immediately with `CircuitOpenError`; once the backoff has elapsed a
+        cheap ``/shelly`` probe is sent before the request.
+
+        Parameters
+        ----------
+        method : str
+            The HTTP method.
+        endpoint : str
+            The endpoint, relative to the device URL.
+        params : Optional[dict], optional
+            The query parameters, by default None.
+        priority : Priority, optional
+            The priority of the request, by default `Priority.query`.
+
+        Returns
+        -------
+        httpx.Response
+            The response of the device.
+
+        Raises
+        ------
+        CircuitOpenError
+            If the device is considered unreachable.
+        """
+        if not self._breaker.allow():
+            self._metrics.increment("short_circuits")
+            raise CircuitOpenError(
+                f"{self.ip} is unreachable, next probe in {self._breaker.retry_in:.1f}s"
+            )
+        key = (method, endpoint) if priority is Priority.poll and not params else None
+        return self._queue.run(
+            lambda: self._send_request(method, endpoint, params), priority, key
+        )
+
+    def _send_request(
+        self, method: str, endpoint: str, params: Optional[dict]
+    ) -> httpx.Response:
+        """
+        Sends a request once it is its turn and records the outcome.
+        """
+        if self._breaker.state is BreakerState.open:
+            # A request in flight failed while this one was waiting.
+            self._metrics.increment("short_circuits")
+            raise CircuitOpenError(
+                f"{self.ip} is unreachable, next probe in {self._breaker.retry_in:.1f}s"
+            )
+        try:
+            if self._breaker.state is BreakerState.half_open:
+                self._timed_request("GET", "shelly", None, self.probe_timeout)
+            response = self._timed_request(method, endpoint, params, self.timeout)
+        except Exception as e:
+            # Any error ends a probe, or the breaker would stay half-open.
+            self._breaker.record_failure(e)
+            raise
+        except BaseException:
+            self._breaker.release()
+            raise
+        self._breaker.record_success()
+        return response
+
+    def _client(self) -> httpx.Client:
+        """
+        Returns the HTTP client of the device, created on first use.
+
+        Every device has its own small connection pool, sized to the
+        requests it may have in flight, which keeps its connections alive
+        between polls. One pool shared by a whole fleet serializes requests
+        to different devices on its internal lock and gets slower the more
+        devices are polled. A forked child process gets a client of its own.
+        """
+        client = self._http_client
+        if client is not None and self._http_client_pid == os.getpid():
+            return client
+        with self._http_client_lock:
+            if self._http_client is None or self._http_client_pid != os.getpid():
+                self._http_client_pid = os.getpid()
+                self._http_client = httpx.Client(
+                    verify=ssl_context(),
+                    limits=httpx.Limits(
+                        max_connections=self.max_in_flight,
+                        max_keepalive_connections=self.max_in_flight,
+                    ),
+                )
+            return self._http_client
+
+    def close(self) -> None:
+        """
+        Stops the status loop and closes the connections to the device.
+        """
+        self.stop_status_loop()
+        with self._http_client_lock:
+            client, self._http_client = self._http_client, None
+        if client is not None and self._http_client_pid == os.getpid():
+            client.close()
+
+    def _timed_request(
+        self, method: str, endpoint: str, params: Optional[dict], timeout: float
+    ) -> httpx.Response:
+        """
+        Sends a request to the device and records its latency and outcome.
+        """
+        start = time.perf_counter_ns()
+        try:
+            response = self._client().request(
+                method, self.url + endpoint, params=params, timeout=timeout
+            )
+        except httpx.TimeoutException:
+            self._metrics.increment("timeouts")
+            raise
+        except httpx.HTTPError:
+            self._metrics.increment("http_errors")
+            raise
+        self._metrics.observe(
+            endpoint.partition("?")[0],
+            time.perf_counter_ns() - start,
+            len(response.content),
+        )
+        if response.is_error:
+            self._metrics.increment("http_errors")
+        return response
+
+    def metrics(self) -> dict:
+        """
+        Returns a snapshot of the request metrics of the device.
+
+        Returns
+        -------
+        dict
+            The request, timeout, HTTP error, parse error, short circuit and
+            received byte counters, and per endpoint the latency summary in
+            microseconds.
+        """
+        return {"device": self.ip, **self._metrics.snapshot()}
+
+    def health(self) -> dict:
+        """
+        Returns the circuit breaker and request queue state of the device.
+
+        Returns
+        -------
+        dict
+            The state ("closed", "open" or "half_open"), the number of
+            consecutive failures, the seconds until the next probe, the
+            last failure and the queued, in-flight and merged requests.
+        """
+        return {"device": self.ip, **self._breaker.snapshot(), **self._queue.snapshot()}
+
+    @property
+    def cached_status(self) -> Optional[Status]:
+        """
+        Gets the last fetched status without contacting the device.
+
+        Returns
+        -------
+        Optional[Status]
+            The last fetched status, the status loaded from the state cache
+            if none was fetched yet (see `is_stale`), or None.
+        """
+        return self._status
+
+    @property
+    def is_stale(self) -> bool:
+        """
+        Whether the status was loaded from the state cache and not fetched.
+
+        Returns
+        -------
+        bool
+            True until the first poll after a warm start succeeds.
+        """
+        return self._stale
+
+    @property
+    def poll_error(self) -> Optional[str]:
+        """
+        Gets why the last status refresh failed.
+
+        Returns
+        -------
+        Optional[str]
+            The exception type and message, or None if the last refresh
+            succeeded or none was attempted.
+        """
+        return self._poll_error
+
+    @property
+    def status_age(self) -> Optional[float]:
+        """
+        Returns the seconds since the status was fetched.
+
+        Returns
+        -------
+        Optional[float]
+            The age of the status, including the time it spent in the state
+            cache, or None if there is no status.
+        """
+        if self._status_at is None:
+            return None
+        return time.time() - self._status_at
+
+    def _warm_start(self, cache: StateCache) -> None:
+        """
+        Loads the last persisted status and persists new ones.
+        """
+        cached = cache.get(self.ip)
+        if cached is not None:
+            self._status, self._status_at = cached
+            self._stale = True
+            logger.debug(
+                "Loaded cached status of {} from {:.0f}s ago", self.ip, self.status_age
+            )
+        self.add_listener(cache.listener)
+
     @property
     def light_status(self) -> Optional[LightStatus]:
         """
@@ -339,14 +875,25 @@ class Dimmer2:
         """
         while not self._stop_event.is_set():
             self.get_status()
-            time.sleep(self.http_refresh / 1000.0)
+            self._stop_event.wait(self.http_refresh / 1000.0)
+
+    def start_status_loop(self) -> None:
+        """
+        Starts the background status update loop.
+        """
+        if self._status_thread is not None and self._status_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._status_thread = threading.Thread(target=self._status_loop, daemon=True)
+        self._status_thread.start()
 
     def stop_status_loop(self) -> None:
         """
         Stops the background status update loop.
         """
         self._stop_event.set()
-        self._status_thread.join()
+        if self._status_thread is not None:
+            self._status_thread.join()
 
     @property
     def brightness(self) -> int:
@@ -382,6 +929,8 @@ class Dimmer2:
             "set_brightness",
             "on",
             "off",
+            "change_state",
+            "set_schedule_rules",
         ]:
             return getattr(self._light_control, item)
 
@@ -0,0 +1,403 @@
+"""
+Discovery Module.
+
+This module finds Shelly devices on the network. A scan probes every host of
+a CIDR range concurrently against the lightweight, unauthenticated
+``/shelly`` endpoint, with a bounded number of requests in flight and short
+timeouts, so a /22 takes a few seconds. Devices are identified by type and
+MAC address and remembered in a `DiscoveryCache`, so after a restart known
+devices are only re-checked at their cached IP and the subnet is scanned
+again only when one of them is missing or has moved::
+
+    python -m shelly.discovery 192.168.0.0/22 --cache devices.json
+"""
+
+from __future__ import annotations
+import asyncio
+from dataclasses import asdict, dataclass
+import ipaddress
+import os
+from pathlib import Path
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import click
+import httpx
+import orjson
+from loguru import logger
+from pydantic import ValidationError
+
+from models import DeviceInfo
+from .dimmer2 import Dimmer2
+
+DIMMER2_TYPES = ("SHDM-2",)
+
+
+@dataclass
+class DiscoveredDevice:
+    """
+    A Shelly device found on the network.
+
+    Attributes
+    ----------
+    mac : str
+        The MAC address of the device.
+    ip : str
+        The address the device answered on, with the port unless it is 80.
+    type : str
+        The model identifier of the device, e.g. "SHDM-2".
+    fw : str
+        The firmware version.
+    seen : float
+        When the device last answered, in seconds since the epoch.
+    """
+
+    mac: str
+    ip: str
+    type: str
+    fw: str = ""
+    seen: float = 0.0
+
+    @property
+    def mqtt_id(self) -> str:
+        """
+        Returns the default MQTT id of a Dimmer2, as used in its topics.
+
+        Returns
+        -------
+        str
+            The id, e.g. ``shellydimmer2-EC64C9C2EFE2``.
+        """
+        return f"shellydimmer2-{self.mac}"
+
+
+class DiscoveryCache:
+    """
+    A JSON file of discovered devices, keyed by MAC address.
+
+    Attributes
+    ----------
+    path : Path
+        The cache file.
+    devices : Dict[str, DiscoveredDevice]
+        The known devices, keyed by MAC address.
+
+    Methods
+    -------
+    get(mac) -> Optional[DiscoveredDevice]
+        Returns a known device.
+    update(devices)
+        Adds or replaces devices.
+    save()
+        Writes the cache file.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """
+        Initializes the DiscoveryCache instance, loading the file if it exists.
+
+        Parameters
+        ----------
+        path : Union[str, Path]
+            The cache file.
+        """
+        self.path = Path(path)
+        self.devices: Dict[str, DiscoveredDevice] = {}
+        if self.path.exists():
+            try:
+                entries = orjson.loads(self.path.read_bytes())
+                self.devices = {
+                    mac: DiscoveredDevice(**entry) for mac, entry in entries.items()
+                }
+            except (orjson.JSONDecodeError, TypeError, AttributeError) as e:
+                logger.warning(f"Ignoring unreadable discovery cache {self.path}: {e}")
+
+    def get(self, mac: str) -> Optional[DiscoveredDevice]:
+        """
+        Returns a known device.
+
+        Parameters
+        ----------
+        mac : str
+            The MAC address of the device.
+
+        Returns
+        -------
+        Optional[DiscoveredDevice]
+            The device, or None if it is not in the cache.
+        """
+        return self.devices.get(mac.upper())
+
+    def update(self, devices: Iterable[DiscoveredDevice]) -> None:
+        """
+        Adds or replaces devices.
+
+        Parameters
+        ----------
+        devices : Iterable[DiscoveredDevice]
+            The devices.
+        """
+        for device in devices:
+            self.devices[device.mac] = device
+
+    def save(self) -> None:
+        """
+        Writes the cache file, replacing it atomically.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_suffix(self.path.suffix + ".tmp")
+        temporary.write_bytes(
+            orjson.dumps(
+                {mac: asdict(device) for mac, device in sorted(self.devices.items())},
+                option=orjson.OPT_INDENT_2,
+            )
+        )
+        os.replace(temporary, self.path)
+
+
+async def probe(
+    client: httpx.AsyncClient,
+    address: str,
+    types: Optional[Sequence[str]] = DIMMER2_TYPES,
+) -> Optional[DiscoveredDevice]:
+    """
+    Asks an address whether it is a Shelly device.
+
+    Parameters
+    ----------
+    client : httpx.AsyncClient
+        The client, whose timeout bounds the probe.
+    address : str
+        The ``host`` or ``host:port`` to probe.
+    types : Optional[Sequence[str]], optional
+        The accepted device types, by default Dimmer2 only; None accepts any
+        Shelly device.
+
+    Returns
+    -------
+    Optional[DiscoveredDevice]
+        The device, or None if nothing (matching) answered.
+    """
+    try:
+        response = await client.get(f"http://{address}/shelly")
+        if response.status_code != 200:
+            return None
+        info = DeviceInfo.model_validate_json(response.content)
+    except (httpx.HTTPError, ValidationError):
+        return None
+    if types is not None and info.type not in types:
+        return None
+    return DiscoveredDevice(
+        mac=info.mac.upper(), ip=address, type=info.type, fw=info.fw, seen=time.time()
+    )
+
+
+def _address(host: Union[str, ipaddress.IPv4Address], port: int) -> str:
+    """
+    Returns the address of a host as probed, omitting the default port.
+    """
+    return str(host) if port == 80 else f"{host}:{port}"
+
+
+async def _probe_all(
+    addresses: List[str],
+    types: Optional[Sequence[str]],
+    concurrency: int,
+    timeout: float,
+) -> List[DiscoveredDevice]:
+    """
+    Probes addresses concurrently, with at most ``concurrency`` in flight.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=0)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+
+        async def bounded(address: str) -> Optional[DiscoveredDevice]:
+            async with semaphore:
+                return await probe(client, address, types)
+
+        results = await asyncio.gather(*(bounded(address) for address in addresses))
+    return [device for device in results if device is not None]
+
+
+async def scan(
+    network: str,
+    port: int = 80,
+    types: Optional[Sequence[str]] = DIMMER2_TYPES,
+    concurrency: int = 256,
+    timeout: float = 0.5,
+) -> List[DiscoveredDevice]:
+    """
+    Scans every host of a network for Shelly devices.
+
+    Parameters
+    ----------
+    network : str
+        The CIDR range, e.g. "192.168.0.0/22".
+    port : int, optional
+        The HTTP port of the devices, by default 80.
+    types : Optional[Sequence[str]], optional
+        The accepted device types, by default Dimmer2 only; None accepts any
+        Shelly device.
+    concurrency : int, optional
+        The maximum number of probes in flight, by default 256.
+    timeout : float, optional
+        The timeout of each probe in seconds, by default 0.5.
+
+    Returns
+    -------
+    List[DiscoveredDevice]
+        The devices found, in address order.
+    """
+    hosts = ipaddress.ip_network(network, strict=False).hosts()
+    addresses = [_address(host, port) for host in hosts]
+    start = time.perf_counter()
+    devices = await _probe_all(addresses, types, concurrency, timeout)
+    logger.info(
+        f"Scanned {len(addresses)} hosts of {network} in "
+        f"{time.perf_counter() - start:.1f}s, found {len(devices)} devices"
+    )
+    return devices
+
+
+async def discover(
+    network: str,
+    cache: Optional[DiscoveryCache] = None,
+    macs: Optional[Iterable[str]] = None,
+    port: int = 80,
+    types: Optional[Sequence[str]] = DIMMER2_TYPES,
+    concurrency: int = 256,
+    timeout: float = 0.5,
+) -> Dict[str, DiscoveredDevice]:
+    """
+    Finds devices, re-scanning the network only on cache misses.
+
+    The cached devices are re-checked at their known address first. The
+    network is scanned when the cache is empty, when a cached device no
+    longer answers there, or when one of ``macs`` is unknown.
+
+    Parameters
+    ----------
+    network : str
+        The CIDR range to scan on a miss.
+    cache : Optional[DiscoveryCache], optional
+        The cache to consult and update, by default none.
+    macs : Optional[Iterable[str]], optional
+        The MAC addresses that must be found, by default those in the cache.
+    port : int, optional
+        The HTTP port of the devices, by default 80.
+    types : Optional[Sequence[str]], optional
+        The accepted device types, by default Dimmer2 only.
+    concurrency : int, optional
+        The maximum number of probes in flight, by default 256.
+    timeout : float, optional
+        The timeout of each probe in seconds, by default 0.5.
+
+    Returns
+    -------
+    Dict[str, DiscoveredDevice]
+        The devices found, keyed by MAC address.
+    """
+    known = dict(cache.devices) if cache is not None else {}
+    wanted = {mac.upper() for mac in macs} if macs is not None else set(known)
+
+    found: Dict[str, DiscoveredDevice] = {}
+    candidates = [known[mac] for mac in wanted if mac in known]
+    if candidates:
+        checked = await _probe_all(
+            [device.ip for device in candidates], types, concurrency, timeout
+        )
+        found = {device.mac: device for device in checked if device.mac in wanted}
+
+    if not wanted or not wanted.issubset(found):
+        missing = sorted(wanted - set(found))
+        if missing:
+            logger.info(f"Re-scanning {network} for {', '.join(missing)}")
+        for device in await scan(network, port, types, concurrency, timeout):
+            found[device.mac] = device
+
+    if cache is not None:
+        cache.update(found.values())
+        cache.save()
+    return found
+
+
+def locate(
+    mac: str,
+    network: str,
+    cache_path: Union[str, Path],
+    port: int = 80,
+    autostart: bool = True,
+) -> Dimmer2:
+    """
+    Returns a `Dimmer2` for a MAC address, discovering its IP if necessary.
+
+    Parameters
+    ----------
+    mac : str
+        The MAC address of the dimmer.
+    network : str
+        The CIDR range to scan if the cached IP is missing or stale.
+    cache_path : Union[str, Path]
+        The discovery cache file.
+    port : int, optional
+        The HTTP port of the devices, by default 80.
+    autostart : bool, optional
+        Whether to start the status loop of the dimmer, by default True.
+
+    Returns
+    -------
+    Dimmer2
+        The dimmer.
+
+    Raises
+    ------
+    LookupError
+        If no Dimmer2 with this MAC address answers in the network.
+    """
+    cache = DiscoveryCache(cache_path)
+    found = asyncio.run(discover(network, cache, [mac], port))
+    device = found.get(mac.upper())
+    if device is None:
+        raise LookupError(f"No Dimmer2 with MAC {mac} found in {network}")
+    return Dimmer2(device.ip, autostart=autostart)
+
+
+@click.command()
+@click.argument("network")
+@click.option("--cache", type=click.Path(dir_okay=False), help="Discovery cache file.")
+@click.option("--port", default=80, show_default=True, help="HTTP port of the devices.")
+@click.option(
+    "--all-types", is_flag=True, help="Report every Shelly device, not only Dimmer2."
+)
+@click.option("--concurrency", default=256, show_default=True, help="Probes in flight.")
+@click.option(
+    "--timeout", default=0.5, show_default=True, help="Probe timeout in seconds."
+)
+def main(
+    network: str,
+    cache: Optional[str],
+    port: int,
+    all_types: bool,
+    concurrency: int,
+    timeout: float,
+) -> None:
+    """
+    Discovers Shelly devices in NETWORK, e.g. 192.168.0.0/22.
+    """
+    found = asyncio.run(
+        discover(
+            network,
+            DiscoveryCache(cache) if cache else None,
+            port=port,
+            types=None if all_types else DIMMER2_TYPES,
+            concurrency=concurrency,
+            timeout=timeout,
+        )
+    )
+    for device in sorted(found.values(), key=lambda device: device.ip):
+        click.echo(f"{device.mac}  {device.ip:<21}  {device.type:<8}  {device.fw}")
+
+
+if __name__ == "__main__":
+    main()
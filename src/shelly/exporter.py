@@ -0,0 +1,285 @@
+"""
+Exporter Module.
+
+This module provides an OpenMetrics (Prometheus) exporter for a fleet of
+`Dimmer2` devices. A scrape renders the last cached `Status` of every
+device and the client's own request metrics from memory, with label sets
+formatted once per device, so it never triggers a device request and
+stays in the millisecond range for thousands of devices.
+
+Every series is labelled by the device address only, so the series of a
+device do not change once its MAC address becomes known; the MAC is
+exported by the ``shelly_device_info`` family instead, to be joined on the
+``device`` label.
+"""
+
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from models import Status
+from .dimmer2 import Dimmer2
+from .metrics import COUNTERS
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Upper bounds in seconds of the request duration histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (name, type, help, value of a status) of the device metric families.
+STATUS_METRICS: Tuple[Tuple[str, str, str, Callable[[Status], float]], ...] = (
+    ("shelly_power_watts", "gauge", "Current power draw.", lambda s: s.meters[0].power),
+    (
+        "shelly_energy",
+        "counter",
+        "Energy counter as reported by the meter.",
+        lambda s: s.meters[0].total,
+    ),
+    (
+        "shelly_temperature_celsius",
+        "gauge",
+        "Device temperature.",
+        lambda s: s.temperature.celcius,
+    ),
+    (
+        "shelly_brightness_percent",
+        "gauge",
+        "Light brightness.",
+        lambda s: s.lights[0].brightness,
+    ),
+    (
+        "shelly_light_on",
+        "gauge",
+        "Whether the light is on.",
+        lambda s: s.lights[0].is_on,
+    ),
+    (
+        "shelly_wifi_rssi_dbm",
+        "gauge",
+        "Wi-Fi signal strength.",
+        lambda s: s.wifi_status.rssi,
+    ),
+    ("shelly_ram_free_bytes", "gauge", "Free device RAM.", lambda s: s.ram_free),
+    ("shelly_uptime_seconds", "gauge", "Device uptime.", lambda s: s.uptime),
+    (
+        "shelly_over_power",
+        "gauge",
+        "Whether an over power condition occurred.",
+        lambda s: s.over_power,
+    ),
+    (
+        "shelly_over_temperature",
+        "gauge",
+        "Whether an overtemperature condition occurred.",
+        lambda s: s.over_temperature,
+    ),
+)
+
+
+def _escape(value: str) -> str:
+    """
+    Escapes a label value.
+    """
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _number(value: float) -> str:
+    """
+    Formats a sample value.
+    """
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class FleetExporter:
+    """
+    Renders the cached state of a fleet in OpenMetrics format.
+
+    Attributes
+    ----------
+    devices : Dict[str, Dimmer2]
+        The exported devices, keyed by IP address.
+
+    Methods
+    -------
+    add(dimmer)
+        Adds a device to the export.
+    remove(dimmer)
+        Removes a device from the export.
+    render() -> bytes
+        Renders the current snapshot of the fleet.
+    serve(host, port)
+        Serves ``/metrics`` from a background thread.
+    stop()
+        Stops serving.
+    """
+
+    def __init__(self, devices: Iterable[Dimmer2] = ()) -> None:
+        """
+        Initializes the FleetExporter instance.
+
+        Parameters
+        ----------
+        devices : Iterable[Dimmer2], optional
+            The devices to export.
+        """
+        self.devices: Dict[str, Dimmer2] = {}
+        self._labels: Dict[str, str] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        for dimmer in devices:
+            self.add(dimmer)
+
+    def add(self, dimmer: Dimmer2) -> None:
+        """
+        Adds a device to the export.
+
+        Parameters
+        ----------
+        dimmer : Dimmer2
+            The device.
+        """
+        self.devices[dimmer.ip] = dimmer
+
+    def remove(self, dimmer: Dimmer2) -> None:
+        """
+        Removes a device from the export.
+
+        Parameters
+        ----------
+        dimmer : Dimmer2
+            The device.
+        """
+        self.devices.pop(dimmer.ip, None)
+        self._labels.pop(dimmer.ip, None)
+
+    def _label_set(self, ip: str) -> str:
+        """
+        Returns the preformatted labels of a device.
+        """
+        labels = self._labels.get(ip)
+        if labels is None:
+            labels = self._labels[ip] = f'device="{_escape(ip)}"'
+        return labels
+
+    def render(self) -> bytes:
+        """
+        Renders the current snapshot of the fleet.
+
+        Returns
+        -------
+        bytes
+            The OpenMetrics exposition, terminated by ``# EOF``.
+        """
+        snapshot = [
+            (self._label_set(ip), dimmer, dimmer.cached_status)
+            for ip, dimmer in list(self.devices.items())
+        ]
+        lines: List[str] = [
+            "# TYPE shelly_up gauge",
+            "# HELP shelly_up Whether a status of the device has been fetched.",
+        ]
+        lines.extend(
+            f"shelly_up{{{labels}}} {0 if status is None else 1}"
+            for labels, _, status in snapshot
+        )
+        lines.append("# TYPE shelly_device info")
+        lines.append("# HELP shelly_device The identity of the device.")
+        lines.extend(
+            f'shelly_device_info{{{labels},mac="{_escape(status.mac)}"}} 1'
+            for labels, _, status in snapshot
+            if status is not None
+        )
+
+        for name, kind, text, value in STATUS_METRICS:
+            sample = f"{name}_total" if kind == "counter" else name
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"# HELP {name} {text}")
+            lines.extend(
+                f"{sample}{{{labels}}} {_number(value(status))}"
+                for labels, _, status in snapshot
+                if status is not None
+            )
+
+        self._render_client_metrics(snapshot, lines)
+        lines.append("# EOF\n")
+        return "\n".join(lines).encode()
+
+    def _render_client_metrics(
+        self, snapshot: List[Tuple[str, Dimmer2, Optional[Status]]], lines: List[str]
+    ) -> None:
+        """
+        Appends the request counters and latency histograms of the client.
+        """
+        bounds_us = [int(bound * 1e6) for bound in LATENCY_BUCKETS]
+        exported = [
+            (labels, *dimmer._metrics.cumulative(bounds_us))
+            for labels, dimmer, _ in snapshot
+        ]
+        for counter in COUNTERS:
+            name = f"shelly_client_{counter}"
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"# HELP {name} Client {counter.replace('_', ' ')}.")
+            lines.extend(
+                f"{name}_total{{{labels}}} {counters[counter]}"
+                for labels, counters, _ in exported
+            )
+
+        name = "shelly_client_request_duration_seconds"
+        bucket_labels = [f'le="{bound}"' for bound in LATENCY_BUCKETS]
+        lines.append(f"# TYPE {name} histogram")
+        lines.append(f"# HELP {name} Client request latency per endpoint.")
+        for labels, _, histograms in exported:
+            for endpoint, (cumulative, count, total) in histograms.items():
+                endpoint_labels = f'{labels},endpoint="{_escape(endpoint)}"'
+                for le, value in zip(bucket_labels, cumulative):
+                    lines.append(f"{name}_bucket{{{endpoint_labels},{le}}} {value}")
+                lines.append(f'{name}_bucket{{{endpoint_labels},le="+Inf"}} {count}')
+                lines.append(f"{name}_count{{{endpoint_labels}}} {count}")
+                lines.append(f"{name}_sum{{{endpoint_labels}}} {total / 1e6}")
+
+    def serve(self, host: str = "0.0.0.0", port: int = 9464) -> None:
+        """
+        Serves ``/metrics`` from a background thread.
+
+        Parameters
+        ----------
+        host : str, optional
+            The address to listen on, by default all interfaces.
+        port : int, optional
+            The port to listen on, by default 9464.
+        """
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.partition("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops serving.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
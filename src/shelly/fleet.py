@@ -0,0 +1,382 @@
+"""
+Fleet Module.
+
+This module provides the sharded polling of large fleets. Parsing a
+`Status` is CPU-bound and holds the GIL, so a single process tops out at a
+few thousand payloads per second. `ShardedPoller` partitions the devices
+across worker processes, each polling its shard with a thread pool of
+`Dimmer2` instances, and sends back compact `StatusSample` tuples instead of
+full `Status` models, so throughput scales with the number of cores.
+"""
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+from multiprocessing.synchronize import Event as EventType
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from loguru import logger
+
+from models import Status
+from .dimmer2 import Dimmer2
+from .log_config import configure_logging
+
+
+class StatusSample(NamedTuple):
+    """
+    The compact result of polling one device.
+
+    Attributes
+    ----------
+    ip : str
+        The address of the device.
+    timestamp : float
+        When the poll finished, in seconds since the epoch.
+    ok : bool
+        Whether the poll succeeded; the other fields hold the last known
+        values otherwise.
+    mac : str
+        The MAC address of the device.
+    is_on : bool
+        Whether the light is on.
+    brightness : int
+        The brightness of the light in percent.
+    power : float
+        The current power draw in watts.
+    total : float
+        The energy counter of the meter.
+    temperature : float
+        The device temperature in Celsius.
+    over_power : bool
+        Whether an over power condition occurred.
+    over_temperature : bool
+        Whether an overtemperature condition occurred.
+    rssi : int
+        The Wi-Fi signal strength.
+    uptime : int
+        The device uptime in seconds.
+    overpower : float
+        The power in watts at which the meter reports an over power condition.
+    load_error : int
+        The load error reported by the device, 0 if none.
+    error : Optional[str]
+        Why the poll failed, if it did.
+    """
+
+    ip: str
+    timestamp: float
+    ok: bool
+    mac: str = ""
+    is_on: bool = False
+    brightness: int = 0
+    power: float = 0.0
+    total: float = 0.0
+    temperature: float = 0.0
+    over_power: bool = False
+    over_temperature: bool = False
+    rssi: int = 0
+    uptime: int = 0
+    overpower: float = 0.0
+    load_error: int = 0
+    error: Optional[str] = None
+
+    @classmethod
+    def from_status(
+        cls, ip: str, status: Status, timestamp: float, ok: bool = True
+    ) -> StatusSample:
+        """
+        Extracts the sample of a status.
+
+        Parameters
+        ----------
+        ip : str
+            The address of the device.
+        status : Status
+            The status.
+        timestamp : float
+            When the status was fetched.
+        ok : bool, optional
+            Whether the status is fresh, by default True.
+
+        Returns
+        -------
+        StatusSample
+            The sample.
+        """
+        light, meter = status.lights[0], status.meters[0]
+        return cls(
+            ip,
+            timestamp,
+            ok,
+            status.mac,
+            light.is_on,
+            light.brightness,
+            meter.power,
+            meter.total,
+            status.temperature.celcius,
+            status.over_power,
+            status.over_temperature,
+            status.wifi_status.rssi,
+            status.uptime,
+            meter.overpower,
+            status.load_error,
+        )
+
+
+def poll(dimmer: Dimmer2) -> StatusSample:
+    """
+    Polls a device once.
+
+    Parameters
+    ----------
+    dimmer : Dimmer2
+        The device.
+
+    Returns
+    -------
+    StatusSample
+        The sample; on failure it carries the last known values and the
+        error of the failed refresh.
+    """
+    previous = dimmer.cached_status
+    dimmer.get_status()
+    status = dimmer.cached_status
+    now = time.time()
+    if status is not None and status is not previous:
+        return StatusSample.from_status(dimmer.ip, status, now)
+    error = dimmer.poll_error or "poll failed"
+    if status is None:
+        return StatusSample(dimmer.ip, now, False, error=error)
+    return StatusSample.from_status(dimmer.ip, status, now, ok=False)._replace(
+        error=error
+    )
+
+
+def _init_worker() -> None:
+    """
+    Prepares a worker process; only the parent writes log files.
+    """
+    configure_logging(directory=None)
+
+
+def _run_shard(
+    addresses: Sequence[str],
+    interval: float,
+    threads: int,
+    results: multiprocessing.Queue,
+    stop: EventType,
+) -> None:
+    """
+    Polls a shard every ``interval`` seconds until ``stop`` is set.
+    """
+    _init_worker()
+    dimmers = [Dimmer2(address, autostart=False) for address in addresses]
+    with ThreadPoolExecutor(max_workers=max(1, min(threads, len(dimmers)))) as executor:
+        while not stop.is_set():
+            started = time.monotonic()
+            results.put(list(executor.map(poll, dimmers)))
+            stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+
+_shard: List[Dimmer2] = []
+_shard_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _open_shard(addresses: Sequence[str], threads: int) -> None:
+    """
+    Creates the devices of a pool worker, see `ShardedPoller.poll_once`.
+    """
+    global _shard_executor
+    _init_worker()
+    _shard.extend(Dimmer2(address, autostart=False) for address in addresses)
+    _shard_executor = ThreadPoolExecutor(max_workers=max(1, min(threads, len(_shard))))
+
+
+def _poll_shard(_: int) -> List[StatusSample]:
+    """
+    Polls the devices of a pool worker once.
+    """
+    assert _shard_executor is not None
+    return list(_shard_executor.map(poll, _shard))
+
+
+class ShardedPoller:
+    """
+    Polls a fleet from several worker processes.
+
+    Attributes
+    ----------
+    shards : List[List[str]]
+        The addresses polled by each worker process.
+    interval : float
+        The seconds between the polls of a device.
+    samples : Dict[str, StatusSample]
+        The latest sample of every device, keyed by address.
+
+    Methods
+    -------
+    start()
+        Starts polling in the background.
+    stop()
+        Stops polling and the worker processes.
+    add_listener(callback)
+        Calls a function with every batch of samples.
+    poll_once() -> Dict[str, StatusSample]
+        Polls every device once, in parallel.
+    """
+
+    def __init__(
+        self,
+        addresses: Sequence[str],
+        processes: Optional[int] = None,
+        interval: float = 1.0,
+        threads: int = 32,
+        start_method: str = "spawn",
+    ) -> None:
+        """
+        Initializes the ShardedPoller instance.
+
+        Parameters
+        ----------
+        addresses : Sequence[str]
+            The addresses of the devices.
+        processes : Optional[int], optional
+            The number of worker processes, by default one per core.
+        interval : float, optional
+            The seconds between the polls of a device, by default 1.0.
+        threads : int, optional
+            The number of polling threads per worker, by default 32.
+        start_method : str, optional
+            The multiprocessing start method, by default "spawn".
+        """
+        count = max(1, min(processes or os.cpu_count() or 1, len(addresses)))
+        self.shards = [list(addresses[index::count]) for index in range(count)]
+        self.interval = interval
+        self.threads = threads
+        self.samples: Dict[str, StatusSample] = {}
+        self._context = multiprocessing.get_context(start_method)
+        self._listeners: List[Callable[[List[StatusSample]], None]] = []
+        self._processes: List[multiprocessing.process.BaseProcess] = []
+        self._results: Optional[multiprocessing.Queue] = None
+        self._stop: Optional[EventType] = None
+        self._collector: Optional[threading.Thread] = None
+        self._collecting = threading.Event()
+        self._pool: Optional[List[ProcessPoolExecutor]] = None
+
+    def add_listener(self, callback: Callable[[List[StatusSample]], None]) -> None:
+        """
+        Calls a function with every batch of samples.
+
+        Parameters
+        ----------
+        callback : Callable[[List[StatusSample]], None]
+            Called on the collector thread with the samples of one polling
+            round of one shard.
+        """
+        self._listeners.append(callback)
+
+    def _collect(self, samples: List[StatusSample]) -> None:
+        """
+        Stores a batch of samples and passes it to the listeners.
+        """
+        for sample in samples:
+            self.samples[sample.ip] = sample
+        for listener in self._listeners:
+            try:
+                listener(samples)
+            except Exception:
+                logger.exception("Fleet listener {} failed", listener)
+
+    def start(self) -> None:
+        """
+        Starts polling in the background.
+        """
+        if self._processes:
+            return
+        self._results = self._context.Queue()
+        self._stop = self._context.Event()
+        self._processes = [
+            self._context.Process(
+                target=_run_shard,
+                args=(shard, self.interval, self.threads, self._results, self._stop),
+                daemon=True,
+            )
+            for shard in self.shards
+        ]
+        for process in self._processes:
+            process.start()
+        self._collecting.set()
+        self._collector = threading.Thread(target=self._collect_loop, daemon=True)
+        self._collector.start()
+
+    def _collect_loop(self) -> None:
+        """
+        Receives the batches of the worker processes until they exited.
+        """
+        assert self._results is not None
+        while self._collecting.is_set():
+            try:
+                self._collect(self._results.get(timeout=0.1))
+            except queue.Empty:
+                continue
+        while True:
+            try:
+                self._collect(self._results.get_nowait())
+            except queue.Empty:
+                break
+
+    def stop(self) -> None:
+        """
+        Stops polling and the worker processes.
+        """
+        if self._stop is not None:
+            self._stop.set()
+        # Keep draining the results while joining, a worker blocked on a
+        # full queue would otherwise never exit.
+        for process in self._processes:
+            process.join(timeout=max(5.0, 2 * self.interval))
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        self._collecting.clear()
+        if self._collector is not None:
+            self._collector.join()
+            self._collector = None
+        if self._pool is not None:
+            for executor in self._pool:
+                executor.shutdown()
+            self._pool = None
+
+    def poll_once(self) -> Dict[str, StatusSample]:
+        """
+        Polls every device once, in parallel.
+
+        The first call starts one pool process per shard that keeps its
+        devices, and their connections, for later calls.
+
+        Returns
+        -------
+        Dict[str, StatusSample]
+            The samples of this round, keyed by address.
+        """
+        if self._pool is None:
+            self._pool = [
+                ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=self._context,
+                    initializer=_open_shard,
+                    initargs=(shard, self.threads),
+                )
+                for shard in self.shards
+            ]
+        futures = [executor.submit(_poll_shard, 0) for executor in self._pool]
+        batch: Dict[str, StatusSample] = {}
+        for future in futures:
+            samples = future.result()
+            self._collect(samples)
+            batch.update((sample.ip, sample) for sample in samples)
+        return batch
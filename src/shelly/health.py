@@ -0,0 +1,213 @@
+"""
+Health Module.
+
+This module provides the per-device circuit breaker used by `Dimmer2`. After
+a few consecutive failed requests the breaker opens and requests to the
+device fail immediately instead of waiting for a timeout. Once an
+exponentially growing, jittered backoff has elapsed, a single cheap liveness
+probe decides whether the device is back (closed) or the backoff grows
+further (open again).
+"""
+
+from __future__ import annotations
+from enum import Enum
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+import httpx
+
+
+class BreakerState(str, Enum):
+    """
+    The states of a `CircuitBreaker`.
+    """
+
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+class CircuitOpenError(httpx.TransportError):
+    """
+    Raised instead of sending a request to a device whose breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Tracks the reachability of a device and decides when to contact it.
+
+    Attributes
+    ----------
+    failure_threshold : int
+        The number of consecutive failures that opens the breaker.
+    base_delay : float
+        The backoff in seconds after the breaker opens for the first time.
+    max_delay : float
+        The upper limit of the backoff in seconds.
+    jitter : float
+        The fraction by which each backoff is randomly shortened, so that
+        devices that failed together are not probed together.
+    state : BreakerState
+        The current state.
+    failures : int
+        The number of consecutive failures.
+    last_error : Optional[str]
+        The last failure, if any.
+
+    Methods
+    -------
+    allow() -> bool
+        Whether a request may be sent now.
+    record_success()
+        Records a successful request and closes the breaker.
+    record_failure(error)
+        Records a failed request, possibly opening the breaker.
+    release()
+        Ends a probe that was interrupted before it had an outcome.
+    snapshot() -> dict
+        Returns the health state.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 300.0,
+        jitter: float = 0.2,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Initializes the CircuitBreaker instance.
+
+        Parameters
+        ----------
+        failure_threshold : int, optional
+            The number of consecutive failures that opens the breaker, by
+            default 3.
+        base_delay : float, optional
+            The first backoff in seconds, by default 1.0.
+        max_delay : float, optional
+            The upper limit of the backoff in seconds, by default 300.0.
+        jitter : float, optional
+            The maximum fraction by which a backoff is shortened, by
+            default 0.2.
+        clock : Callable[[], float], optional
+            The monotonic time source, by default `time.monotonic`.
+        """
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = BreakerState.closed
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._opened = 0
+        self._retry_at = 0.0
+        self._probing = False
+
+    def _backoff(self) -> float:
+        """
+        Returns the jittered backoff after the breaker opened ``_opened`` times.
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (self._opened - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def allow(self) -> bool:
+        """
+        Whether a request may be sent now.
+
+        When the backoff of an open breaker has elapsed, the first caller is
+        allowed through as the probe and the breaker becomes half-open; other
+        callers are rejected until the probe is recorded.
+
+        Returns
+        -------
+        bool
+            True if the request may be sent.
+        """
+        with self._lock:
+            if self.state is BreakerState.closed:
+                return True
+            if self._probing or self._clock() < self._retry_at:
+                return False
+            self.state = BreakerState.half_open
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        """
+        Records a successful request and closes the breaker.
+        """
+        with self._lock:
+            self.state = BreakerState.closed
+            self.failures = 0
+            self._opened = 0
+            self._probing = False
+
+    def record_failure(self, error: Optional[BaseException] = None) -> None:
+        """
+        Records a failed request, possibly opening the breaker.
+
+        Parameters
+        ----------
+        error : Optional[BaseException], optional
+            The cause of the failure, by default None.
+        """
+        with self._lock:
+            self.failures += 1
+            if error is not None:
+                self.last_error = f"{type(error).__name__}: {error}"
+            if (
+                self.state is BreakerState.half_open
+                or self.failures >= self.failure_threshold
+            ):
+                self._opened += 1
+                self.state = BreakerState.open
+                self._retry_at = self._clock() + self._backoff()
+            self._probing = False
+
+    def release(self) -> None:
+        """
+        Ends a probe that was interrupted before it had an outcome.
+
+        The breaker stays half-open and the next caller becomes the probe.
+        """
+        with self._lock:
+            self._probing = False
+
+    @property
+    def retry_in(self) -> float:
+        """
+        Gets the seconds until an open breaker allows a probe.
+
+        Returns
+        -------
+        float
+            The remaining backoff, 0 unless the breaker is open.
+        """
+        if self.state is not BreakerState.open:
+            return 0.0
+        return max(0.0, self._retry_at - self._clock())
+
+    def snapshot(self) -> dict:
+        """
+        Returns the health state.
+
+        Returns
+        -------
+        dict
+            The state, consecutive failures, seconds until the next probe and
+            the last failure.
+        """
+        with self._lock:
+            return {
+                "state": self.state.value,
+                "failures": self.failures,
+                "retry_in": self.retry_in,
+                "last_error": self.last_error,
+            }
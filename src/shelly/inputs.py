@@ -0,0 +1,337 @@
+"""
+Inputs Module.
+
+This module turns the physical inputs of devices (wall buttons and
+switches) into events. Presses are detected from two sources:
+
+- the ``input_event/N`` and ``input/N`` MQTT topics, which devices push as
+  soon as an input changes, so events arrive within milliseconds;
+- the ``event_cnt`` counters and ``input`` levels of polled statuses, which
+  also reveal presses that happened between two polls.
+
+Each device input keeps the last counter and level seen from either
+source, so a press reported by both is dispatched only once, by whichever
+source reported it first::
+
+    inputs = InputEvents()
+    inputs.add_listener(print)
+    inputs.attach(ingest)                  # MQTT, low latency
+    dimmer.add_listener(inputs.listener)   # polling, catches up
+
+Callbacks run on the thread that received the event (the MQTT network
+thread or a polling thread) and should return quickly.
+"""
+
+from __future__ import annotations
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from loguru import logger
+
+from models import Status
+from .dimmer2 import Dimmer2
+from .mqtt_ingest import MQTTIngest, ShellyMessage
+
+MQTT = "mqtt"
+HTTP = "http"
+
+
+class InputEvent(NamedTuple):
+    """
+    An event of a physical input.
+
+    Attributes
+    ----------
+    device : str
+        The MAC address of the device.
+    channel : int
+        The input channel.
+    event : str
+        The event reported by the device ("S" short press, "L" long press,
+        "SS" double press, ...), or "on"/"off" when the input level changed.
+    counter : int
+        The event counter of the input after the event.
+    presses : int
+        The number of events the counter advanced by; more than 1 if
+        events happened between two polls.
+    source : str
+        "mqtt" or "http".
+    timestamp : float
+        When the event was received, in seconds since the epoch.
+    """
+
+    device: str
+    channel: int
+    event: str
+    counter: int
+    presses: int
+    source: str
+    timestamp: float
+
+
+def device_mac(device_id: str) -> str:
+    """
+    Returns the MAC address in a default MQTT id.
+
+    Parameters
+    ----------
+    device_id : str
+        The MQTT id, e.g. ``shellydimmer2-EC64C9C2EFE2``.
+
+    Returns
+    -------
+    str
+        The MAC address, e.g. ``EC64C9C2EFE2``.
+    """
+    return device_id.rpartition("-")[2].upper()
+
+
+class InputEvents:
+    """
+    Detects and deduplicates the input events of devices.
+
+    Attributes
+    ----------
+    mqtt_grace : float
+        For how many seconds after an MQTT message of a device input
+        levels from polled statuses are ignored, as MQTT reports them
+        earlier and polls may return older levels.
+    restart_drop : int
+        By how many events an ``input_event`` counter pushed over MQTT must
+        drop to be taken as a device restart. Smaller drops are messages
+        delayed behind a poll that already reported them, unless the device
+        was never polled, in which case any drop is a restart.
+
+    Methods
+    -------
+    add_listener(callback)
+        Calls a function with every event.
+    attach(ingest)
+        Receives the input topics of an `MQTTIngest`.
+    listener(dimmer, status)
+        Processes a polled status, see `Dimmer2.add_listener`.
+    observe(device, channel, counter, event, source, restarted) -> Optional[InputEvent]
+        Processes an event counter reading.
+    observe_level(device, channel, level, source) -> Optional[InputEvent]
+        Processes an input level reading.
+    """
+
+    def __init__(self, mqtt_grace: float = 60.0, restart_drop: int = 2) -> None:
+        """
+        Initializes the InputEvents instance.
+
+        Parameters
+        ----------
+        mqtt_grace : float, optional
+            The seconds after an MQTT message during which polled input
+            levels are ignored, by default 60.0.
+        restart_drop : int, optional
+            The drop of an MQTT event counter taken as a device restart, by
+            default 2.
+        """
+        self.mqtt_grace = mqtt_grace
+        self.restart_drop = restart_drop
+        self._counters: Dict[Tuple[str, int], int] = {}
+        self._levels: Dict[Tuple[str, int], bool] = {}
+        self._mqtt_seen: Dict[str, float] = {}
+        self._uptimes: Dict[str, int] = {}
+        self._listeners: List[Callable[[InputEvent], None]] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback: Callable[[InputEvent], None]) -> None:
+        """
+        Calls a function with every event.
+
+        Parameters
+        ----------
+        callback : Callable[[InputEvent], None]
+            Called on the thread that received the event.
+        """
+        self._listeners.append(callback)
+
+    def _dispatch(self, event: InputEvent) -> InputEvent:
+        """
+        Calls the listeners with an event.
+        """
+        logger.debug(
+            "Input {}/{} {} ({}) via {}",
+            event.device,
+            event.channel,
+            event.event,
+            event.counter,
+            event.source,
+        )
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception:
+                logger.exception("Input listener {} failed", listener)
+        return event
+
+    def observe(
+        self,
+        device: str,
+        channel: int,
+        counter: int,
+        event: str,
+        source: str,
+        restarted: bool = False,
+    ) -> Optional[InputEvent]:
+        """
+        Processes an event counter reading.
+
+        Parameters
+        ----------
+        device : str
+            The MAC address of the device.
+        channel : int
+            The input channel.
+        counter : int
+            The event counter of the input.
+        event : str
+            The last event of the input.
+        source : str
+            "mqtt" or "http".
+        restarted : bool, optional
+            Whether the device restarted since the previous reading, which
+            resets its counters, by default False. MQTT readings detect a
+            restart from the counter drop, see `restart_drop`.
+
+        Returns
+        -------
+        Optional[InputEvent]
+            The event, unless the counter did not advance or this is the
+            first polled reading of the input.
+        """
+        key = (device, channel)
+        with self._lock:
+            last = self._counters.get(key)
+            if (
+                source == MQTT
+                and last is not None
+                and counter < last
+                and (last - counter > self.restart_drop or device not in self._uptimes)
+            ):
+                # The messages of a device arrive in order, so it restarted.
+                # The next poll rebases the other inputs from its uptime.
+                restarted = True
+            if last is None:
+                self._counters[key] = counter
+                # A pushed event is new, a polled counter may be old history.
+                if source != MQTT:
+                    return None
+                presses = 1
+            elif counter > last:
+                self._counters[key] = counter
+                presses = counter - last
+            elif restarted and counter < last:
+                self._counters[key] = counter
+                if not counter:
+                    return None
+                presses = counter
+            else:
+                # Already reported by the other source, or out of order.
+                return None
+        return self._dispatch(
+            InputEvent(device, channel, event, counter, presses, source, time.time())
+        )
+
+    def observe_level(
+        self, device: str, channel: int, level: bool, source: str
+    ) -> Optional[InputEvent]:
+        """
+        Processes an input level reading.
+
+        Parameters
+        ----------
+        device : str
+            The MAC address of the device.
+        channel : int
+            The input channel.
+        level : bool
+            Whether the input is closed.
+        source : str
+            "mqtt" or "http".
+
+        Returns
+        -------
+        Optional[InputEvent]
+            An "on" or "off" event if the level changed.
+        """
+        key = (device, channel)
+        now = time.time()
+        with self._lock:
+            if source == MQTT:
+                self._mqtt_seen[device] = now
+            elif now - self._mqtt_seen.get(device, float("-inf")) < self.mqtt_grace:
+                return None
+            last = self._levels.get(key)
+            self._levels[key] = level
+            if last is None or last == level:
+                return None
+            counter = self._counters.get(key, 0)
+        return self._dispatch(
+            InputEvent(
+                device, channel, "on" if level else "off", counter, 0, source, now
+            )
+        )
+
+    def listener(self, dimmer: Dimmer2, status: Status) -> None:
+        """
+        Processes a polled status, see `Dimmer2.add_listener`.
+
+        Parameters
+        ----------
+        dimmer : Dimmer2
+            The device.
+        status : Status
+            Its new status.
+        """
+        device = status.mac
+        with self._lock:
+            restarted = status.uptime < self._uptimes.get(device, 0)
+            self._uptimes[device] = status.uptime
+        for channel, state in enumerate(status.inputs):
+            self.observe(
+                device, channel, state.event_counter, state.event, HTTP, restarted
+            )
+            self.observe_level(device, channel, bool(state.input), HTTP)
+
+    def attach(self, ingest: MQTTIngest) -> None:
+        """
+        Receives the input topics of an `MQTTIngest`.
+
+        Parameters
+        ----------
+        ingest : MQTTIngest
+            The ingestion of the fleet.
+        """
+        ingest.subscribe(f"{ingest.prefix}/+/input_event/+", self._on_input_event)
+        ingest.subscribe(f"{ingest.prefix}/+/input/+", self._on_input)
+
+    def _on_input_event(self, message: ShellyMessage) -> None:
+        """
+        Processes an ``input_event/N`` message.
+        """
+        value = message.value
+        if not isinstance(value, dict) or "event_cnt" not in value:
+            return
+        channel = int(message.subtopic.rpartition("/")[2])
+        self.observe(
+            device_mac(message.device_id),
+            channel,
+            value["event_cnt"],
+            value.get("event", ""),
+            MQTT,
+        )
+
+    def _on_input(self, message: ShellyMessage) -> None:
+        """
+        Processes an ``input/N`` message.
+        """
+        if isinstance(message.value, bool):
+            channel = int(message.subtopic.rpartition("/")[2])
+            self.observe_level(
+                device_mac(message.device_id), channel, message.value, MQTT
+            )
@@ -0,0 +1,435 @@
+"""
+Journal Module.
+
+This module provides a compact, append-only change-data-capture journal of
+device status snapshots. Each device periodically gets a keyframe with its
+full status; in between only the leaf fields that changed since the
+previous snapshot are stored, addressed by dotted paths such as
+``meters.0.power``. As most polls only change a few counters, a delta is
+a few dozen bytes instead of the kilobyte of a full payload.
+
+The journal is a file of JSON lines::
+
+    {"k":1,"t":1720000000.0,"d":"192.168.1.99","s":{...full status...}}
+    {"k":0,"t":1720000001.0,"d":"192.168.1.99","c":{"uptime":1201}}
+
+`JournalReader` reconstructs the state of any device at any timestamp by
+seeking to the last keyframe before it and replaying the deltas. A journal
+is attached to a device with ``dimmer.add_listener(journal.listener)``.
+"""
+
+from __future__ import annotations
+import bisect
+from pathlib import Path
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple, Union
+
+import orjson
+
+from models import Status
+from .dimmer2 import Dimmer2
+
+KEYFRAME = b'{"k":1,'
+
+
+def flatten(payload: Any, prefix: str = "") -> Dict[str, Any]:
+    """
+    Flattens a JSON payload into its leaves, keyed by dotted paths.
+
+    List items are addressed by their index and empty containers are kept
+    as leaves, so `unflatten` restores the payload exactly.
+
+    Parameters
+    ----------
+    payload : Any
+        The payload; keys must not contain dots.
+    prefix : str, optional
+        The path of the payload itself, by default the root.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The leaves, keyed by path.
+    """
+    if isinstance(payload, Mapping) and payload:
+        items: Any = payload.items()
+    elif isinstance(payload, list) and payload:
+        items = enumerate(payload)
+    else:
+        return {prefix: payload}
+    leaves: Dict[str, Any] = {}
+    for key, value in items:
+        leaves.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    return leaves
+
+
+def unflatten(leaves: Mapping[str, Any]) -> Any:
+    """
+    Rebuilds a payload from its leaves.
+
+    Parameters
+    ----------
+    leaves : Mapping[str, Any]
+        The leaves, keyed by dotted path, as returned by `flatten`.
+
+    Returns
+    -------
+    Any
+        The payload.
+    """
+    root: Dict[str, Any] = {}
+    for path, value in leaves.items():
+        node = root
+        *parents, last = path.split(".")
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[last] = value
+    return _listify(root)
+
+
+def _listify(node: Any) -> Any:
+    """
+    Turns the dicts whose keys are all indexes back into lists.
+    """
+    if not isinstance(node, dict) or not node:
+        return node
+    children = {key: _listify(value) for key, value in node.items()}
+    if all(key.isdigit() for key in children):
+        return [children[key] for key in sorted(children, key=int)]
+    return children
+
+
+def _payload(status: Union[Status, Mapping[str, Any]]) -> Mapping[str, Any]:
+    """
+    Returns the payload of a status, using the field names of the device API.
+    """
+    if isinstance(status, Status):
+        return status.model_dump(mode="json", by_alias=True)
+    return status
+
+
+def _apply(leaves: Dict[str, Any], entry: Dict[str, Any]) -> None:
+    """
+    Applies a journal record to the leaves of a state.
+    """
+    if entry["k"]:
+        leaves.clear()
+        leaves.update(flatten(entry["s"]))
+    else:
+        leaves.update(entry["c"])
+        for path in entry.get("r", ()):
+            leaves.pop(path, None)
+
+
+class StatusJournal:
+    """
+    Appends status snapshots of devices to a journal file.
+
+    Attributes
+    ----------
+    path : Path
+        The journal file.
+    keyframe_interval : float
+        The seconds after which a device gets a new keyframe.
+
+    Methods
+    -------
+    record(device, status, timestamp)
+        Appends a snapshot of a device.
+    listener(dimmer, status)
+        Records the snapshots of a `Dimmer2`, see `Dimmer2.add_listener`.
+    flush()
+        Flushes buffered records to the file.
+    close()
+        Closes the journal file.
+    """
+
+    def __init__(
+        self, path: Union[str, Path], keyframe_interval: float = 3600.0
+    ) -> None:
+        """
+        Initializes the StatusJournal instance, appending to an existing file.
+
+        Parameters
+        ----------
+        path : Union[str, Path]
+            The journal file.
+        keyframe_interval : float, optional
+            The seconds after which a device gets a new keyframe, by default
+            one hour.
+        """
+        self.path = Path(path)
+        self.keyframe_interval = keyframe_interval
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "ab")
+        self._lock = threading.Lock()
+        # The last leaves and keyframe time of each device.
+        self._state: Dict[str, Tuple[Dict[str, Any], float]] = {}
+
+    def record(
+        self,
+        device: str,
+        status: Union[Status, Mapping[str, Any]],
+        timestamp: Optional[float] = None,
+    ) -> int:
+        """
+        Appends a snapshot of a device.
+
+        Nothing is written when the snapshot equals the previous one.
+
+        Parameters
+        ----------
+        device : str
+            The device key, e.g. its IP address.
+        status : Union[Status, Mapping[str, Any]]
+            The status, or the raw status payload.
+        timestamp : Optional[float], optional
+            The time of the snapshot in seconds since the epoch, by default
+            now.
+
+        Returns
+        -------
+        int
+            The number of bytes written.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        payload = _payload(status)
+        leaves = flatten(payload)
+        with self._lock:
+            previous = self._state.get(device)
+            if previous is None or timestamp - previous[1] >= self.keyframe_interval:
+                line = orjson.dumps({"k": 1, "t": timestamp, "d": device, "s": payload})
+                self._state[device] = (leaves, timestamp)
+            else:
+                last, keyframe_at = previous
+                changed = {
+                    path: value
+                    for path, value in leaves.items()
+                    if path not in last or last[path] != value
+                }
+                removed = [path for path in last if path not in leaves]
+                if not changed and not removed:
+                    return 0
+                entry: Dict[str, Any] = {
+                    "k": 0,
+                    "t": timestamp,
+                    "d": device,
+                    "c": changed,
+                }
+                if removed:
+                    entry["r"] = removed
+                line = orjson.dumps(entry)
+                self._state[device] = (leaves, keyframe_at)
+            self._file.write(line + b"\n")
+        return len(line) + 1
+
+    def listener(self, dimmer: Dimmer2, status: Status) -> None:
+        """
+        Records the snapshots of a `Dimmer2`, see `Dimmer2.add_listener`.
+
+        Parameters
+        ----------
+        dimmer : Dimmer2
+            The device.
+        status : Status
+            Its new status.
+        """
+        self.record(dimmer.ip, status)
+
+    def flush(self) -> None:
+        """
+        Flushes buffered records to the file.
+        """
+        with self._lock:
+            self._file.flush()
+
+    def close(self) -> None:
+        """
+        Closes the journal file.
+        """
+        with self._lock:
+            self._file.close()
+
+
+class JournalReader:
+    """
+    Reconstructs device states from a journal file.
+
+    The reader indexes the keyframes once, so `state_at` only replays the
+    deltas since the last keyframe before the requested time.
+
+    Attributes
+    ----------
+    path : Path
+        The journal file.
+
+    Methods
+    -------
+    devices() -> List[str]
+        Returns the devices in the journal.
+    keyframe_offset(device, timestamp) -> Optional[int]
+        Returns where replaying a device from a time has to start.
+    replay(device, start, end) -> Iterator[Tuple[float, dict]]
+        Iterates over the states of a device.
+    state_at(device, timestamp) -> Optional[dict]
+        Returns the state of a device at a time.
+    status_at(device, timestamp) -> Optional[Status]
+        Returns the parsed status of a device at a time.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """
+        Initializes the JournalReader instance.
+
+        Parameters
+        ----------
+        path : Union[str, Path]
+            The journal file.
+        """
+        self.path = Path(path)
+        # Per device, the times and file offsets of its keyframes.
+        self._keyframes: Dict[str, Tuple[List[float], List[int]]] = {}
+        offset = 0
+        with open(self.path, "rb") as file:
+            for line in file:
+                if line.startswith(KEYFRAME):
+                    entry = orjson.loads(line)
+                    times, offsets = self._keyframes.setdefault(entry["d"], ([], []))
+                    times.append(entry["t"])
+                    offsets.append(offset)
+                offset += len(line)
+
+    def devices(self) -> List[str]:
+        """
+        Returns the devices in the journal.
+
+        Returns
+        -------
+        List[str]
+            The device keys.
+        """
+        return list(self._keyframes)
+
+    def keyframe_offset(
+        self, device: str, timestamp: Optional[float] = None
+    ) -> Optional[int]:
+        """
+        Returns where replaying a device from a time has to start.
+
+        Parameters
+        ----------
+        device : str
+            The device key.
+        timestamp : Optional[float], optional
+            The time of interest, by default the first record.
+
+        Returns
+        -------
+        Optional[int]
+            The file offset of the last keyframe of the device at or before
+            ``timestamp``, or of its first keyframe; None for unknown
+            devices.
+        """
+        if device not in self._keyframes:
+            return None
+        times, offsets = self._keyframes[device]
+        if timestamp is None:
+            return offsets[0]
+        return offsets[max(0, bisect.bisect_right(times, timestamp) - 1)]
+
+    def _records(self, device: str, offset: int) -> Iterator[Dict[str, Any]]:
+        """
+        Iterates over the records of a device from a file offset on.
+        """
+        needle = orjson.dumps(device)
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            for line in file:
+                if needle in line:
+                    entry = orjson.loads(line)
+                    if entry["d"] == device:
+                        yield entry
+
+    def replay(
+        self,
+        device: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> Iterator[Tuple[float, Dict[str, Any]]]:
+        """
+        Iterates over the recorded states of a device.
+
+        Parameters
+        ----------
+        device : str
+            The device key.
+        start : Optional[float], optional
+            The earliest record of interest, by default the first.
+        end : Optional[float], optional
+            The latest record of interest, by default the last.
+
+        Yields
+        ------
+        Tuple[float, Dict[str, Any]]
+            The time of each record and the full status payload after it.
+        """
+        offset = self.keyframe_offset(device, start)
+        if offset is None:
+            return
+        leaves: Dict[str, Any] = {}
+        for entry in self._records(device, offset):
+            if end is not None and entry["t"] > end:
+                break
+            _apply(leaves, entry)
+            if start is None or entry["t"] >= start:
+                yield entry["t"], unflatten(leaves)
+
+    def state_at(self, device: str, timestamp: float) -> Optional[Dict[str, Any]]:
+        """
+        Returns the state of a device at a time.
+
+        Parameters
+        ----------
+        device : str
+            The device key.
+        timestamp : float
+            The time in seconds since the epoch.
+
+        Returns
+        -------
+        Optional[Dict[str, Any]]
+            The last status payload recorded at or before ``timestamp``, or
+            None if the device had no record yet.
+        """
+        if device not in self._keyframes:
+            return None
+        times, offsets = self._keyframes[device]
+        index = bisect.bisect_right(times, timestamp) - 1
+        if index < 0:
+            return None
+        leaves: Dict[str, Any] = {}
+        for entry in self._records(device, offsets[index]):
+            if entry["t"] > timestamp:
+                break
+            _apply(leaves, entry)
+        return unflatten(leaves)
+
+    def status_at(self, device: str, timestamp: float) -> Optional[Status]:
+        """
+        Returns the parsed status of a device at a time.
+
+        Parameters
+        ----------
+        device : str
+            The device key.
+        timestamp : float
+            The time in seconds since the epoch.
+
+        Returns
+        -------
+        Optional[Status]
+            The status, or None if the device had no record yet.
+        """
+        state = self.state_at(device, timestamp)
+        return None if state is None else Status.model_validate(state)
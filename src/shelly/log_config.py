@@ -0,0 +1,158 @@
+"""
+Log Config Module.
+
+This module provides the logging setup of the package: the custom STATUS
+and POWER levels, the rotating file sinks in the logs directory and
+`ChangeSampler`, which rate-limits per-poll records. The file sinks are
+enqueued, so polling threads only hand records to a background writer
+instead of doing file I/O themselves.
+
+`Dimmer2` applies the default setup when the first device is created,
+unless `configure_logging` was called before::
+
+    configure_logging(level="INFO")     # less verbose
+    configure_logging(directory=None)   # no log files
+"""
+
+from __future__ import annotations
+from pathlib import Path
+import sys
+import threading
+import time
+from typing import Any, List, Optional, Union
+
+from loguru import logger
+
+LOG_DIR = Path(__file__).parents[2] / "logs"
+
+logger.level("STATUS", no=15, color="<blue>")
+logger.level("POWER", no=25, color="<yellow>")
+
+_handlers: Optional[List[int]] = None
+_lock = threading.Lock()
+
+
+def configure_logging(
+    directory: Optional[Union[str, Path]] = LOG_DIR,
+    level: Union[str, int] = "DEBUG",
+    rotation: str = "10MB",
+    power_rotation: str = "20MB",
+    power_retention: int = 20,
+    enqueue: bool = True,
+    console: Optional[Union[str, int]] = None,
+) -> List[int]:
+    """
+    Sets up the log files, replacing any previous setup of this function.
+
+    Parameters
+    ----------
+    directory : Optional[Union[str, Path]], optional
+        The directory of ``dimmer2.log`` and ``dimmer_power.log``, by
+        default the logs directory of the project; None writes no files.
+    level : Union[str, int], optional
+        The minimum level of ``dimmer2.log``, by default "DEBUG".
+    rotation : str, optional
+        The size at which ``dimmer2.log`` is rotated, by default "10MB".
+    power_rotation : str, optional
+        The size at which ``dimmer_power.log`` is rotated, by default "20MB".
+    power_retention : int, optional
+        The number of rotated power logs kept, by default 20.
+    enqueue : bool, optional
+        Whether records are written by a background thread, by default True.
+    console : Optional[Union[str, int]], optional
+        The minimum level printed to standard error, by default None, which
+        prints nothing.
+
+    Returns
+    -------
+    List[int]
+        The ids of the added loguru handlers.
+    """
+    global _handlers
+    with _lock:
+        for handler in _handlers or []:
+            logger.remove(handler)
+        _handlers = []
+        if console is not None:
+            _handlers.append(logger.add(sys.stderr, level=console))
+        if directory is not None:
+            directory = Path(directory)
+            _handlers.append(
+                logger.add(
+                    directory / "dimmer2.log",
+                    rotation=rotation,
+                    level=level,
+                    enqueue=enqueue,
+                )
+            )
+            _handlers.append(
+                logger.add(
+                    directory / "dimmer_power.log",
+                    rotation=power_rotation,
+                    retention=power_retention,
+                    level="POWER",
+                    enqueue=enqueue,
+                )
+            )
+        return list(_handlers)
+
+
+def ensure_logging() -> None:
+    """
+    Applies the default setup unless logging was configured already.
+    """
+    if _handlers is None:
+        configure_logging()
+
+
+class ChangeSampler:
+    """
+    Decides whether a per-poll record is worth logging.
+
+    A value is let through when it differs from the last one let through,
+    or when ``interval`` seconds have passed since then, so an unchanged
+    device still shows up in the log now and then.
+
+    Attributes
+    ----------
+    interval : float
+        The seconds after which an unchanged value is let through again; 0
+        lets every value through.
+    """
+
+    __slots__ = ("interval", "_last", "_logged_at")
+
+    def __init__(self, interval: float = 60.0) -> None:
+        """
+        Initializes the ChangeSampler instance.
+
+        Parameters
+        ----------
+        interval : float, optional
+            The seconds after which an unchanged value is let through
+            again, by default 60.0.
+        """
+        self.interval = interval
+        self._last: Any = None
+        self._logged_at = float("-inf")
+
+    def __call__(self, value: Any) -> bool:
+        """
+        Whether a value should be logged.
+
+        Parameters
+        ----------
+        value : Any
+            The value, compared with the last one let through.
+
+        Returns
+        -------
+        bool
+            True if the value changed or the interval has passed.
+        """
+        now = time.monotonic()
+        if value == self._last and now - self._logged_at < self.interval:
+            return False
+        self._last = value
+        self._logged_at = now
+        return True
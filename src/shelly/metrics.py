@@ -0,0 +1,356 @@
+"""
+Metrics Module.
+
+This module provides the low-overhead instrumentation of the client: an
+HDR-style log-linear latency histogram and the per-device request metrics
+recorded by `Dimmer2` and `LightControl`. Recording a sample is a couple of
+integer operations and a list increment, so it is cheap enough for the
+polling hot path.
+"""
+
+from __future__ import annotations
+from itertools import accumulate
+import threading
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+COUNTERS = (
+    "requests",
+    "timeouts",
+    "http_errors",
+    "parse_errors",
+    "short_circuits",
+    "bytes_received",
+)
+
+
+class LatencyHistogram:
+    """
+    A log-linear histogram of integer values, e.g. latencies in microseconds.
+
+    Values below ``2 ** sub_bucket_bits`` are counted exactly; larger values
+    fall into buckets whose width doubles with every power of two, which
+    bounds the relative error to ``2 ** (1 - sub_bucket_bits)``.
+
+    Attributes
+    ----------
+    count : int
+        The number of recorded values.
+    total : int
+        The sum of the recorded values.
+    min : int
+        The smallest recorded value.
+    max : int
+        The largest recorded value.
+    """
+
+    __slots__ = ("_bits", "_half", "_counts", "count", "total", "min", "max")
+
+    def __init__(self, sub_bucket_bits: int = 7) -> None:
+        """
+        Initializes the LatencyHistogram instance.
+
+        Parameters
+        ----------
+        sub_bucket_bits : int, optional
+            The precision of the histogram, by default 7 (about 1.6%).
+        """
+        self._bits = sub_bucket_bits
+        self._half = 1 << (sub_bucket_bits - 1)
+        self._counts: List[int] = [0] * (1 << sub_bucket_bits)
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        """
+        Returns the bucket index of a value.
+        """
+        shift = value.bit_length() - self._bits
+        if shift <= 0:
+            return value
+        return (
+            (1 << self._bits) + (shift - 1) * self._half + (value >> shift) - self._half
+        )
+
+    def _bounds(self, index: int) -> Tuple[int, int]:
+        """
+        Returns the smallest and largest value counted in a bucket.
+        """
+        if index < (1 << self._bits):
+            return index, index
+        shift, offset = divmod(index - (1 << self._bits), self._half)
+        shift += 1
+        mantissa = offset + self._half
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+    def record(self, value: int) -> None:
+        """
+        Records a value.
+
+        Parameters
+        ----------
+        value : int
+            The value, negative values are counted as 0.
+        """
+        if value < 0:
+            value = 0
+        index = self._index(value)
+        counts = self._counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    def merge(self, other: LatencyHistogram) -> None:
+        """
+        Adds the values of another histogram with the same precision.
+
+        Parameters
+        ----------
+        other : LatencyHistogram
+            The histogram to add.
+        """
+        if other._bits != self._bits:
+            raise ValueError("Cannot merge histograms of different precision")
+        if other.count == 0:
+            return
+        if len(other._counts) > len(self._counts):
+            self._counts.extend([0] * (len(other._counts) - len(self._counts)))
+        for index, value in enumerate(other._counts):
+            self._counts[index] += value
+        self.min = other.min if self.count == 0 else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, percent: float) -> int:
+        """
+        Returns the value at or below which a percentage of values fall.
+
+        Parameters
+        ----------
+        percent : float
+            The percentage, between 0 and 100.
+
+        Returns
+        -------
+        int
+            The upper bound of the bucket holding the percentile, capped at
+            the largest recorded value; 0 if the histogram is empty.
+        """
+        if self.count == 0:
+            return 0
+        rank = max(1, round(self.count * percent / 100))
+        seen = 0
+        for index, value in enumerate(self._counts):
+            seen += value
+            if seen >= rank:
+                return min(self._bounds(index)[1], self.max)
+        return self.max
+
+    def count_at_or_below(self, value: int) -> int:
+        """
+        Returns how many recorded values fall at or below a value.
+
+        Values sharing a bucket with ``value`` are counted when the bucket
+        starts at or below it.
+
+        Parameters
+        ----------
+        value : int
+            The upper bound.
+
+        Returns
+        -------
+        int
+            The cumulative count.
+        """
+        last = min(self._index(max(0, value)), len(self._counts) - 1)
+        return sum(self._counts[: last + 1])
+
+    def cumulative(self, values: Sequence[int]) -> List[int]:
+        """
+        Returns `count_at_or_below` for several ascending values at once.
+
+        Parameters
+        ----------
+        values : Sequence[int]
+            The upper bounds, in ascending order.
+
+        Returns
+        -------
+        List[int]
+            The cumulative count at each upper bound.
+        """
+        if self.count == 0:
+            return [0] * len(values)
+        prefix = list(accumulate(self._counts))
+        last = len(prefix) - 1
+        return [prefix[min(self._index(max(0, value)), last)] for value in values]
+
+    def buckets(self) -> Iterator[Tuple[int, int]]:
+        """
+        Iterates over the non-empty buckets.
+
+        Yields
+        ------
+        Tuple[int, int]
+            The upper bound and count of each non-empty bucket.
+        """
+        for index, value in enumerate(self._counts):
+            if value:
+                yield self._bounds(index)[1], value
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Returns the summary statistics of the histogram.
+
+        Returns
+        -------
+        Dict[str, float]
+            The count, mean, min, max and common percentiles.
+        """
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+            "max": self.max,
+        }
+
+
+class DeviceMetrics:
+    """
+    The request metrics of a single device.
+
+    Attributes
+    ----------
+    latency : Dict[str, LatencyHistogram]
+        The request latency in microseconds, keyed by endpoint.
+    counters : Dict[str, int]
+        The request, timeout, HTTP error, parse error, short circuit and
+        received byte counters.
+
+    Methods
+    -------
+    observe(endpoint, elapsed_ns, size)
+        Records a completed request.
+    increment(counter)
+        Increments a counter.
+    cumulative(bounds_us) -> tuple
+        Returns the counters and cumulative latency counts.
+    snapshot() -> dict
+        Returns a consistent copy of all metrics.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes the DeviceMetrics instance.
+        """
+        self._lock = threading.Lock()
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.counters: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+
+    def observe(self, endpoint: str, elapsed_ns: int, size: int = 0) -> None:
+        """
+        Records a completed request.
+
+        Parameters
+        ----------
+        endpoint : str
+            The endpoint, e.g. "status" or "light/0".
+        elapsed_ns : int
+            The request latency in nanoseconds.
+        size : int, optional
+            The size of the response body in bytes, by default 0.
+        """
+        with self._lock:
+            histogram = self.latency.get(endpoint)
+            if histogram is None:
+                histogram = self.latency[endpoint] = LatencyHistogram()
+            histogram.record(elapsed_ns // 1000)
+            self.counters["requests"] += 1
+            self.counters["bytes_received"] += size
+
+    def increment(self, counter: str) -> None:
+        """
+        Increments a counter.
+
+        Parameters
+        ----------
+        counter : str
+            One of `COUNTERS`.
+        """
+        with self._lock:
+            self.counters[counter] += 1
+
+    def histograms(self) -> Dict[str, LatencyHistogram]:
+        """
+        Returns copies of the latency histograms.
+
+        Returns
+        -------
+        Dict[str, LatencyHistogram]
+            The histograms, keyed by endpoint.
+        """
+        with self._lock:
+            copies = {}
+            for endpoint, histogram in self.latency.items():
+                copies[endpoint] = LatencyHistogram(histogram._bits)
+                copies[endpoint].merge(histogram)
+            return copies
+
+    def cumulative(
+        self, bounds_us: Sequence[int]
+    ) -> Tuple[Dict[str, int], Dict[str, Tuple[List[int], int, int]]]:
+        """
+        Returns the counters and cumulative latency counts, as exported.
+
+        Parameters
+        ----------
+        bounds_us : Sequence[int]
+            The ascending upper bounds of the buckets in microseconds.
+
+        Returns
+        -------
+        Tuple[Dict[str, int], Dict[str, Tuple[List[int], int, int]]]
+            A copy of the counters and, per endpoint, the cumulative counts
+            at each bound, the total count and the sum in microseconds.
+        """
+        with self._lock:
+            return dict(self.counters), {
+                endpoint: (
+                    histogram.cumulative(bounds_us),
+                    histogram.count,
+                    histogram.total,
+                )
+                for endpoint, histogram in self.latency.items()
+            }
+
+    def snapshot(self) -> dict:
+        """
+        Returns a consistent copy of all metrics.
+
+        Returns
+        -------
+        dict
+            The counters and, per endpoint, the latency summary in
+            microseconds.
+        """
+        with self._lock:
+            return {
+                **self.counters,
+                "latency_us": {
+                    endpoint: histogram.snapshot()
+                    for endpoint, histogram in self.latency.items()
+                },
+            }
@@ -0,0 +1,177 @@
+"""
+MQTT Commands Module.
+
+This module provides the MQTT command transport of `LightControl`. Commands
+are published as JSON to ``shellies/<id>/light/0/set`` over the broker
+connection of an `MQTTIngest`, and the ``light/0/status`` message the
+device publishes after applying a command serves as its acknowledgement.
+Gen1 devices do not echo a request id, so a status message acknowledges
+the oldest pending command of the device whose requested state it shows.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+import threading
+from typing import Callable, Dict, List, Optional, Union
+
+import orjson
+
+from .mqtt_ingest import MQTTIngest, ShellyMessage
+
+Command = Dict[str, Union[str, int]]
+
+
+class CommandError(Exception):
+    """
+    Raised when an MQTT command could not be delivered or acknowledged.
+    """
+
+
+class CommandTimeout(CommandError, TimeoutError):
+    """
+    Raised when a device did not acknowledge an MQTT command in time.
+    """
+
+
+@dataclass(eq=False)
+class _Pending:
+    """
+    A command waiting for its acknowledgement.
+    """
+
+    command: Command
+    event: threading.Event = field(default_factory=threading.Event)
+    state: Optional[dict] = None
+
+
+def acknowledges(command: Command, state: dict) -> bool:
+    """
+    Whether a ``light/0/status`` payload shows the result of a command.
+
+    Parameters
+    ----------
+    command : Command
+        The command, e.g. ``{"turn": "on", "brightness": 40}``.
+    state : dict
+        The light status published by the device.
+
+    Returns
+    -------
+    bool
+        True if the state matches every field of the command that the
+        status reports; a toggle matches any state.
+    """
+    turn = command.get("turn")
+    if turn in ("on", "off") and state.get("ison") != (turn == "on"):
+        return False
+    brightness = command.get("brightness")
+    if brightness is not None and state.get("brightness") != max(
+        0, min(100, int(brightness))
+    ):
+        return False
+    return True
+
+
+class MQTTCommandTransport:
+    """
+    Sends light commands over MQTT and waits for their acknowledgement.
+
+    Attributes
+    ----------
+    ingest : MQTTIngest
+        The ingestion whose broker connection carries the commands and
+        their acknowledgements.
+    timeout : float
+        The seconds to wait for an acknowledgement.
+
+    Methods
+    -------
+    send(device_id, command) -> dict
+        Sends a command and returns the acknowledged light state.
+    """
+
+    def __init__(
+        self,
+        ingest: MQTTIngest,
+        timeout: float = 1.0,
+        publish: Optional[Callable[[str, bytes], object]] = None,
+    ) -> None:
+        """
+        Initializes the MQTTCommandTransport instance.
+
+        Parameters
+        ----------
+        ingest : MQTTIngest
+            The ingestion providing the broker connection.
+        timeout : float, optional
+            The seconds to wait for an acknowledgement, by default 1.0.
+        publish : Optional[Callable[[str, bytes], object]], optional
+            Publishes a message, by default the ``publish`` method of the
+            MQTT client of ``ingest``.
+        """
+        self.ingest = ingest
+        self.timeout = timeout
+        self._publish = publish or ingest.client.publish
+        self._pending: Dict[str, List[_Pending]] = {}
+        self._lock = threading.Lock()
+        ingest.subscribe(f"{ingest.prefix}/+/light/0/status", self._on_status)
+
+    def send(self, device_id: str, command: Command) -> dict:
+        """
+        Sends a command and returns the acknowledged light state.
+
+        Parameters
+        ----------
+        device_id : str
+            The MQTT id of the device, e.g. ``shellydimmer2-EC64C9C2EFE2``.
+        command : Command
+            The command, with the parameters of ``/light/0``.
+
+        Returns
+        -------
+        dict
+            The ``light/0/status`` payload acknowledging the command.
+
+        Raises
+        ------
+        CommandError
+            If the command could not be published.
+        CommandTimeout
+            If the device did not acknowledge the command in time.
+        """
+        pending = _Pending(command)
+        with self._lock:
+            self._pending.setdefault(device_id, []).append(pending)
+        try:
+            info = self._publish(
+                f"{self.ingest.prefix}/{device_id}/light/0/set", orjson.dumps(command)
+            )
+            if getattr(info, "rc", 0):
+                raise CommandError(
+                    f"Publishing to {device_id} failed with rc {info.rc}"
+                )
+            if not pending.event.wait(self.timeout):
+                raise CommandTimeout(f"{device_id} did not acknowledge {command}")
+            assert pending.state is not None
+            return pending.state
+        finally:
+            with self._lock:
+                waiting = self._pending.get(device_id, [])
+                if pending in waiting:
+                    waiting.remove(pending)
+                if not waiting:
+                    self._pending.pop(device_id, None)
+
+    def _on_status(self, message: ShellyMessage) -> None:
+        """
+        Acknowledges the oldest pending command the status shows the result of.
+        """
+        state = message.value
+        if not isinstance(state, dict):
+            return
+        with self._lock:
+            for pending in self._pending.get(message.device_id, ()):
+                if not pending.event.is_set() and acknowledges(pending.command, state):
+                    pending.state = state
+                    pending.event.set()
+                    return
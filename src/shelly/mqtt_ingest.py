@@ -0,0 +1,390 @@
+"""
+MQTT Ingest Module.
+
+This module provides the MQTT ingestion of a whole fleet over one broker
+connection. `MQTTIngest` subscribes with a handful of wildcard topics
+(``shellies/+/light/0/#``, ``shellies/+/input/+``, ...) instead of one
+topic per device, parses each payload straight from bytes according to its
+Shelly topic and dispatches it through a `TopicTrie` to the handlers
+registered for the device. Topic lookups are cached, so a message costs a
+dict lookup, one parse and the handler calls::
+
+    ingest = MQTTIngest()
+    ingest.add_handler("shellydimmer2-EC64C9C2EFE2", print)
+    ingest.connect("192.168.1.8")
+"""
+
+from __future__ import annotations
+import threading
+from typing import Any, Callable, Dict, Generic, List, NamedTuple, Optional, TypeVar
+
+import orjson
+from loguru import logger
+from paho.mqtt.client import Client, MQTTMessage
+from paho.mqtt.enums import CallbackAPIVersion  # type: ignore
+
+T = TypeVar("T")
+
+# The topics published by Shelly Gen1 devices below ``shellies/<id>/``.
+SUBSCRIPTIONS = (
+    "light/0/#",
+    "input/+",
+    "input_event/+",
+    "longpush/+",
+    "temperature",
+    "temperature_f",
+    "overtemperature",
+    "overpower",
+    "loaderror",
+    "online",
+)
+
+MAX_CACHED_TOPICS = 65536
+
+
+class TopicTrie(Generic[T]):
+    """
+    Maps MQTT topic patterns with ``+`` and ``#`` wildcards to values.
+
+    Patterns are stored level by level, so matching a topic walks the trie
+    once instead of testing every pattern. Results are cached per topic
+    until the trie changes.
+
+    Methods
+    -------
+    add(pattern, value)
+        Adds a value for a pattern.
+    remove(pattern, value)
+        Removes a value from a pattern.
+    match(topic) -> List[T]
+        Returns the values of all patterns matching a topic.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes the TopicTrie instance.
+        """
+        self._root: Dict[str, Any] = {}
+        self._cache: Dict[str, List[T]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, pattern: str, value: T) -> None:
+        """
+        Adds a value for a pattern.
+
+        Parameters
+        ----------
+        pattern : str
+            The topic pattern, e.g. ``shellies/+/light/0/#``.
+        value : T
+            The value.
+        """
+        with self._lock:
+            node = self._root
+            for level in pattern.split("/"):
+                node = node.setdefault(level, {})
+            node.setdefault("", []).append(value)
+            self._cache = {}
+
+    def remove(self, pattern: str, value: T) -> None:
+        """
+        Removes a value from a pattern.
+
+        Parameters
+        ----------
+        pattern : str
+            The topic pattern.
+        value : T
+            The value.
+        """
+        with self._lock:
+            node: Optional[Dict[str, Any]] = self._root
+            for level in pattern.split("/"):
+                node = node.get(level) if node is not None else None
+            if node is not None and value in node.get("", []):
+                node[""].remove(value)
+            self._cache = {}
+
+    def match(self, topic: str) -> List[T]:
+        """
+        Returns the values of all patterns matching a topic.
+
+        Parameters
+        ----------
+        topic : str
+            The topic of a message, without wildcards.
+
+        Returns
+        -------
+        List[T]
+            The values, in no particular order.
+        """
+        cache = self._cache
+        values = cache.get(topic)
+        if values is not None:
+            return values
+        values = []
+        levels = topic.split("/")
+        nodes = [self._root]
+        for level in levels:
+            following = []
+            for node in nodes:
+                if "#" in node:
+                    values.extend(node["#"].get("", ()))
+                if level in node:
+                    following.append(node[level])
+                if "+" in node:
+                    following.append(node["+"])
+            nodes = following
+            if not nodes:
+                break
+        for node in nodes:
+            values.extend(node.get("", ()))
+            # "a/#" also matches "a" itself.
+            if "#" in node:
+                values.extend(node["#"].get("", ()))
+        if len(cache) < MAX_CACHED_TOPICS:
+            cache[topic] = values
+        return values
+
+
+def _flag(payload: bytes) -> bool:
+    """
+    Parses a ``0``/``1`` or ``true``/``false`` payload.
+    """
+    return payload in (b"1", b"true")
+
+
+# How the payloads of each device topic are parsed.
+PARSERS: TopicTrie[Callable[[bytes], Any]] = TopicTrie()
+for _pattern, _parser in (
+    ("light/0", lambda payload: payload == b"on"),
+    ("light/0/status", orjson.loads),
+    ("light/0/power", float),
+    ("light/0/energy", float),
+    ("input/+", _flag),
+    ("input_event/+", orjson.loads),
+    ("longpush/+", _flag),
+    ("temperature", float),
+    ("temperature_f", float),
+    ("overtemperature", _flag),
+    ("overpower", _flag),
+    ("loaderror", int),
+    ("online", _flag),
+):
+    PARSERS.add(_pattern, _parser)
+
+
+class ShellyMessage(NamedTuple):
+    """
+    A parsed message of a Shelly device.
+
+    Attributes
+    ----------
+    device_id : str
+        The MQTT id of the device, e.g. ``shellydimmer2-EC64C9C2EFE2``.
+    subtopic : str
+        The topic below the device, e.g. ``light/0/power``.
+    value : Any
+        The parsed payload: a bool, number or dict depending on the topic,
+        or the raw bytes of unknown topics.
+    payload : bytes
+        The raw payload.
+    """
+
+    device_id: str
+    subtopic: str
+    value: Any
+    payload: bytes
+
+
+def parse_message(
+    topic: str, payload: bytes, prefix: str = "shellies"
+) -> Optional[ShellyMessage]:
+    """
+    Parses a message published by a Shelly device.
+
+    Parameters
+    ----------
+    topic : str
+        The topic, e.g. ``shellies/shellydimmer2-EC64C9C2EFE2/light/0/power``.
+    payload : bytes
+        The raw payload.
+    prefix : str, optional
+        The topic prefix of the devices, by default "shellies".
+
+    Returns
+    -------
+    Optional[ShellyMessage]
+        The message, or None if the topic does not belong to a device.
+    """
+    root, _, rest = topic.partition("/")
+    device_id, _, subtopic = rest.partition("/")
+    if root != prefix or not subtopic:
+        return None
+    parsers = PARSERS.match(subtopic)
+    value: Any = payload
+    if parsers:
+        try:
+            value = parsers[0](payload)
+        except ValueError:
+            logger.debug("Unparsable payload on {}: {!r}", topic, payload)
+    return ShellyMessage(device_id, subtopic, value, payload)
+
+
+Handler = Callable[[ShellyMessage], None]
+
+
+class MQTTIngest:
+    """
+    Receives the MQTT messages of a fleet and dispatches them per device.
+
+    Attributes
+    ----------
+    prefix : str
+        The topic prefix of the devices.
+    client : Client
+        The MQTT client.
+    received : int
+        The number of messages received.
+
+    Methods
+    -------
+    add_handler(device_id, handler)
+        Registers a handler for the messages of a device.
+    remove_handler(device_id, handler)
+        Unregisters a handler.
+    subscribe(pattern, handler)
+        Registers a handler for an arbitrary topic pattern.
+    dispatch(topic, payload) -> int
+        Parses a message and calls its handlers.
+    connect(host, port)
+        Connects to the broker and starts receiving in the background.
+    disconnect()
+        Stops receiving and disconnects.
+    """
+
+    def __init__(
+        self, prefix: str = "shellies", client: Optional[Client] = None
+    ) -> None:
+        """
+        Initializes the MQTTIngest instance.
+
+        Parameters
+        ----------
+        prefix : str, optional
+            The topic prefix of the devices, by default "shellies".
+        client : Optional[Client], optional
+            The MQTT client to use, by default a new one.
+        """
+        self.prefix = prefix
+        self.client = client or Client(CallbackAPIVersion.VERSION1)
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.received = 0
+        self._handlers: TopicTrie[Handler] = TopicTrie()
+
+    def add_handler(self, device_id: Optional[str], handler: Handler) -> None:
+        """
+        Registers a handler for the messages of a device.
+
+        Parameters
+        ----------
+        device_id : Optional[str]
+            The MQTT id of the device, or None for every device.
+        handler : Callable[[ShellyMessage], None]
+            Called with every parsed message of the device.
+        """
+        self._handlers.add(f"{self.prefix}/{device_id or '+'}/#", handler)
+
+    def remove_handler(self, device_id: Optional[str], handler: Handler) -> None:
+        """
+        Unregisters a handler.
+
+        Parameters
+        ----------
+        device_id : Optional[str]
+            The MQTT id the handler was registered for.
+        handler : Callable[[ShellyMessage], None]
+            The handler.
+        """
+        self._handlers.remove(f"{self.prefix}/{device_id or '+'}/#", handler)
+
+    def subscribe(self, pattern: str, handler: Handler) -> None:
+        """
+        Registers a handler for an arbitrary topic pattern.
+
+        The pattern is only used for dispatching; the broker subscriptions
+        cover the device topics in `SUBSCRIPTIONS`.
+
+        Parameters
+        ----------
+        pattern : str
+            The topic pattern, e.g. ``shellies/+/light/0/power``.
+        handler : Callable[[ShellyMessage], None]
+            Called with every parsed message matching the pattern.
+        """
+        self._handlers.add(pattern, handler)
+
+    def dispatch(self, topic: str, payload: bytes) -> int:
+        """
+        Parses a message and calls its handlers.
+
+        Parameters
+        ----------
+        topic : str
+            The topic of the message.
+        payload : bytes
+            The raw payload.
+
+        Returns
+        -------
+        int
+            The number of handlers called.
+        """
+        self.received += 1
+        handlers = self._handlers.match(topic)
+        if not handlers:
+            return 0
+        message = parse_message(topic, payload, self.prefix)
+        if message is None:
+            return 0
+        for handler in handlers:
+            try:
+                handler(message)
+            except Exception:
+                logger.exception("MQTT handler {} failed on {}", handler, topic)
+        return len(handlers)
+
+    def connect(self, host: str, port: int = 1883) -> None:
+        """
+        Connects to the broker and starts receiving in the background.
+
+        Parameters
+        ----------
+        host : str
+            The broker address.
+        port : int, optional
+            The broker port, by default 1883.
+        """
+        self.client.connect(host, port)
+        self.client.loop_start()
+
+    def disconnect(self) -> None:
+        """
+        Stops receiving and disconnects.
+        """
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def _on_connect(self, client: Client, userdata, flags, reason_code) -> None:
+        """
+        Subscribes to the device topics with one request.
+        """
+        client.subscribe([(f"{self.prefix}/+/{topic}", 0) for topic in SUBSCRIPTIONS])
+
+    def _on_message(self, client: Client, userdata, message: MQTTMessage) -> None:
+        """
+        Dispatches a received message.
+        """
+        self.dispatch(message.topic, message.payload)
@@ -0,0 +1,188 @@
+"""
+Request Queue Module.
+
+This module provides the per-device request scheduling of `Dimmer2`. The
+embedded HTTP server of a Dimmer2 copes with very few concurrent
+connections, while the status loop, user commands and ad-hoc queries may
+all want to talk to it at once from different threads. `RequestQueue`
+caps the requests in flight per device, lets the waiting request of the
+highest `Priority` go next, so a command never waits behind a backlog of
+polls, and merges identical queued polls into one request whose response
+is shared.
+
+Requests are run on the calling threads; the queue only decides when
+each thread may send its request.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+from enum import IntEnum
+import heapq
+import itertools
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class Priority(IntEnum):
+    """
+    The priorities of device requests; lower values go first.
+    """
+
+    command = 0
+    query = 1
+    poll = 2
+
+
+@dataclass(eq=False)
+class _Ticket:
+    """
+    A request waiting for, or holding, an in-flight slot.
+    """
+
+    key: Optional[Hashable] = None
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Any = None
+    error: Optional[BaseException] = None
+
+
+class RequestQueue:
+    """
+    Schedules the requests to one device.
+
+    Attributes
+    ----------
+    max_in_flight : int
+        The maximum number of requests sent to the device at the same time.
+    merged : int
+        The number of requests that shared the response of a queued one.
+
+    Methods
+    -------
+    run(fn, priority, key) -> T
+        Runs a request once it is its turn.
+    snapshot() -> dict
+        Returns the number of queued and in-flight requests.
+    """
+
+    def __init__(self, max_in_flight: int = 1) -> None:
+        """
+        Initializes the RequestQueue instance.
+
+        Parameters
+        ----------
+        max_in_flight : int, optional
+            The maximum number of requests sent at the same time, by
+            default 1.
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.max_in_flight = max_in_flight
+        self.merged = 0
+        self._condition = threading.Condition()
+        # A heap of (priority, arrival, ticket).
+        self._waiting: List[Tuple[int, int, _Ticket]] = []
+        self._queued: Dict[Hashable, _Ticket] = {}
+        self._in_flight = 0
+        self._sequence = itertools.count()
+
+    def run(
+        self,
+        fn: Callable[[], T],
+        priority: Priority = Priority.query,
+        key: Optional[Hashable] = None,
+    ) -> T:
+        """
+        Runs a request once a slot is free and no request of a higher
+        priority, or an earlier one of the same priority, is waiting.
+
+        Parameters
+        ----------
+        fn : Callable[[], T]
+            Sends the request.
+        priority : Priority, optional
+            The priority of the request, by default `Priority.query`.
+        key : Optional[Hashable], optional
+            Identifies idempotent requests, e.g. status polls. While a
+            request with the same key is queued, the call waits for it and
+            returns its result instead of queueing another one.
+
+        Returns
+        -------
+        T
+            The result of ``fn``, or of the merged request.
+
+        Raises
+        ------
+        Exception
+            Whatever ``fn``, or the merged request, raised.
+        """
+        with self._condition:
+            queued = self._queued.get(key) if key is not None else None
+            if queued is not None:
+                self.merged += 1
+                ticket = queued
+            else:
+                ticket = _Ticket(key)
+                heapq.heappush(self._waiting, (priority, next(self._sequence), ticket))
+                if key is not None:
+                    self._queued[key] = ticket
+                try:
+                    while (
+                        self._in_flight >= self.max_in_flight
+                        or self._waiting[0][2] is not ticket
+                    ):
+                        self._condition.wait()
+                except BaseException as error:
+                    # An interrupted wait must not stay at the head of the
+                    # queue, or every later request would wait forever.
+                    self._waiting = [
+                        entry for entry in self._waiting if entry[2] is not ticket
+                    ]
+                    heapq.heapify(self._waiting)
+                    if key is not None:
+                        del self._queued[key]
+                    ticket.error = error
+                    ticket.done.set()
+                    self._condition.notify_all()
+                    raise
+                heapq.heappop(self._waiting)
+                if key is not None:
+                    # Requests arriving from now on get a fresh response.
+                    del self._queued[key]
+                self._in_flight += 1
+                # With several slots, the next request may start right away.
+                self._condition.notify_all()
+        if queued is not None:
+            ticket.done.wait()
+        else:
+            try:
+                ticket.result = fn()
+            except BaseException as error:
+                ticket.error = error
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                    self._condition.notify_all()
+                ticket.done.set()
+        if ticket.error is not None:
+            raise ticket.error
+        return ticket.result
+
+    def snapshot(self) -> dict:
+        """
+        Returns the number of queued and in-flight requests.
+
+        Returns
+        -------
+        dict
+            The "queued" and "in_flight" request counts and the "merged"
+            counter.
+        """
+        with self._condition:
+            return {
+                "queued": len(self._waiting),
+                "in_flight": self._in_flight,
+                "merged": self.merged,
+            }
@@ -0,0 +1,560 @@
+"""
+Schedule Store Module.
+
+This module provides a SQLite-backed store for scheduled events. Every
+schedule is persisted together with its next fire time, which is indexed
+per device so that a scheduler only has to read the rows that are due
+instead of re-evaluating every rule on start-up and on every tick.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+
+import orjson
+import pendulum
+from pendulum import Date, Duration, Time
+from pendulum.datetime import DateTime
+from pendulum.day import WeekDay as PDWeekDay
+
+from .clock import Clock, system_clock
+from .scheduling import (
+    DayOfMonth,
+    Repeater,
+    ScheduledEvent,
+    WeekOfMonth,
+    When,
+    parse_action,
+    tz,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedules (
+    id INTEGER PRIMARY KEY,
+    device TEXT NOT NULL,
+    action TEXT NOT NULL,
+    spec BLOB NOT NULL,
+    catch_up TEXT NOT NULL,
+    next_fire REAL,
+    last_fire REAL,
+    priority INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS schedules_next_fire
+    ON schedules (next_fire) WHERE next_fire IS NOT NULL;
+CREATE INDEX IF NOT EXISTS schedules_device_next_fire
+    ON schedules (device, next_fire) WHERE next_fire IS NOT NULL;
+"""
+
+MAX_CATCH_UP = 100
+
+
+class CatchUp(Enum):
+    """
+    What to do with runs that were missed while the process was down.
+
+    Attributes
+    ----------
+    skip
+        Drop missed runs and wait for the next regular run.
+    once
+        Fire a single run for any number of missed runs.
+    all
+        Fire every missed run, up to `MAX_CATCH_UP` runs per schedule.
+    """
+
+    skip = "skip"
+    once = "once"
+    all = "all"
+
+
+@dataclass
+class StoredSchedule:
+    """
+    A schedule row as read back from the store.
+
+    Attributes
+    ----------
+    id : int
+        The row id of the schedule.
+    device : str
+        The key of the device the schedule targets.
+    action : str
+        The action to perform, see `scheduling.parse_action`.
+    when : When
+        The schedule itself.
+    catch_up : CatchUp
+        The policy for runs missed while the process was down.
+    next_fire : DateTime, optional
+        The next time the schedule fires, None once it is finished.
+    last_fire : DateTime, optional
+        The last time the schedule fired.
+    priority : int
+        The precedence of the schedule when merged with other schedules
+        due for the same device at the same time.
+    """
+
+    id: int
+    device: str
+    action: str
+    when: When
+    catch_up: CatchUp
+    next_fire: Optional[DateTime]
+    last_fire: Optional[DateTime]
+    priority: int = 0
+
+
+def _encode_moment(value: Optional[Union[DateTime, Date]]) -> Optional[str]:
+    return None if value is None else value.isoformat()
+
+
+def _decode_moment(value: Optional[str]) -> Optional[Union[DateTime, Date]]:
+    if value is None:
+        return None
+    parsed = pendulum.parse(value, exact=True)
+    assert isinstance(parsed, (DateTime, Date))
+    return parsed
+
+
+def _encode_when(when: When) -> bytes:
+    """
+    Serializes a `When` and its `Repeater` into a compact JSON document.
+    """
+    spec: Dict[str, object] = {
+        "time": [when.time.hour, when.time.minute, when.time.second],
+        "start": _encode_moment(when.start),
+        "end": _encode_moment(when.end),
+    }
+    repeater = when.repeater
+    if repeater is not None:
+        interval = repeater.interval
+        if isinstance(interval, Duration):
+            encoded: Dict[str, object] = {"seconds": interval.total_seconds()}
+        elif isinstance(interval, PDWeekDay):
+            encoded = {"weekday": int(interval)}
+        elif isinstance(interval, DayOfMonth):
+            encoded = {"day_of_month": interval.day}
+        else:
+            raise ValueError(f"Invalid interval: {interval}")
+        spec["repeater"] = {
+            "interval": encoded,
+            "start": _encode_moment(repeater.start),
+            "expires": _encode_moment(repeater.expires),
+            "week_of_month": (
+                None if repeater.week_of_month is None else repeater.week_of_month.value
+            ),
+        }
+    return orjson.dumps(spec)
+
+
+def _decode_when(data: bytes, clock: Clock = system_clock) -> When:
+    """
+    Rebuilds a `When` from the document written by `_encode_when`, reading
+    time from ``clock``.
+    """
+    spec = orjson.loads(data)
+    repeater = None
+    if spec.get("repeater") is not None:
+        encoded = spec["repeater"]
+        interval: Union[Duration, PDWeekDay, DayOfMonth]
+        if "seconds" in encoded["interval"]:
+            interval = pendulum.duration(seconds=encoded["interval"]["seconds"])
+        elif "weekday" in encoded["interval"]:
+            interval = PDWeekDay(encoded["interval"]["weekday"])
+        else:
+            interval = DayOfMonth(encoded["interval"]["day_of_month"])
+        week_of_month = encoded.get("week_of_month")
+        repeater = Repeater(
+            interval=interval,
+            start=_decode_moment(encoded.get("start")),
+            expires=_decode_moment(encoded.get("expires")),
+            week_of_month=None if week_of_month is None else WeekOfMonth(week_of_month),
+            clock=clock,
+        )
+    start = _decode_moment(spec.get("start"))
+    end = _decode_moment(spec.get("end"))
+    return When(
+        time=Time(*spec["time"]),
+        start=start if isinstance(start, DateTime) else None,
+        end=end if isinstance(end, DateTime) else None,
+        repeater=repeater,
+        clock=clock,
+    )
+
+
+def _timestamp(value: Optional[DateTime]) -> Optional[float]:
+    return None if value is None else value.timestamp()
+
+
+def _from_timestamp(value: Optional[float]) -> Optional[DateTime]:
+    return None if value is None else pendulum.from_timestamp(value, tz=tz)
+
+
+class ScheduleStore:
+    """
+    Persists schedules in SQLite, indexed by their next fire time.
+
+    Attributes
+    ----------
+    path : str
+        The database path, ``":memory:"`` for a throw-away store.
+    clock : Clock
+        The clock of the schedules read back from the database.
+
+    Methods
+    -------
+    add(device, when, action, catch_up, after, priority) -> int
+        Persists a schedule and computes its first fire time.
+    add_event(event, catch_up, after) -> int
+        Persists a `ScheduledEvent`, keyed by the IP of its dimmer.
+    due(until, device) -> List[StoredSchedule]
+        Reads the schedules that fire at or before ``until``.
+    mark_fired(schedule_id, fired_at) -> Optional[DateTime]
+        Records a run and advances the schedule to its next fire time.
+    recover(now) -> List[Tuple[StoredSchedule, DateTime]]
+        Applies the catch-up policies to runs missed while down.
+    """
+
+    def __init__(
+        self, path: Union[str, Path] = ":memory:", clock: Optional[Clock] = None
+    ) -> None:
+        """
+        Opens, and if needed creates, the schedule database.
+
+        Parameters
+        ----------
+        path : Union[str, Path], optional
+            The database file, by default an in-memory database.
+        clock : Clock, optional
+            The clock of the schedules read back from the database, by
+            default the wall clock.
+        """
+        self.path = str(path)
+        self._clock: Clock = clock or system_clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._whens: Dict[int, When] = {}
+
+    @property
+    def clock(self) -> Clock:
+        """
+        Gets the clock of the schedules read back from the database.
+
+        Returns
+        -------
+        Clock
+            The clock.
+        """
+        return self._clock
+
+    @clock.setter
+    def clock(self, clock: Clock) -> None:
+        """
+        Sets the clock, decoding the stored schedules again on next read.
+
+        Parameters
+        ----------
+        clock : Clock
+            The new clock.
+        """
+        if clock is not self._clock:
+            self._clock = clock
+            self._whens.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM schedules").fetchone()
+        return count
+
+    def close(self) -> None:
+        """
+        Closes the underlying database connection.
+        """
+        with self._lock:
+            self._db.close()
+
+    def add(
+        self,
+        device: str,
+        when: When,
+        action: str,
+        catch_up: CatchUp = CatchUp.once,
+        after: Optional[DateTime] = None,
+        priority: int = 0,
+    ) -> int:
+        """
+        Persists a schedule and computes its first fire time.
+
+        Parameters
+        ----------
+        device : str
+            The key of the device the schedule targets.
+        when : When
+            The schedule.
+        action : str
+            The action to perform.
+        catch_up : CatchUp, optional
+            The policy for missed runs, by default `CatchUp.once`.
+        after : DateTime, optional
+            The moment to compute the first fire time from, by default now.
+        priority : int, optional
+            The precedence when merged with other due schedules, by default 0.
+
+        Returns
+        -------
+        int
+            The id of the stored schedule.
+
+        Raises
+        ------
+        ValueError
+            If the action is invalid, see `scheduling.parse_action`.
+        """
+        parse_action(action)
+        next_fire = when.next_run(after)
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO schedules"
+                " (device, action, spec, catch_up, next_fire, priority)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    device,
+                    action,
+                    _encode_when(when),
+                    catch_up.value,
+                    _timestamp(next_fire),
+                    priority,
+                ),
+            )
+        schedule_id = cursor.lastrowid
+        assert schedule_id is not None
+        self._whens[schedule_id] = when
+        return schedule_id
+
+    def add_event(
+        self,
+        event: ScheduledEvent,
+        catch_up: CatchUp = CatchUp.once,
+        after: Optional[DateTime] = None,
+    ) -> int:
+        """
+        Persists a `ScheduledEvent`, keyed by the IP of its dimmer.
+
+        Parameters
+        ----------
+        event : ScheduledEvent
+            The event to persist.
+        catch_up : CatchUp, optional
+            The policy for missed runs, by default `CatchUp.once`.
+        after : DateTime, optional
+            The moment to compute the first fire time from, by default now.
+
+        Returns
+        -------
+        int
+            The id of the stored schedule.
+        """
+        return self.add(
+            event.dimmer.ip, event.when, event.action, catch_up, after, event.priority
+        )
+
+    def remove(self, schedule_id: int) -> None:
+        """
+        Deletes a schedule.
+
+        Parameters
+        ----------
+        schedule_id : int
+            The id of the schedule.
+        """
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,))
+        self._whens.pop(schedule_id, None)
+
+    def get(self, schedule_id: int) -> Optional[StoredSchedule]:
+        """
+        Reads a single schedule.
+
+        Parameters
+        ----------
+        schedule_id : int
+            The id of the schedule.
+
+        Returns
+        -------
+        Optional[StoredSchedule]
+            The schedule, or None if it does not exist.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM schedules WHERE id = ?", (schedule_id,)
+            ).fetchone()
+        return None if row is None else self._row(row)
+
+    def due(
+        self, until: DateTime, device: Optional[str] = None
+    ) -> List[StoredSchedule]:
+        """
+        Reads the schedules that fire at or before ``until``.
+
+        Parameters
+        ----------
+        until : DateTime
+            The end of the due window.
+        device : str, optional
+            Restricts the window to a single device.
+
+        Returns
+        -------
+        List[StoredSchedule]
+            The due schedules, ordered by fire time.
+        """
+        if device is None:
+            query = (
+                "SELECT * FROM schedules WHERE next_fire IS NOT NULL"
+                " AND next_fire <= ? ORDER BY next_fire, id"
+            )
+            params: Tuple = (until.timestamp(),)
+        else:
+            query = (
+                "SELECT * FROM schedules WHERE device = ? AND next_fire IS NOT NULL"
+                " AND next_fire <= ? ORDER BY next_fire, id"
+            )
+            params = (device, until.timestamp())
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [self._row(row) for row in rows]
+
+    def next_fire_time(self, device: Optional[str] = None) -> Optional[DateTime]:
+        """
+        Reads the earliest pending fire time.
+
+        Parameters
+        ----------
+        device : str, optional
+            Restricts the lookup to a single device.
+
+        Returns
+        -------
+        Optional[DateTime]
+            The earliest fire time, or None if nothing is pending.
+        """
+        with self._lock:
+            if device is None:
+                (value,) = self._db.execute(
+                    "SELECT MIN(next_fire) FROM schedules WHERE next_fire IS NOT NULL"
+                ).fetchone()
+            else:
+                (value,) = self._db.execute(
+                    "SELECT MIN(next_fire) FROM schedules"
+                    " WHERE device = ? AND next_fire IS NOT NULL",
+                    (device,),
+                ).fetchone()
+        return _from_timestamp(value)
+
+    def mark_fired(self, schedule_id: int, fired_at: DateTime) -> Optional[DateTime]:
+        """
+        Records a run and advances the schedule to its next fire time.
+
+        Parameters
+        ----------
+        schedule_id : int
+            The id of the schedule.
+        fired_at : DateTime
+            The moment the schedule fired; the next fire time is the first
+            run strictly after it.
+
+        Returns
+        -------
+        Optional[DateTime]
+            The new next fire time, or None if the schedule is finished.
+        """
+        schedule = self.get(schedule_id)
+        if schedule is None:
+            raise KeyError(schedule_id)
+        next_fire = schedule.when.next_run(fired_at)
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE schedules SET next_fire = ?, last_fire = ? WHERE id = ?",
+                (_timestamp(next_fire), fired_at.timestamp(), schedule_id),
+            )
+        return next_fire
+
+    def recover(self, now: DateTime) -> List[Tuple[StoredSchedule, DateTime]]:
+        """
+        Applies the catch-up policies to runs missed while the process was down.
+
+        Schedules with the `CatchUp.skip` policy are advanced past ``now``
+        right away. For the other policies the missed runs are returned and
+        the caller is expected to fire them and then call `mark_fired` with
+        ``now``.
+
+        Parameters
+        ----------
+        now : DateTime
+            The current time.
+
+        Returns
+        -------
+        List[Tuple[StoredSchedule, DateTime]]
+            The missed runs to fire, ordered by their original fire time.
+        """
+        missed: List[Tuple[StoredSchedule, DateTime]] = []
+        for schedule in self.due(now):
+            assert schedule.next_fire is not None
+            if schedule.catch_up is CatchUp.skip:
+                self._advance(schedule, now)
+                continue
+            missed.append((schedule, schedule.next_fire))
+            if schedule.catch_up is CatchUp.all:
+                runs = 1
+                run = schedule.when.next_run(schedule.next_fire)
+                while run is not None and run <= now and runs < MAX_CATCH_UP:
+                    missed.append((schedule, run))
+                    runs += 1
+                    run = schedule.when.next_run(run)
+        missed.sort(key=lambda item: (item[1], item[0].id))
+        return missed
+
+    def _advance(self, schedule: StoredSchedule, after: DateTime) -> None:
+        """
+        Moves a schedule to its first run after ``after`` without firing it.
+        """
+        next_fire = schedule.when.next_run(after)
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE schedules SET next_fire = ? WHERE id = ?",
+                (_timestamp(next_fire), schedule.id),
+            )
+
+    def _row(self, row: Tuple) -> StoredSchedule:
+        """
+        Converts a database row into a `StoredSchedule`.
+        """
+        (
+            schedule_id,
+            device,
+            action,
+            spec,
+            catch_up,
+            next_fire,
+            last_fire,
+            priority,
+        ) = row
+        when = self._whens.get(schedule_id)
+        if when is None:
+            when = self._whens[schedule_id] = _decode_when(spec, self._clock)
+        return StoredSchedule(
+            id=schedule_id,
+            device=device,
+            action=action,
+            when=when,
+            catch_up=CatchUp(catch_up),
+            next_fire=_from_timestamp(next_fire),
+            last_fire=_from_timestamp(last_fire),
+            priority=priority,
+        )
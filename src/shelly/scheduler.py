@@ -0,0 +1,353 @@
+"""
+Scheduler Module.
+
+This module provides the `Scheduler`, which runs the schedules persisted in
+a `ScheduleStore` against `Dimmer2` devices. On start-up it applies the
+catch-up policy of every schedule that was missed while the process was
+down, and on every tick it only reads the rows whose indexed next fire time
+is due. Time is read from a pluggable `Clock`, once per tick, so that a
+`VirtualClock` can fast-forward through schedules deterministically.
+
+All actions due for the same device in a tick are merged into a single
+`change_state` call, and the calls for different devices are sent in
+parallel. With `offload_timers` set, an "on" that is followed shortly by a
+plain "off" for the same device is sent as a single command with a
+device-side timer, and the "off" is not sent by the host at all.
+"""
+
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from math import ceil
+import threading
+from typing import Dict, Iterable, List, Optional, Union
+
+import httpx
+from loguru import logger
+from pendulum.datetime import DateTime
+
+from .clock import Clock, VirtualClock
+from .dimmer2 import Dimmer2
+from .schedule_store import CatchUp, ScheduleStore, StoredSchedule
+from .scheduling import ScheduledEvent, merge_commands, parse_action
+
+
+class Scheduler:
+    """
+    Fires stored schedules against their devices.
+
+    Attributes
+    ----------
+    store : ScheduleStore
+        The store holding the schedules.
+    devices : Dict[str, Dimmer2]
+        The managed devices, keyed by the device key used in the store.
+    clock : Clock
+        The clock the scheduler reads time from.
+    tick_interval : float
+        The maximum time in seconds between two ticks.
+    dry_run : bool
+        Whether to skip sending actions to the devices, e.g. in simulations.
+    max_workers : int
+        The maximum number of devices commanded in parallel.
+    offload_timers : float, optional
+        The longest gap in seconds between an "on" and a following "off"
+        that is offloaded to a device-side timer; None disables offloading.
+
+    Methods
+    -------
+    add_device(dimmer, key)
+        Registers a device the stored schedules may target.
+    schedule(event, catch_up) -> int
+        Persists a `ScheduledEvent` and registers its dimmer.
+    tick(now_) -> List[StoredSchedule]
+        Fires every schedule that is due.
+    run_until(end) -> int
+        Fast-forwards a `VirtualClock` through the schedules up to ``end``.
+    start()
+        Catches up on missed runs and starts the background loop.
+    stop()
+        Stops the background loop.
+    """
+
+    tick_interval: float = 1.0  # in seconds
+    dry_run: bool = False
+    max_workers: int = 32
+    offload_timers: Optional[float] = None  # in seconds
+
+    def __init__(
+        self,
+        store: ScheduleStore,
+        devices: Optional[Iterable[Dimmer2]] = None,
+        clock: Optional[Clock] = None,
+    ) -> None:
+        """
+        Initializes the Scheduler instance.
+
+        Parameters
+        ----------
+        store : ScheduleStore
+            The store holding the schedules.
+        devices : Iterable[Dimmer2], optional
+            The devices to manage, keyed by their IP address.
+        clock : Clock, optional
+            The clock to read time from, by default the clock of the store.
+            A given clock also becomes the clock of the store, so that the
+            schedules read back from it see the same time.
+        """
+        self.store = store
+        if clock is not None:
+            store.clock = clock
+        self.clock: Clock = store.clock
+        self.devices: Dict[str, Dimmer2] = {}
+        for dimmer in devices or ():
+            self.add_device(dimmer)
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def add_device(self, dimmer: Dimmer2, key: Optional[str] = None) -> None:
+        """
+        Registers a device the stored schedules may target.
+
+        Parameters
+        ----------
+        dimmer : Dimmer2
+            The device.
+        key : str, optional
+            The device key used in the store, by default the IP address.
+        """
+        self.devices[key or dimmer.ip] = dimmer
+
+    def schedule(self, event: ScheduledEvent, catch_up: CatchUp = CatchUp.once) -> int:
+        """
+        Persists a `ScheduledEvent` and registers its dimmer.
+
+        Parameters
+        ----------
+        event : ScheduledEvent
+            The event to schedule.
+        catch_up : CatchUp, optional
+            The policy for missed runs, by default `CatchUp.once`.
+
+        Returns
+        -------
+        int
+            The id of the stored schedule.
+        """
+        parse_action(event.action)
+        self.add_device(event.dimmer)
+        return self.store.add_event(event, catch_up, after=self.clock.now())
+
+    def tick(self, now_: Optional[DateTime] = None) -> List[StoredSchedule]:
+        """
+        Fires every schedule that is due.
+
+        Parameters
+        ----------
+        now_ : DateTime, optional
+            The tick time, by default read once from the clock.
+
+        Returns
+        -------
+        List[StoredSchedule]
+            The schedules that were fired.
+        """
+        with self.clock.tick() as tick_time:
+            now_ = now_ or tick_time
+            due = self.store.due(now_)
+            self._dispatch(due, now_)
+            for schedule in due:
+                self.store.mark_fired(schedule.id, now_)
+        return due
+
+    def run_until(self, end: DateTime) -> int:
+        """
+        Fast-forwards a `VirtualClock` through the schedules up to ``end``.
+
+        The clock jumps straight from one fire time to the next, so a year
+        of schedules is evaluated without waiting for any idle ticks.
+
+        Parameters
+        ----------
+        end : DateTime
+            The time to stop at.
+
+        Returns
+        -------
+        int
+            The number of schedules fired.
+
+        Raises
+        ------
+        TypeError
+            If the scheduler does not run on a `VirtualClock`.
+        """
+        if not isinstance(self.clock, VirtualClock):
+            raise TypeError("run_until requires a VirtualClock")
+        fired = 0
+        while True:
+            next_fire = self.store.next_fire_time()
+            if next_fire is None or next_fire > end:
+                break
+            if next_fire > self.clock.now():
+                self.clock.set(next_fire)
+            fired += len(self.tick())
+        if end > self.clock.now():
+            self.clock.set(end)
+        return fired
+
+    def start(self) -> None:
+        """
+        Catches up on missed runs and starts the background loop.
+        """
+        now_ = self.clock.now()
+        missed = self.store.recover(now_)
+        for fire_time, batch in groupby(missed, key=lambda item: item[1]):
+            schedules = [schedule for schedule, _ in batch]
+            logger.info(
+                "Catching up on {} schedule(s) missed at {}", len(schedules), fire_time
+            )
+            self._dispatch(schedules)
+        for schedule_id in {schedule.id for schedule, _ in missed}:
+            self.store.mark_fired(schedule_id, now_)
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the background loop.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _loop(self) -> None:
+        """
+        Runs the ticks in a separate thread, sleeping until the next fire
+        time or at most `tick_interval` seconds.
+        """
+        while not self._stop_event.is_set():
+            timeout = self.tick_interval
+            try:
+                self.tick()
+                next_fire = self.store.next_fire_time()
+                if next_fire is not None:
+                    until_next = (next_fire - self.clock.now()).total_seconds()
+                    timeout = max(0.0, min(timeout, until_next))
+            except Exception:
+                # Keep the loop alive, the next tick retries the due rows.
+                logger.exception("Scheduler tick failed")
+            self.clock.wait(self._stop_event, timeout)
+
+    def _dispatch(
+        self, schedules: List[StoredSchedule], now_: Optional[DateTime] = None
+    ) -> None:
+        """
+        Merges the schedules per device and sends the commands in parallel.
+
+        Parameters
+        ----------
+        schedules : List[StoredSchedule]
+            The schedules due at the same time.
+        now_ : DateTime, optional
+            The tick time; timers are only offloaded when it is given.
+        """
+        by_device: Dict[str, List[StoredSchedule]] = {}
+        for schedule in schedules:
+            by_device.setdefault(schedule.device, []).append(schedule)
+
+        commands: Dict[str, Dict[str, Union[str, int]]] = {}
+        for device, group in by_device.items():
+            try:
+                commands[device] = merge_commands(
+                    (schedule.priority, parse_action(schedule.action))
+                    for schedule in sorted(group, key=lambda s: (s.priority, s.id))
+                )
+            except ValueError as e:
+                logger.error("Skipped scheduled actions for {}: {}", device, e)
+        if self.offload_timers is not None and now_ is not None:
+            for device, command in commands.items():
+                if command.get("turn") == "on" and "timer" not in command:
+                    self._offload_timer(device, command, now_)
+
+        if len(commands) == 1:
+            for device, command in commands.items():
+                self._send(device, command)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="scheduler"
+            )
+        for _ in self._executor.map(self._send, commands, commands.values()):
+            pass
+
+    def _offload_timer(
+        self, device: str, command: Dict[str, Union[str, int]], now_: DateTime
+    ) -> None:
+        """
+        Folds the next plain "off" of a device into an "on" as a device timer.
+
+        The "off" schedule is advanced past its fire time as if it had
+        fired, since the device turns the light off by itself.
+
+        Parameters
+        ----------
+        device : str
+            The device key.
+        command : Dict[str, Union[str, int]]
+            The merged "on" command, updated in place.
+        now_ : DateTime
+            The tick time.
+        """
+        assert self.offload_timers is not None
+        window = self.store.due(now_.add(seconds=self.offload_timers), device)
+        for schedule in window:
+            assert schedule.next_fire is not None
+            if schedule.next_fire <= now_:
+                continue
+            try:
+                following = parse_action(schedule.action)
+            except ValueError:
+                return
+            if following != {"turn": "off"}:
+                # Anything else due before the "off" changes what it reverts.
+                return
+            timer = ceil((schedule.next_fire - now_).total_seconds())
+            command["timer"] = timer
+            self.store.mark_fired(schedule.id, schedule.next_fire)
+            logger.debug(
+                "Offloaded schedule {} to a {}s timer on {}", schedule.id, timer, device
+            )
+            return
+
+    def _send(self, device: str, command: Dict[str, Union[str, int]]) -> None:
+        """
+        Sends a merged command to a device.
+
+        Parameters
+        ----------
+        device : str
+            The device key.
+        command : Dict[str, Union[str, int]]
+            The `change_state` arguments.
+        """
+        if self.dry_run:
+            logger.debug("Dry run for {}: {}", device, command)
+            return
+        dimmer = self.devices.get(device)
+        if dimmer is None:
+            logger.warning("Schedule targets unknown device {}", device)
+            return
+        try:
+            dimmer.change_state(**command)
+        except httpx.HTTPError as e:
+            logger.error("Failed to send scheduled command to {}: {}", device, e)
+        except Exception:
+            logger.exception("Failed to send scheduled command to {}", device)
@@ -1,8 +1,8 @@
 from __future__ import annotations
-from dataclasses import dataclass, replace
+from dataclasses import dataclass, field, replace
 from datetime import date
 from enum import Enum, Flag, auto
-from typing import List, Literal, Optional, Optional
+from typing import Dict, Iterable, List, Literal, Optional, Optional, Tuple, Union
 from pendulum import (
     Date,
     Duration,
@@ -18,9 +18,9 @@ from pendulum import (
 import pendulum
 from pendulum.datetime import DateTime
 from pendulum.day import WeekDay as PDWeekDay
-from src.shelly.dimmer2 import Dimmer2
+from .clock import Clock, system_clock
+from .dimmer2 import Dimmer2
 
-dimmer = Dimmer2()
 tz: Timezone | FixedTimezone = local_timezone()
 if not isinstance(tz, Timezone):
     tz = UTC
@@ -59,6 +59,8 @@ def day_comparator(
     return output
 
 """
+
+
 class DayComparison(Flag):
     same_week = auto()
     same_weekday = auto()
@@ -94,14 +96,18 @@ def all_weekday_in_month(weekday: PDWeekDay, month: int, year: int) -> List[Date
 
     result = [
         pendulum.DateTime(year=year, month=month, day=day)
-        for day in range(1,  days_in_month + 1)
+        for day in range(1, days_in_month + 1)
         if pendulum.DateTime(year=year, month=month, day=day).day_of_week == weekday
     ]
 
     return result
 
+
 def nth_weekday_in_month(
-    weekday: PDWeekDay, month: int, year: int, week_of_month: WeekOfMonth,
+    weekday: PDWeekDay,
+    month: int,
+    year: int,
+    week_of_month: WeekOfMonth,
 ) -> DateTime:
     weekdays = all_weekday_in_month(weekday, month, year)
     return weekdays[week_of_month.value - 1]
@@ -110,6 +116,7 @@ def nth_weekday_in_month(
 from dataclasses import dataclass
 from typing import Optional, Union, Literal
 
+
 @dataclass
 class Repeater:
     """
@@ -128,6 +135,8 @@ class Repeater:
         Specifies the week of the month to consider when dealing with intervals.
     last_run : DateTime, optional
         The last run time of the interval.
+    clock : Clock, optional
+        The clock to read the current time from. Defaults to the wall clock.
     """
 
     interval: Union[Duration, PDWeekDay, DayOfMonth]
@@ -135,6 +144,7 @@ class Repeater:
     expires: Optional[Union[DateTime, Date]] = None
     week_of_month: Optional[WeekOfMonth] = None
     last_run: Optional[DateTime] = None
+    clock: Clock = field(default=system_clock, repr=False, compare=False)
 
     def __post_init__(self):
         """
@@ -148,7 +158,7 @@ class Repeater:
         if isinstance(self.interval, Duration) and self.interval.invert:
             raise ValueError(f"Invalid interval: {self.interval}")
         if self.start is None:
-            self.start = now()
+            self.start = self.clock.now()
 
     @property
     def by_duration(self) -> bool:
@@ -172,7 +182,10 @@ class Repeater:
         bool
             True if the week of the month matches, False otherwise.
         """
-        return self.week_of_month is not None and self.week_of_month.value == today().week_of_month
+        return (
+            self.week_of_month is not None
+            and self.week_of_month.value == self.clock.today().week_of_month
+        )
 
     @property
     def by_weekday(self) -> bool:
@@ -196,7 +209,10 @@ class Repeater:
         bool
             True if today is the interval's weekday, False otherwise.
         """
-        return isinstance(self.interval, PDWeekDay) and self.interval == today().day_of_week
+        return (
+            isinstance(self.interval, PDWeekDay)
+            and self.interval == self.clock.today().day_of_week
+        )
 
     @property
     def next(self) -> Optional[Union[DateTime, Date]]:
@@ -213,7 +229,7 @@ class Repeater:
         ValueError
             If the pattern is invalid or unsupported.
         """
-        now_ = now()
+        now_ = self.clock.now()
 
         prop_attr_dict = {
             "expired": self.expired,
@@ -245,7 +261,7 @@ class Repeater:
         }
         match ptn:
             # Specific cases for calculating the next interval occurrence
-            case {'running': False, 'by_weekday': True}:
+            case {"running": False, "by_weekday": True}:
                 assert isinstance(self.interval, PDWeekDay)
                 assert isinstance(self.start, DateTime)
                 if self.start.day_of_week == self.interval:
@@ -253,12 +269,11 @@ class Repeater:
                 elif self.start.day_of_week < self.interval:
                     return self.start.add(days=self.interval - self.start.day_of_week)
                 else:
-                    return (
-                        self.start.add(weeks=1)
-                        .subtract(days=self.start.day_of_week - self.interval)
+                    return self.start.add(weeks=1).subtract(
+                        days=self.start.day_of_week - self.interval
                     )
 
-            case {'running': False, 'by_day_of_month': True}:
+            case {"running": False, "by_day_of_month": True}:
                 assert isinstance(self.interval, DayOfMonth)
                 assert isinstance(self.start, DateTime)
                 compare = self.start.replace(day=self.interval.day)
@@ -266,16 +281,16 @@ class Repeater:
                     return compare
                 return self.target_date_for_month_delta(date=self.start, month_delta=1)
 
-            case {'running': False, 'by_week_of_month_weekday': True}:
+            case {"running": False, "by_week_of_month_weekday": True}:
                 assert isinstance(self.start, DateTime)
                 return self._month_week_of_month(date=self.start, next_or_prev="next")
 
-            case {'by_duration': True}:
+            case {"by_duration": True}:
                 assert isinstance(self.interval, Duration)
                 assert self.last_run is not None
                 return self.last_run
 
-            case {'by_weekday': True, "is_weekday": True}:
+            case {"by_weekday": True, "is_weekday": True}:
                 return now_
 
             case {"by_weekday": True, "before_weekday": True}:
@@ -312,7 +327,7 @@ class Repeater:
         ValueError
             If the pattern is invalid or unsupported.
         """
-        now_ = now()
+        now_ = self.clock.now()
 
         prop_attr_dict = {
             "expired": self.expired,
@@ -344,15 +359,15 @@ class Repeater:
         }
         match ptn:
             # Specific cases for calculating the previous interval occurrence
-            case {'running': False}:
+            case {"running": False}:
                 return
 
-            case {'by_duration': True}:
+            case {"by_duration": True}:
                 assert isinstance(self.interval, Duration)
                 assert self.last_run is not None
                 return self.last_run
 
-            case {'by_weekday': True, "is_weekday": True}:
+            case {"by_weekday": True, "is_weekday": True}:
                 return now_
 
             case {"by_weekday": True, "before_weekday": True}:
@@ -377,7 +392,7 @@ class Repeater:
     def target_date_for_month_delta(
         self,
         month_delta: int,
-        date: DateTime = today(),
+        date: Optional[DateTime] = None,
     ) -> DateTime:
         """
         Calculate the target date for a different month, adjusting for months
@@ -400,6 +415,8 @@ class Repeater:
         AssertionError
             If the interval is not a DayOfMonth.
         """
+        if date is None:
+            date = self.clock.today()
         operator = "add" if month_delta > 0 else "subtract"
         assert isinstance(self.interval, DayOfMonth)
 
@@ -413,7 +430,7 @@ class Repeater:
     def _month_week_of_month(
         self,
         next_or_prev: Literal["next", "prev"],
-        date: DateTime = today(),
+        date: Optional[DateTime] = None,
     ) -> DateTime:
         """
         Get the date corresponding to the next or previous occurrence of the specified
@@ -436,6 +453,8 @@ class Repeater:
         ValueError
             If the interval or week_of_month is invalid.
         """
+        if date is None:
+            date = self.clock.today()
         typechecks = [
             (self.interval, PDWeekDay),
             (self.week_of_month, WeekOfMonth),
@@ -459,15 +478,14 @@ class Repeater:
             year=year,
             week_of_month=self.week_of_month,
         )
-        if (
-            (next_or_prev == "next" and result > date)
-            or (next_or_prev == "prev" and result < date)
+        if (next_or_prev == "next" and result > date) or (
+            next_or_prev == "prev" and result < date
         ):
             return result
 
         result = nth_weekday_in_month(
             weekday=self.interval,
-            month={'next': next_month, 'prev': prev_month}[next_or_prev],
+            month={"next": next_month, "prev": prev_month}[next_or_prev],
             year=year,
             week_of_month=self.week_of_month,
         )
@@ -513,7 +531,7 @@ class Repeater:
             If the start attribute is invalid.
         """
         if isinstance(self.start, (DateTime, Date)):
-            return self.start < now()
+            return self.start < self.clock.now()
         else:
             raise ValueError(f"Invalid start: {self.start}")
 
@@ -527,7 +545,7 @@ class Repeater:
         bool
             True if the interval's expiration time is in the past, False otherwise.
         """
-        return self.expires is not None and self.expires < now()
+        return self.expires is not None and self.expires < self.clock.now()
 
     @property
     def running(self) -> bool:
@@ -541,6 +559,63 @@ class Repeater:
         """
         return self.started and not self.expired
 
+    def next_date(self, after: Date) -> Optional[Date]:
+        """
+        Finds the first calendar day on or after ``after`` matching the interval.
+
+        Parameters
+        ----------
+        after : Date
+            The earliest day to consider.
+
+        Returns
+        -------
+        Date, optional
+            The matching day, or None if the repeater expires before it.
+
+        Raises
+        ------
+        ValueError
+            If the interval is a duration, which is not calendar based.
+        """
+        start = self.start.date() if isinstance(self.start, DateTime) else self.start
+        expires = (
+            self.expires.date() if isinstance(self.expires, DateTime) else self.expires
+        )
+        if start is not None and after < start:
+            after = start
+
+        if isinstance(self.interval, PDWeekDay) and self.week_of_month is None:
+            result = after.add(days=(self.interval - after.day_of_week) % 7)
+
+        elif isinstance(self.interval, PDWeekDay):
+            assert isinstance(self.week_of_month, WeekOfMonth)
+            month = after.replace(day=1)
+            while True:
+                weekdays = all_weekday_in_month(self.interval, month.month, month.year)
+                if len(weekdays) >= self.week_of_month.value:
+                    result = weekdays[self.week_of_month.value - 1].date()
+                    if result >= after:
+                        break
+                month = month.add(months=1)
+
+        elif isinstance(self.interval, DayOfMonth):
+            month = after.replace(day=1)
+            while True:
+                if month.days_in_month >= self.interval.day:
+                    result = month.replace(day=self.interval.day)
+                    if result >= after:
+                        break
+                month = month.add(months=1)
+
+        else:
+            raise ValueError(f"Invalid calendar interval: {self.interval}")
+
+        if expires is not None and result > expires:
+            return None
+        return result
+
+
 class WeekDay:
     day_of_week: PDWeekDay
     week_of_month: Optional[Literal[1, 2, 3, 4, 5]] = None
@@ -613,19 +688,98 @@ class When:
         start: Optional[DateTime] = None,
         end: Optional[DateTime] = None,
         repeater: Repeater = None,
+        clock: Optional[Clock] = None,
     ):
+        self.clock: Clock = clock or system_clock
         if start is None:
-            start = now(tz=self.tz)
+            start = self.clock.now().in_timezone(self.tz)
         if isinstance(time, str):
-            self.time = self._parse_time(time)
+            time = self._parse_time(time)
 
-        self.start: DateTime = start or now()
+        self.time: Time = time
+        self.start: DateTime = start
         self.end = end
         self.repeater = repeater
         self.last_run: Optional[DateTime] = None
 
-    def next_run(self):
-        today_ = today()
+    def next_run(self, after: Optional[DateTime] = None) -> Optional[DateTime]:
+        """
+        Calculates the first run strictly after a given moment.
+
+        Parameters
+        ----------
+        after : DateTime, optional
+            The moment to search from. Defaults to the current time.
+
+        Returns
+        -------
+        DateTime, optional
+            The next run, or None if the schedule has no further runs.
+        """
+        if after is None:
+            after = self.clock.now()
+        if self.end is not None and after >= self.end:
+            return None
+
+        if self.repeater is None:
+            result = self._at(self.start.date())
+            if result < self.start:
+                result = result.add(days=1)
+            if result <= after:
+                return None
+
+        elif self.repeater.by_duration:
+            assert isinstance(self.repeater.interval, Duration)
+            anchor = self.repeater.start
+            if not isinstance(anchor, DateTime):
+                anchor = self.start
+            step = self.repeater.interval.total_seconds()
+            if step <= 0:
+                raise ValueError(f"Invalid interval: {self.repeater.interval}")
+            if after < anchor:
+                result = anchor
+            else:
+                steps = int((after - anchor).total_seconds() // step) + 1
+                result = anchor.add(seconds=steps * step)
+
+        else:
+            day = max(after, self.start).date()
+            while True:
+                next_day = self.repeater.next_date(day)
+                if next_day is None:
+                    return None
+                result = self._at(next_day)
+                if result > after and result >= self.start:
+                    break
+                day = next_day.add(days=1)
+
+        if self.end is not None and result > self.end:
+            return None
+        return result
+
+    def _at(self, day: Date) -> DateTime:
+        """
+        Combines a calendar day with the scheduled time of day.
+
+        Parameters
+        ----------
+        day : Date
+            The calendar day.
+
+        Returns
+        -------
+        DateTime
+            The scheduled moment on that day in the schedule timezone.
+        """
+        return pendulum.datetime(
+            day.year,
+            day.month,
+            day.day,
+            self.time.hour,
+            self.time.minute,
+            self.time.second,
+            tz=self.tz,
+        )
 
     def previous_run(self) -> Optional[DateTime]: ...
 
@@ -662,7 +816,7 @@ class When:
 
     @property
     def expired(self) -> bool:
-        if self.end is not None and self.end < now():
+        if self.end is not None and self.end < self.clock.now():
             return True
         return False
 
@@ -672,7 +826,7 @@ class When:
 
     @property
     def started(self) -> bool:
-        if self.start < now():
+        if self.start < self.clock.now():
             return True
         return False
 
@@ -700,16 +854,111 @@ class When:
         return Time(*parts, tzinfo=local_timezone())
 
 
+TURN_ACTIONS = ("on", "off", "toggle")
+ACTION_PARAMETERS = ("brightness", "transition", "timer")
+TURN_PRECEDENCE = {"toggle": 0, "on": 1, "off": 2}
+
+
+def parse_action(action: str) -> Dict[str, Union[str, int]]:
+    """
+    Parses an action string into `LightControl.change_state` arguments.
+
+    An action is an optional turn keyword followed by ``key=value`` pairs,
+    e.g. ``"on"``, ``"brightness=40"`` or ``"on brightness=40 transition=500"``.
+    ``timer=<seconds>`` sets a device-side flip-back timer, so ``"on timer=300"``
+    turns the light off again after five minutes without host involvement.
+
+    Parameters
+    ----------
+    action : str
+        The action string.
+
+    Returns
+    -------
+    Dict[str, Union[str, int]]
+        The keyword arguments for `LightControl.change_state`.
+
+    Raises
+    ------
+    ValueError
+        If the action is empty or contains an unknown token.
+    """
+    command: Dict[str, Union[str, int]] = {}
+    for token in action.split():
+        key, sep, value = token.partition("=")
+        if not sep and key.lower() in TURN_ACTIONS and "turn" not in command:
+            command["turn"] = key.lower()
+        elif sep and key in ACTION_PARAMETERS and value.isdigit():
+            command[key] = int(value)
+        else:
+            raise ValueError(f"Invalid action: {action!r}")
+    if not command:
+        raise ValueError(f"Invalid action: {action!r}")
+    return command
+
+
+def merge_commands(
+    commands: Iterable[Tuple[int, Dict[str, Union[str, int]]]],
+) -> Dict[str, Union[str, int]]:
+    """
+    Merges commands that are due at the same time for the same device.
+
+    Commands are merged key by key in the given order, so a later command
+    overrides the brightness and transition of an earlier one. The turn
+    action is decided by priority first and then by `TURN_PRECEDENCE`:
+    "off" beats "on", which beats "toggle". A timer flips the light back
+    once it expires, so it is only kept from the command whose turn action
+    won; a timer of a command without a turn action is kept if no command
+    turns the light.
+
+    Parameters
+    ----------
+    commands : Iterable[Tuple[int, Dict[str, Union[str, int]]]]
+        ``(priority, command)`` pairs in ascending precedence order.
+
+    Returns
+    -------
+    Dict[str, Union[str, int]]
+        The merged `LightControl.change_state` arguments.
+    """
+    merged: Dict[str, Union[str, int]] = {}
+    turn_rank: Optional[Tuple[int, int]] = None
+    turn_timer: Optional[Union[str, int]] = None
+    for priority, command in commands:
+        for key, value in command.items():
+            if key == "timer":
+                continue
+            if key != "turn":
+                merged[key] = value
+                continue
+            rank = (priority, TURN_PRECEDENCE[str(value)])
+            if turn_rank is None or rank >= turn_rank:
+                merged[key], turn_rank = value, rank
+                turn_timer = command.get("timer")
+        if "turn" not in command and "timer" in command:
+            merged["timer"] = command["timer"]
+    if turn_rank is not None:
+        merged.pop("timer", None)
+        if turn_timer is not None:
+            merged["timer"] = turn_timer
+    return merged
+
+
 class ScheduledEvent:
-    def __init__(self, dimmer: Dimmer2, when: When, action: str):
+    def __init__(self, dimmer: Dimmer2, when: When, action: str, priority: int = 0):
         self.dimmer = dimmer
         self.when = when
         self.action = action
+        self.priority = priority
 
     @property
     def time(self):
         return self.when.time
 
+    @property
+    def command(self) -> Dict[str, Union[str, int]]:
+        return parse_action(self.action)
+
     def __lt__(self, other):
         return self.time < other.time
 
@@ -0,0 +1,392 @@
+"""
+Shared State Module.
+
+This module publishes the latest state of every device into a fixed-layout
+table in `multiprocessing.shared_memory`, so other processes (web workers,
+exporters, automations) can read fleet state without polling the devices
+themselves or receiving copies of it.
+
+The block starts with a header (magic, layout version, capacity, number of
+used rows) followed by one fixed-size row per device. Each row carries a
+seqlock counter: the single writer makes it odd before changing the row and
+even again afterwards, and a reader retries until it saw the same even
+counter before and after copying the row, so reads are consistent without
+locks. A row that stays odd for ``read_timeout`` seconds was left behind by
+a writer that died mid-write, and reading it raises `TimeoutError`::
+
+    table = SharedStatusTable.create("shelly-fleet", capacity=4096)
+    poller.add_listener(table.publish_samples)
+
+    # in another process
+    table = SharedStatusTable.attach("shelly-fleet")
+    table.read("EC64C9C2EFE2").power
+"""
+
+from __future__ import annotations
+from multiprocessing import resource_tracker, shared_memory
+import struct
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from models import Status
+from .dimmer2 import Dimmer2
+from .fleet import StatusSample
+
+MAGIC = b"SHLY"
+LAYOUT_VERSION = 1
+
+# magic, layout version, capacity, used rows
+HEADER = struct.Struct("<4sIII")
+# seq, mac, ip, flags, brightness, rssi, padding, power, total, temperature,
+# updated
+ROW = struct.Struct("<I12s24sBBbxdddd")
+SEQ = struct.Struct("<I")
+
+IS_ON = 1
+OVER_POWER = 2
+OVER_TEMPERATURE = 4
+OK = 8
+
+
+class StatusRow(NamedTuple):
+    """
+    The shared state of one device.
+
+    Attributes
+    ----------
+    mac : str
+        The MAC address of the device.
+    ip : str
+        The address of the device.
+    is_on : bool
+        Whether the light is on.
+    brightness : int
+        The brightness of the light in percent.
+    power : float
+        The current power draw in watts.
+    total : float
+        The energy counter of the meter.
+    temperature : float
+        The device temperature in Celsius.
+    over_power : bool
+        Whether an over power condition occurred.
+    over_temperature : bool
+        Whether an overtemperature condition occurred.
+    rssi : int
+        The Wi-Fi signal strength.
+    ok : bool
+        Whether the last poll of the device succeeded.
+    updated : float
+        When the row was last written, in seconds since the epoch.
+    """
+
+    mac: str
+    ip: str
+    is_on: bool
+    brightness: int
+    power: float
+    total: float
+    temperature: float
+    over_power: bool
+    over_temperature: bool
+    rssi: int
+    ok: bool
+    updated: float
+
+
+class SharedStatusTable:
+    """
+    A table of device states in shared memory, with one writer.
+
+    Attributes
+    ----------
+    name : str
+        The name of the shared memory block.
+    capacity : int
+        The maximum number of devices.
+    read_timeout : float
+        The seconds a reader retries a row that is being written before it
+        gives up.
+
+    Methods
+    -------
+    create(name, capacity) -> SharedStatusTable
+        Creates a new table, to be written by this process.
+    attach(name) -> SharedStatusTable
+        Attaches to an existing table for reading.
+    publish(sample)
+        Writes the state of a device.
+    publish_samples(samples)
+        Writes several device states.
+    listener(dimmer, status)
+        Writes the state of a `Dimmer2`, see `Dimmer2.add_listener`.
+    read(mac) -> Optional[StatusRow]
+        Reads the state of a device.
+    rows() -> List[StatusRow]
+        Reads the states of all devices.
+    close()
+        Detaches from the shared memory.
+    unlink()
+        Destroys the shared memory block.
+    """
+
+    read_timeout: float = 0.1  # in seconds
+
+    def __init__(self, memory: shared_memory.SharedMemory, writer: bool) -> None:
+        """
+        Initializes the SharedStatusTable instance; use `create` or `attach`.
+        """
+        magic, version, capacity, _ = HEADER.unpack_from(memory.buf, 0)
+        if magic != MAGIC or version != LAYOUT_VERSION:
+            raise ValueError(f"{memory.name} is not a shelly status table")
+        self._memory = memory
+        self._buffer = memory.buf
+        self._writer = writer
+        self.name = memory.name
+        self.capacity = capacity
+        self._slots: Dict[str, int] = {}
+
+    @classmethod
+    def create(
+        cls, name: Optional[str] = None, capacity: int = 4096
+    ) -> SharedStatusTable:
+        """
+        Creates a new table, to be written by this process.
+
+        Parameters
+        ----------
+        name : Optional[str], optional
+            The name of the shared memory block, by default a random one.
+        capacity : int, optional
+            The maximum number of devices, by default 4096.
+
+        Returns
+        -------
+        SharedStatusTable
+            The table.
+        """
+        memory = shared_memory.SharedMemory(
+            name=name, create=True, size=HEADER.size + capacity * ROW.size
+        )
+        HEADER.pack_into(memory.buf, 0, MAGIC, LAYOUT_VERSION, capacity, 0)
+        return cls(memory, writer=True)
+
+    @classmethod
+    def attach(cls, name: str) -> SharedStatusTable:
+        """
+        Attaches to an existing table for reading.
+
+        Parameters
+        ----------
+        name : str
+            The name of the shared memory block.
+
+        Returns
+        -------
+        SharedStatusTable
+            The table.
+        """
+        try:
+            memory = shared_memory.SharedMemory(name=name, track=False)  # type: ignore[call-arg]
+        except TypeError:
+            # Before Python 3.13 every attaching process registers the block,
+            # and its resource tracker (which may be the one of the writer)
+            # would destroy it on exit, so skip the registration.
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None  # type: ignore[assignment]
+            try:
+                memory = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register  # type: ignore[assignment]
+        return cls(memory, writer=False)
+
+    def _offset(self, slot: int) -> int:
+        """
+        Returns the offset of a row.
+        """
+        return HEADER.size + slot * ROW.size
+
+    def _used(self) -> int:
+        """
+        Returns the number of used rows.
+        """
+        return HEADER.unpack_from(self._buffer, 0)[3]
+
+    def publish(self, sample: StatusSample) -> None:
+        """
+        Writes the state of a device.
+
+        Parameters
+        ----------
+        sample : StatusSample
+            The state, e.g. from `ShardedPoller` or `StatusSample.from_status`.
+
+        Raises
+        ------
+        OverflowError
+            If the table is full.
+        """
+        if not self._writer:
+            raise PermissionError("Attached tables are read-only")
+        if not sample.mac:
+            return
+        mac = sample.mac.upper()
+        slot = self._slots.get(mac)
+        used = None
+        if slot is None:
+            slot = used = self._used()
+            if slot >= self.capacity:
+                raise OverflowError(f"{self.name} is full ({self.capacity} devices)")
+            self._slots[mac] = slot
+        offset = self._offset(slot)
+        seq = SEQ.unpack_from(self._buffer, offset)[0]
+        writing, written = (seq + 1) & 0xFFFFFFFF, (seq + 2) & 0xFFFFFFFF
+        SEQ.pack_into(self._buffer, offset, writing)
+        flags = (
+            (IS_ON if sample.is_on else 0)
+            | (OVER_POWER if sample.over_power else 0)
+            | (OVER_TEMPERATURE if sample.over_temperature else 0)
+            | (OK if sample.ok else 0)
+        )
+        ROW.pack_into(
+            self._buffer,
+            offset,
+            writing,
+            mac.encode(),
+            sample.ip.encode(),
+            flags,
+            sample.brightness,
+            max(-128, min(127, sample.rssi)),
+            sample.power,
+            sample.total,
+            sample.temperature,
+            sample.timestamp,
+        )
+        SEQ.pack_into(self._buffer, offset, written)
+        if used is not None:
+            # Publish the row only once it is complete.
+            HEADER.pack_into(
+                self._buffer, 0, MAGIC, LAYOUT_VERSION, self.capacity, used + 1
+            )
+
+    def publish_samples(self, samples: Iterable[StatusSample]) -> None:
+        """
+        Writes several device states, see `ShardedPoller.add_listener`.
+
+        Parameters
+        ----------
+        samples : Iterable[StatusSample]
+            The states.
+        """
+        for sample in samples:
+            self.publish(sample)
+
+    def listener(self, dimmer: Dimmer2, status: Status) -> None:
+        """
+        Writes the state of a `Dimmer2`, see `Dimmer2.add_listener`.
+
+        Parameters
+        ----------
+        dimmer : Dimmer2
+            The device.
+        status : Status
+            Its new status.
+        """
+        self.publish(StatusSample.from_status(dimmer.ip, status, time.time()))
+
+    def _read_slot(self, slot: int) -> StatusRow:
+        """
+        Reads a row consistently, retrying while it is being written.
+
+        Raises
+        ------
+        TimeoutError
+            If the row is still being written after `read_timeout` seconds.
+        """
+        offset = self._offset(slot)
+        buffer = self._buffer
+        deadline = None
+        while True:
+            before = SEQ.unpack_from(buffer, offset)[0]
+            if not before & 1:
+                row = ROW.unpack_from(buffer, offset)
+                if SEQ.unpack_from(buffer, offset)[0] == before == row[0]:
+                    break
+            # Only the retries read the clock.
+            now = time.monotonic()
+            if deadline is None:
+                deadline = now + self.read_timeout
+            elif now > deadline:
+                raise TimeoutError(f"Row {slot} of {self.name} is stuck mid-write")
+            time.sleep(0)
+        _, mac, ip, flags, brightness, rssi, power, total, temperature, updated = row
+        return StatusRow(
+            mac.rstrip(b"\0").decode(),
+            ip.rstrip(b"\0").decode(),
+            bool(flags & IS_ON),
+            brightness,
+            power,
+            total,
+            temperature,
+            bool(flags & OVER_POWER),
+            bool(flags & OVER_TEMPERATURE),
+            rssi,
+            bool(flags & OK),
+            updated,
+        )
+
+    def read(self, mac: str) -> Optional[StatusRow]:
+        """
+        Reads the state of a device.
+
+        Parameters
+        ----------
+        mac : str
+            The MAC address of the device.
+
+        Returns
+        -------
+        Optional[StatusRow]
+            The state, or None if the device is not in the table.
+
+        Raises
+        ------
+        TimeoutError
+            If the row was left mid-write by a writer that died.
+        """
+        mac = mac.upper()
+        slot = self._slots.get(mac)
+        if slot is None:
+            # Index the rows added since the last lookup.
+            for index in range(len(self._slots), self._used()):
+                offset = self._offset(index) + SEQ.size
+                mac_bytes = bytes(self._buffer[offset : offset + 12]).rstrip(b"\0")
+                self._slots[mac_bytes.decode()] = index
+            slot = self._slots.get(mac)
+            if slot is None:
+                return None
+        return self._read_slot(slot)
+
+    def rows(self) -> List[StatusRow]:
+        """
+        Reads the states of all devices.
+
+        Returns
+        -------
+        List[StatusRow]
+            The states, in the order the devices were added.
+        """
+        return [self._read_slot(slot) for slot in range(self._used())]
+
+    def close(self) -> None:
+        """
+        Detaches from the shared memory.
+        """
+        self._buffer = None  # type: ignore[assignment]
+        self._memory.close()
+
+    def unlink(self) -> None:
+        """
+        Destroys the shared memory block, once every process has closed it.
+        """
+        self._memory.unlink()
@@ -0,0 +1,761 @@
+"""
+Dimmer2 Simulator Module.
+
+This module provides an asyncio-based simulator of the Shelly Dimmer2 HTTP
+API (``/shelly``, ``/status``, ``/light/0``, ``/settings`` and
+``/settings/light/0``) for running `Dimmer2`, `LightControl` and the MQTT
+code without hardware. Each simulated dimmer listens on its own port,
+answers with realistic `Status` payloads, can inject latency, jitter and
+failures, limits concurrent connections like the embedded server does,
+and can publish the matching ``shellies/<id>/...`` MQTT topics.
+
+A whole fleet runs in a single event loop::
+
+    python -m shelly.simulator --count 1000 --base-port 9000
+"""
+
+from __future__ import annotations
+import asyncio
+import copy
+from dataclasses import dataclass
+import random
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import click
+import orjson
+from loguru import logger
+
+from models.status import SAMPLE_STATUS
+
+Publisher = Callable[[str, bytes], object]
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    500: "Internal Server Error",
+}
+
+
+@dataclass
+class SimulatorConfig:
+    """
+    The network behaviour of a simulated device.
+
+    Attributes
+    ----------
+    latency : float
+        The base response latency in seconds.
+    jitter : float
+        The maximum random latency in seconds added to every response.
+    failure_rate : float
+        The fraction of requests answered with an HTTP 500.
+    drop_rate : float
+        The fraction of requests whose connection is closed without a
+        response.
+    max_connections : int
+        The number of concurrent connections the device accepts; further
+        connections are reset, like on the embedded server.
+    rated_power : float
+        The power in watts drawn by the load at full brightness.
+    mqtt_interval : float
+        The interval in seconds of the periodic MQTT status publications.
+    """
+
+    latency: float = 0.02
+    jitter: float = 0.01
+    failure_rate: float = 0.0
+    drop_rate: float = 0.0
+    max_connections: int = 4
+    rated_power: float = 40.0
+    mqtt_interval: float = 30.0
+
+
+class LocalBroker:
+    """
+    A minimal in-process stand-in for an MQTT broker.
+
+    Methods
+    -------
+    subscribe(pattern, callback)
+        Registers a callback for a topic pattern with MQTT wildcards.
+    publish(topic, payload)
+        Delivers a message to every matching subscriber.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes the LocalBroker instance.
+        """
+        self._subscriptions: List[Tuple[List[str], Callable[[str, bytes], None]]] = []
+        self.retained: Dict[str, bytes] = {}
+
+    def subscribe(self, pattern: str, callback: Callable[[str, bytes], None]) -> None:
+        """
+        Registers a callback for a topic pattern with MQTT wildcards.
+
+        Parameters
+        ----------
+        pattern : str
+            The topic pattern, e.g. ``shellies/+/light/0/#``.
+        callback : Callable[[str, bytes], None]
+            Called with the topic and payload of every matching message.
+        """
+        self._subscriptions.append((pattern.split("/"), callback))
+
+    def publish(self, topic: str, payload: bytes) -> None:
+        """
+        Delivers a message to every matching subscriber.
+
+        Parameters
+        ----------
+        topic : str
+            The topic of the message.
+        payload : bytes
+            The payload of the message.
+        """
+        self.retained[topic] = payload
+        levels = topic.split("/")
+        for pattern, callback in self._subscriptions:
+            if _topic_matches(pattern, levels):
+                callback(topic, payload)
+
+
+def _topic_matches(pattern: List[str], levels: List[str]) -> bool:
+    """
+    Checks whether topic levels match a pattern with ``+`` and ``#``.
+    """
+    for index, part in enumerate(pattern):
+        if part == "#":
+            return True
+        if index >= len(levels) or (part != "+" and part != levels[index]):
+            return False
+    return len(pattern) == len(levels)
+
+
+class SimulatedDimmer:
+    """
+    A simulated Shelly Dimmer2 serving the HTTP API on a local port.
+
+    Attributes
+    ----------
+    mac : str
+        The MAC address of the simulated device.
+    host : str
+        The address the device listens on.
+    port : int
+        The port the device listens on, assigned on start when 0.
+    config : SimulatorConfig
+        The network behaviour of the device.
+    requests : int
+        The number of requests served.
+    rejected : int
+        The number of connections reset because of the connection limit.
+
+    Methods
+    -------
+    start()
+        Starts serving.
+    stop()
+        Stops serving.
+    status() -> dict
+        Returns the current `/status` payload.
+    press(channel, event)
+        Simulates a press of a physical input.
+    command(subtopic, payload)
+        Handles an MQTT command sent to the device.
+    """
+
+    def __init__(
+        self,
+        mac: str,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        config: Optional[SimulatorConfig] = None,
+        publish: Optional[Publisher] = None,
+    ) -> None:
+        """
+        Initializes the SimulatedDimmer instance.
+
+        Parameters
+        ----------
+        mac : str
+            The MAC address of the simulated device.
+        host : str, optional
+            The address to listen on, by default "127.0.0.1".
+        port : int, optional
+            The port to listen on, by default a free ephemeral port.
+        config : SimulatorConfig, optional
+            The network behaviour, by default `SimulatorConfig()`.
+        publish : Callable[[str, bytes], object], optional
+            Called to publish MQTT messages, e.g. `LocalBroker.publish` or
+            the ``publish`` method of a paho client.
+        """
+        self.mac = mac.upper()
+        self.host = host
+        self.port = port
+        self.config = config or SimulatorConfig()
+        self.publish = publish
+        self.requests = 0
+        self.rejected = 0
+
+        self._status = copy.deepcopy(SAMPLE_STATUS)
+        self._status["mac"] = self.mac
+        self._status["wifi_sta"]["ip"] = host
+        self._status["wifi_sta"]["rssi"] = random.randint(-80, -40)
+        self._light = self._status["lights"][0]
+        self._meter = self._status["meters"][0]
+        self._schedule_rules: List[str] = []
+        self._schedule = False
+        self._started = time.monotonic()
+        self._energy_at = self._started
+        # Watt-minutes, kept as a float so that short intervals add up.
+        self._energy = float(self._meter["total"])
+        self._connections = 0
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._mqtt_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def address(self) -> str:
+        """
+        Returns the ``host:port`` address to pass to `Dimmer2`.
+
+        Returns
+        -------
+        str
+            The address of the simulated device.
+        """
+        return f"{self.host}:{self.port}"
+
+    @property
+    def mqtt_id(self) -> str:
+        """
+        Returns the MQTT id of the device, as used in its topics.
+
+        Returns
+        -------
+        str
+            The id, e.g. ``shellydimmer2-EC64C9C2EFE2``.
+        """
+        return f"shellydimmer2-{self.mac}"
+
+    async def start(self) -> None:
+        """
+        Starts serving.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.publish is not None:
+            self._mqtt_task = asyncio.create_task(self._mqtt_loop())
+
+    async def stop(self) -> None:
+        """
+        Stops serving.
+        """
+        if self._mqtt_task is not None:
+            self._mqtt_task.cancel()
+        if self._timer is not None:
+            self._timer.cancel()
+        if self._server is not None:
+            self._server.close()
+            # Keep-alive connections outlive the server, close them as well.
+            for writer in list(self._writers):
+                writer.transport.abort()
+            while self._writers:
+                await asyncio.sleep(0)
+            await self._server.wait_closed()
+
+    def status(self) -> dict:
+        """
+        Returns the current `/status` payload.
+
+        Returns
+        -------
+        dict
+            The payload, in the format of `models.status.SAMPLE_STATUS`.
+        """
+        now = time.time()
+        self._update_meter()
+        self._status["unixtime"] = int(now)
+        self._status["time"] = time.strftime("%H:%M", time.localtime(now))
+        self._status["uptime"] = int(time.monotonic() - self._started)
+        self._status["tmp"]["tC"] = round(35.0 + self._meter["power"] / 10, 2)
+        self._status["tmp"]["tF"] = round(self._status["tmp"]["tC"] * 9 / 5 + 32, 2)
+        if self._light["has_timer"]:
+            elapsed = int(now) - self._light["timer_started"]
+            self._light["timer_remaining"] = max(
+                0, self._light["timer_duration"] - elapsed
+            )
+        return self._status
+
+    def settings(self) -> dict:
+        """
+        Returns the current `/settings` payload.
+
+        Returns
+        -------
+        dict
+            The payload of the settings endpoint.
+        """
+        return {
+            "device": {
+                "type": "SHDM-2",
+                "mac": self.mac,
+                "hostname": self.mqtt_id,
+                "num_outputs": 1,
+                "num_meters": 1,
+            },
+            "mqtt": {"enable": self.publish is not None, "id": self.mqtt_id},
+            "name": None,
+            "fw": self._status["update"]["old_version"],
+            "cfg_changed_cnt": self._status["cfg_changed_cnt"],
+            "lights": [self.light_settings()],
+        }
+
+    def light_settings(self) -> dict:
+        """
+        Returns the current `/settings/light/0` payload.
+
+        Returns
+        -------
+        dict
+            The payload of the light settings endpoint.
+        """
+        return {
+            "name": None,
+            "ison": self._light["ison"],
+            "brightness": self._light["brightness"],
+            "transition": self._light["transition"],
+            "schedule": self._schedule,
+            "schedule_rules": self._schedule_rules,
+        }
+
+    def press(self, channel: int = 0, event: str = "S") -> None:
+        """
+        Simulates a press of a physical input.
+
+        Parameters
+        ----------
+        channel : int, optional
+            The input channel, by default 0.
+        event : str, optional
+            The event type ("S", "L", "SS", ...), by default "S".
+        """
+        state = self._status["inputs"][channel]
+        state["event"] = event
+        state["event_cnt"] += 1
+        self._publish(
+            f"input_event/{channel}",
+            orjson.dumps({"event": event, "event_cnt": state["event_cnt"]}),
+        )
+
+    def _update_meter(self) -> None:
+        """
+        Derives the power draw from the light state and integrates energy.
+        """
+        now = time.monotonic()
+        power = 0.0
+        if self._light["ison"]:
+            power = self.config.rated_power * self._light["brightness"] / 100
+            power = round(power * random.uniform(0.98, 1.02), 2)
+        # The Dimmer2 reports total energy in whole watt-minutes.
+        self._energy += self._meter["power"] * (now - self._energy_at) / 60
+        self._meter["total"] = int(self._energy)
+        self._energy_at = now
+        self._meter["power"] = power
+        self._meter["timestamp"] = int(time.time())
+
+    def command(self, subtopic: str, payload: bytes) -> None:
+        """
+        Handles an MQTT command sent to the device.
+
+        ``light/0/set`` takes a JSON object like ``/light/0`` parameters and
+        ``light/0/command`` takes "on", "off" or "toggle". The command is
+        applied on the event loop of the device, so this may be called from
+        any thread.
+
+        Parameters
+        ----------
+        subtopic : str
+            The topic below the device, e.g. ``light/0/set``.
+        payload : bytes
+            The payload of the command.
+        """
+        if subtopic == "light/0/set":
+            try:
+                params = {
+                    key: str(value) for key, value in orjson.loads(payload).items()
+                }
+            except (orjson.JSONDecodeError, AttributeError):
+                return
+        elif subtopic == "light/0/command":
+            params = {"turn": payload.decode()}
+        else:
+            return
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._set_light, params, "mqtt")
+
+    def _set_light(
+        self, params: Dict[str, str], source: str = "http"
+    ) -> Tuple[int, dict]:
+        """
+        Applies the parameters of a `/light/0` request.
+        """
+        light = self._light
+        try:
+            turn = params.get("turn")
+            if turn == "toggle":
+                light["ison"] = not light["ison"]
+            elif turn in ("on", "off"):
+                light["ison"] = turn == "on"
+            elif turn is not None:
+                return 400, {"error": f"Invalid turn: {turn}"}
+            if "brightness" in params:
+                light["brightness"] = max(0, min(100, int(params["brightness"])))
+            if "transition" in params:
+                light["transition"] = int(params["transition"])
+            if turn is not None:
+                self._set_timer(float(params.get("timer", 0)))
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        light["source"] = source
+        self._update_meter()
+        self._publish_light()
+        return 200, light
+
+    def _set_timer(self, seconds: float) -> None:
+        """
+        Starts or clears the flip-back timer of the light.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._light.update(
+            has_timer=seconds > 0,
+            timer_started=int(time.time()) if seconds > 0 else 0,
+            timer_duration=int(seconds),
+            timer_remaining=int(seconds),
+        )
+        if seconds > 0:
+            self._timer = asyncio.get_running_loop().call_later(
+                seconds, self._flip_back
+            )
+
+    def _flip_back(self) -> None:
+        """
+        Reverts the light when its timer elapses.
+        """
+        self._timer = None
+        self._light.update(
+            ison=not self._light["ison"],
+            has_timer=False,
+            timer_started=0,
+            timer_duration=0,
+            timer_remaining=0,
+            source="timer",
+        )
+        self._update_meter()
+        self._publish_light()
+
+    def _set_light_settings(self, params: Dict[str, str]) -> Tuple[int, dict]:
+        """
+        Applies the parameters of a `/settings/light/0` request.
+        """
+        if "schedule" in params:
+            self._schedule = params["schedule"].lower() == "true"
+        if "schedule_rules" in params:
+            rules = params["schedule_rules"]
+            self._schedule_rules = [rule for rule in rules.split(",") if rule]
+        if params:
+            self._status["cfg_changed_cnt"] += 1
+        return 200, self.light_settings()
+
+    def _route(
+        self, method: str, path: str, params: Dict[str, str]
+    ) -> Tuple[int, object]:
+        """
+        Dispatches a request to the matching endpoint.
+        """
+        if path == "/shelly":
+            return 200, {
+                "type": "SHDM-2",
+                "mac": self.mac,
+                "auth": False,
+                "fw": self._status["update"]["old_version"],
+                "num_outputs": 1,
+                "num_meters": 1,
+            }
+        if path == "/status":
+            return 200, self.status()
+        if path == "/light/0":
+            if params or method in ("PUT", "POST"):
+                return self._set_light(params)
+            return 200, self._light
+        if path == "/settings":
+            return 200, self.settings()
+        if path == "/settings/light/0":
+            return self._set_light_settings(params)
+        return 404, {"error": "Not found"}
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Serves the requests of one connection, honouring keep-alive.
+        """
+        if self._connections >= self.config.max_connections:
+            self.rejected += 1
+            writer.transport.abort()
+            return
+        self._connections += 1
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                url = urlsplit(target)
+                params = dict(parse_qsl(url.query))
+                if body and "form" in headers.get("content-type", ""):
+                    params.update(parse_qsl(body.decode()))
+
+                await asyncio.sleep(
+                    self.config.latency + random.uniform(0, self.config.jitter)
+                )
+                self.requests += 1
+                if random.random() < self.config.drop_rate:
+                    writer.transport.abort()
+                    return
+                if random.random() < self.config.failure_rate:
+                    code, payload = 500, {"error": "Simulated failure"}
+                else:
+                    code, payload = self._route(method, url.path, params)
+
+                content = orjson.dumps(payload)
+                close = headers.get("connection", "").lower() == "close"
+                writer.write(
+                    f"HTTP/1.1 {code} {REASONS.get(code, '')}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(content)}\r\n"
+                    f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode()
+                    + content
+                )
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._connections -= 1
+            self._writers.discard(writer)
+            writer.close()
+
+    def _publish(self, subtopic: str, payload: bytes) -> None:
+        """
+        Publishes a message below the topic prefix of the device.
+        """
+        if self.publish is not None:
+            self.publish(f"shellies/{self.mqtt_id}/{subtopic}", payload)
+
+    def _publish_light(self) -> None:
+        """
+        Publishes the light topics, as the device does on every change.
+        """
+        self._publish("light/0", b"on" if self._light["ison"] else b"off")
+        self._publish(
+            "light/0/status",
+            orjson.dumps(
+                {
+                    "ison": self._light["ison"],
+                    "source": self._light["source"],
+                    "has_timer": self._light["has_timer"],
+                    "timer_started": self._light["timer_started"],
+                    "timer_duration": self._light["timer_duration"],
+                    "timer_remaining": self._light["timer_remaining"],
+                    "mode": self._light["mode"],
+                    "brightness": self._light["brightness"],
+                    "transition": self._light["transition"],
+                }
+            ),
+        )
+
+    async def _mqtt_loop(self) -> None:
+        """
+        Publishes the periodic status topics of the device.
+        """
+        while True:
+            status = self.status()
+            self._publish_light()
+            self._publish("light/0/power", str(self._meter["power"]).encode())
+            self._publish("light/0/energy", str(self._meter["total"]).encode())
+            self._publish("temperature", str(status["tmp"]["tC"]).encode())
+            self._publish("temperature_f", str(status["tmp"]["tF"]).encode())
+            self._publish(
+                "overtemperature", b"1" if status["overtemperature"] else b"0"
+            )
+            self._publish("overpower", b"1" if status["overpower"] else b"0")
+            self._publish("loaderror", str(status["loaderror"]).encode())
+            for channel, state in enumerate(status["inputs"]):
+                self._publish(f"input/{channel}", str(state["input"]).encode())
+            await asyncio.sleep(self.config.mqtt_interval)
+
+
+class SimulatedFleet:
+    """
+    A fleet of simulated dimmers served from one event loop.
+
+    Attributes
+    ----------
+    devices : List[SimulatedDimmer]
+        The simulated devices.
+
+    Methods
+    -------
+    start()
+        Starts every device.
+    stop()
+        Stops every device.
+    command(topic, payload)
+        Routes an MQTT command to its device, e.g. as a `LocalBroker`
+        subscriber of ``shellies/+/light/0/#``.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        host: str = "127.0.0.1",
+        base_port: int = 0,
+        config: Optional[SimulatorConfig] = None,
+        publish: Optional[Publisher] = None,
+    ) -> None:
+        """
+        Initializes the SimulatedFleet instance.
+
+        Parameters
+        ----------
+        count : int
+            The number of devices.
+        host : str, optional
+            The address to listen on, by default "127.0.0.1".
+        base_port : int, optional
+            The port of the first device, the others follow consecutively;
+            by default every device gets a free ephemeral port.
+        config : SimulatorConfig, optional
+            The network behaviour shared by all devices.
+        publish : Callable[[str, bytes], object], optional
+            Called to publish the MQTT messages of all devices.
+        """
+        self.devices = [
+            SimulatedDimmer(
+                mac=f"EC64C9{index:06X}",
+                host=host,
+                port=base_port + index if base_port else 0,
+                config=config,
+                publish=publish,
+            )
+            for index in range(count)
+        ]
+        self._by_id = {device.mqtt_id: device for device in self.devices}
+
+    @property
+    def addresses(self) -> List[str]:
+        """
+        Returns the ``host:port`` addresses of the devices.
+
+        Returns
+        -------
+        List[str]
+            The addresses, to pass to `Dimmer2`.
+        """
+        return [device.address for device in self.devices]
+
+    def command(self, topic: str, payload: bytes) -> None:
+        """
+        Routes an MQTT command to its device.
+
+        Parameters
+        ----------
+        topic : str
+            The topic, e.g. ``shellies/shellydimmer2-EC64C9000000/light/0/set``.
+        payload : bytes
+            The payload of the command.
+        """
+        _, device_id, subtopic = topic.split("/", 2)
+        device = self._by_id.get(device_id)
+        if device is not None:
+            device.command(subtopic, payload)
+
+    async def start(self) -> None:
+        """
+        Starts every device.
+        """
+        await asyncio.gather(*(device.start() for device in self.devices))
+
+    async def stop(self) -> None:
+        """
+        Stops every device.
+        """
+        await asyncio.gather(*(device.stop() for device in self.devices))
+
+
+@click.command()
+@click.option("--count", default=1, show_default=True, help="Number of devices.")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--base-port", default=9000, show_default=True)
+@click.option("--latency", default=0.02, show_default=True, help="Seconds.")
+@click.option("--jitter", default=0.01, show_default=True, help="Seconds.")
+@click.option("--failure-rate", default=0.0, show_default=True)
+@click.option("--max-connections", default=4, show_default=True)
+def main(
+    count: int,
+    host: str,
+    base_port: int,
+    latency: float,
+    jitter: float,
+    failure_rate: float,
+    max_connections: int,
+) -> None:
+    """
+    Serves a fleet of simulated Dimmer2 devices until interrupted.
+    """
+    config = SimulatorConfig(
+        latency=latency,
+        jitter=jitter,
+        failure_rate=failure_rate,
+        max_connections=max_connections,
+    )
+
+    async def serve() -> None:
+        fleet = SimulatedFleet(count, host, base_port, config)
+        await fleet.start()
+        logger.info(f"Serving {count} simulated dimmers on {host}:{base_port}+")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await fleet.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
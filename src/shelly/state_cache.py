@@ -0,0 +1,189 @@
+"""
+State Cache Module.
+
+This module persists the last known `Status` of every device, so a
+restarted controller can serve plausible state right away instead of
+showing the fleet as unknown until the first polls succeed. Statuses are
+kept in memory as they arrive and written to one JSON file, replaced
+atomically, at most every ``flush_interval`` seconds and at exit::
+
+    Dimmer2.state_cache = StateCache("state.json")
+    dimmer = Dimmer2("192.168.1.99")
+    dimmer.is_stale, dimmer.status_age   # True, 42.0 until the first poll
+"""
+
+from __future__ import annotations
+import atexit
+import os
+from pathlib import Path
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple, Union
+
+import orjson
+from loguru import logger
+from pydantic import ValidationError
+
+from models import Status
+
+if TYPE_CHECKING:
+    from .dimmer2 import Dimmer2
+
+
+class StateCache:
+    """
+    A JSON file of the last status of every device, keyed by address.
+
+    Attributes
+    ----------
+    path : Path
+        The cache file.
+    flush_interval : float
+        The seconds a new status may wait in memory before it is written.
+
+    Methods
+    -------
+    get(device) -> Optional[Tuple[Status, float]]
+        Returns the last status of a device and when it was fetched.
+    put(device, status, timestamp)
+        Stores the status of a device.
+    listener(dimmer, status)
+        Stores the status of a `Dimmer2`, see `Dimmer2.add_listener`.
+    flush()
+        Writes the cache file if statuses changed.
+    close()
+        Writes pending statuses and stops the delayed writes.
+    """
+
+    def __init__(self, path: Union[str, Path], flush_interval: float = 10.0) -> None:
+        """
+        Initializes the StateCache instance, loading the file if it exists.
+
+        Parameters
+        ----------
+        path : Union[str, Path]
+            The cache file.
+        flush_interval : float, optional
+            The seconds a new status may wait before it is written, by
+            default 10.0.
+        """
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        # Saved entries stay raw payloads until a device asks for them.
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._pending: Dict[str, Tuple[Status, float]] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        if self.path.exists():
+            try:
+                entries = orjson.loads(self.path.read_bytes())
+            except orjson.JSONDecodeError as e:
+                logger.warning("Ignoring unreadable state cache {}: {}", self.path, e)
+            else:
+                if isinstance(entries, dict):
+                    self._entries = entries
+                else:
+                    logger.warning(
+                        "Ignoring state cache {}: not a JSON object", self.path
+                    )
+        atexit.register(self.close)
+
+    def get(self, device: str) -> Optional[Tuple[Status, float]]:
+        """
+        Returns the last status of a device and when it was fetched.
+
+        Parameters
+        ----------
+        device : str
+            The device key, e.g. its IP address.
+
+        Returns
+        -------
+        Optional[Tuple[Status, float]]
+            The status and its time in seconds since the epoch, or None if
+            the device is not in the cache.
+        """
+        with self._lock:
+            pending = self._pending.get(device)
+            if pending is not None:
+                return pending
+            entry = self._entries.get(device)
+        if entry is None:
+            return None
+        try:
+            return Status.model_validate(entry["s"]), float(entry["t"])
+        except (ValidationError, KeyError, TypeError, ValueError) as e:
+            logger.warning("Ignoring cached state of {}: {}", device, e)
+            return None
+
+    def put(
+        self, device: str, status: Status, timestamp: Optional[float] = None
+    ) -> None:
+        """
+        Stores the status of a device; it is written by the next flush.
+
+        Parameters
+        ----------
+        device : str
+            The device key, e.g. its IP address.
+        status : Status
+            The status.
+        timestamp : Optional[float], optional
+            When the status was fetched, by default now.
+        """
+        with self._lock:
+            self._pending[device] = (
+                status,
+                time.time() if timestamp is None else timestamp,
+            )
+            if self._timer is None and self.flush_interval >= 0:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def listener(self, dimmer: Dimmer2, status: Status) -> None:
+        """
+        Stores the status of a `Dimmer2`, see `Dimmer2.add_listener`.
+
+        Parameters
+        ----------
+        dimmer : Dimmer2
+            The device.
+        status : Status
+            Its new status.
+        """
+        self.put(dimmer.ip, status)
+
+    def flush(self) -> None:
+        """
+        Writes the cache file if statuses changed, replacing it atomically.
+        """
+        # Writes are serialized, but do not block `put` from polling threads.
+        with self._write_lock:
+            with self._lock:
+                self._timer = None
+                pending, self._pending = self._pending, {}
+                if not pending:
+                    return
+                for device, (status, timestamp) in pending.items():
+                    self._entries[device] = {
+                        "t": timestamp,
+                        "s": status.model_dump(mode="json", by_alias=True),
+                    }
+            data = orjson.dumps(self._entries)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = self.path.with_suffix(self.path.suffix + ".tmp")
+            temporary.write_bytes(data)
+            os.replace(temporary, self.path)
+
+    def close(self) -> None:
+        """
+        Writes pending statuses and stops the delayed writes.
+        """
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        self.flush()
+        atexit.unregister(self.close)
@@ -0,0 +1,359 @@
+"""
+Telemetry Export Module.
+
+This module streams telemetry recorded in a `StatusJournal` into columnar
+formats for analysis: Apache Arrow record batches (an IPC file readable by
+pandas, polars or DuckDB) or one ``.npy`` file per column. The journal is
+scanned once for all requested devices and only the selected leaves are
+tracked, so no `Status` models or full payloads are built, and rows are
+written in chunks of ``chunk_size`` so memory does not grow with the time
+range::
+
+    reader = JournalReader("status.jsonl")
+    write_arrow("march.arrow", reader, start=march_1, end=april_1)
+
+    # or from the shell
+    python -m shelly.telemetry_export status.jsonl march.arrow --start 2024-03-01
+
+Each row is one recorded snapshot of a device, with a "timestamp" column,
+a "device" column and one float column per entry of ``columns``; values a
+snapshot does not have are NaN. NumPy is needed for both formats and
+pyarrow for Arrow; both are optional dependencies installed with the
+``export`` extra.
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Union
+
+import click
+import orjson
+import pendulum
+
+try:
+    import numpy as np
+except ImportError as error:  # pragma: no cover
+    raise ImportError(
+        "shelly.telemetry_export requires numpy, install shelly[export]"
+    ) from error
+
+from .journal import JournalReader, flatten
+
+# The exported columns and the journal leaves they are read from.
+DEFAULT_COLUMNS: Mapping[str, str] = {
+    "power": "meters.0.power",
+    "total": "meters.0.total",
+    "temperature": "tmp.tC",
+    "brightness": "lights.0.brightness",
+    "is_on": "lights.0.ison",
+}
+
+# Concurrent writers can append records slightly out of time order, so a
+# scan only stops this many seconds after the end of the range.
+ORDER_SLACK = 60.0
+
+Chunk = Dict[str, "np.ndarray"]
+
+
+def _device_names(reader: JournalReader, devices: Optional[Sequence[str]]) -> List[str]:
+    """
+    Returns the devices to export, indexed by the "device" column.
+    """
+    return list(dict.fromkeys(reader.devices() if devices is None else devices))
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    """
+    Parses a date or time into seconds since the epoch.
+    """
+    return None if value is None else pendulum.parse(value).timestamp()  # type: ignore[union-attr]
+
+
+def iter_chunks(
+    reader: JournalReader,
+    devices: Optional[Sequence[str]] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    columns: Mapping[str, str] = DEFAULT_COLUMNS,
+    chunk_size: int = 65536,
+) -> Iterator[Chunk]:
+    """
+    Streams the recorded telemetry of devices as column arrays.
+
+    Parameters
+    ----------
+    reader : JournalReader
+        The journal.
+    devices : Optional[Sequence[str]], optional
+        The devices to export, by default all.
+    start : Optional[float], optional
+        The earliest snapshot of interest, by default the first.
+    end : Optional[float], optional
+        The latest snapshot of interest, by default the last.
+    columns : Mapping[str, str], optional
+        The exported columns and their dotted journal paths, by default
+        `DEFAULT_COLUMNS`.
+    chunk_size : int, optional
+        The maximum number of rows per chunk, by default 65536.
+
+    Yields
+    ------
+    Chunk
+        At most ``chunk_size`` rows: the "timestamp" (float seconds),
+        "device" (int32 index into ``devices``, without duplicates, or into
+        `JournalReader.devices`) and value (float64) arrays.
+    """
+    names = _device_names(reader, devices)
+    codes = {device: code for code, device in enumerate(names)}
+    paths = {path: name for name, path in columns.items()}
+    # The scan starts at the earliest keyframe any requested device needs.
+    offsets = [
+        offset
+        for device in names
+        if (offset := reader.keyframe_offset(device, start)) is not None
+    ]
+    if not offsets:
+        return
+    needles = [b'"d":' + orjson.dumps(device) for device in names]
+    filtered = len(names) < len(reader.devices())
+    states: Dict[str, Dict[str, float]] = {}
+    timestamps: List[float] = []
+    row_devices: List[int] = []
+    values: Dict[str, List[float]] = {name: [] for name in columns}
+    nan = float("nan")
+
+    def chunk() -> Chunk:
+        arrays: Chunk = {
+            "timestamp": np.array(timestamps, dtype=np.float64),
+            "device": np.array(row_devices, dtype=np.int32),
+        }
+        for name, column in values.items():
+            arrays[name] = np.array(column, dtype=np.float64)
+            column.clear()
+        timestamps.clear()
+        row_devices.clear()
+        return arrays
+
+    with open(reader.path, "rb") as file:
+        file.seek(min(offsets))
+        for line in file:
+            # Skip the records of other devices without parsing them.
+            if filtered and not any(needle in line for needle in needles):
+                continue
+            entry = orjson.loads(line)
+            device = entry["d"]
+            if device not in codes:
+                continue
+            timestamp = entry["t"]
+            if end is not None and timestamp > end:
+                if timestamp > end + ORDER_SLACK:
+                    break
+                continue
+            if entry["k"]:
+                leaves = flatten(entry["s"])
+                state = states[device] = {
+                    path: float(leaves[path]) for path in paths if path in leaves
+                }
+            else:
+                state = states.get(device)  # type: ignore[assignment]
+                if state is None:
+                    # A delta before the first keyframe of the scan.
+                    continue
+                for path, value in entry["c"].items():
+                    if path in paths:
+                        state[path] = float(value)
+                for path in entry.get("r", ()):
+                    state.pop(path, None)
+            if start is not None and timestamp < start:
+                continue
+            timestamps.append(timestamp)
+            row_devices.append(codes[device])
+            for path, name in paths.items():
+                values[name].append(state.get(path, nan))
+            if len(timestamps) >= chunk_size:
+                yield chunk()
+    if timestamps:
+        yield chunk()
+
+
+def record_batches(
+    reader: JournalReader,
+    devices: Optional[Sequence[str]] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    columns: Mapping[str, str] = DEFAULT_COLUMNS,
+    chunk_size: int = 65536,
+) -> Iterator[Any]:
+    """
+    Streams the recorded telemetry of devices as Arrow record batches.
+
+    The parameters are those of `iter_chunks`. The "timestamp" column has
+    the type ``timestamp[us, UTC]`` and the "device" column is dictionary
+    encoded.
+
+    Yields
+    ------
+    pyarrow.RecordBatch
+        One batch per chunk.
+    """
+    import pyarrow as pa
+
+    # Every batch shares the dictionary of all exported devices.
+    dictionary = pa.array(_device_names(reader, devices), pa.string())
+    for arrays in iter_chunks(reader, devices, start, end, columns, chunk_size):
+        fields = {
+            "timestamp": pa.array(
+                (arrays.pop("timestamp") * 1e6).astype(np.int64),
+                pa.timestamp("us", tz="UTC"),
+            ),
+            "device": pa.DictionaryArray.from_arrays(arrays.pop("device"), dictionary),
+        }
+        fields.update((name, pa.array(array)) for name, array in arrays.items())
+        yield pa.RecordBatch.from_pydict(fields)
+
+
+def write_arrow(
+    path: Union[str, Path],
+    reader: JournalReader,
+    devices: Optional[Sequence[str]] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    columns: Mapping[str, str] = DEFAULT_COLUMNS,
+    chunk_size: int = 65536,
+) -> int:
+    """
+    Writes the recorded telemetry of devices to an Arrow IPC file.
+
+    The parameters after ``path`` are those of `iter_chunks`.
+
+    Parameters
+    ----------
+    path : Union[str, Path]
+        The file to write, read back with ``pyarrow.ipc.open_file``.
+
+    Returns
+    -------
+    int
+        The number of rows written.
+    """
+    import pyarrow as pa
+
+    rows = 0
+    writer = None
+    try:
+        for batch in record_batches(reader, devices, start, end, columns, chunk_size):
+            if writer is None:
+                writer = pa.ipc.new_file(str(path), batch.schema)
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def write_npy(
+    directory: Union[str, Path],
+    reader: JournalReader,
+    devices: Optional[Sequence[str]] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    columns: Mapping[str, str] = DEFAULT_COLUMNS,
+    chunk_size: int = 65536,
+) -> int:
+    """
+    Writes the recorded telemetry of devices to one ``.npy`` file per column.
+
+    Chunks are appended to the files as they are produced and the array
+    headers are rewritten with the final length at the end, so the files
+    can be opened with ``np.load(..., mmap_mode="r")``. The device names
+    are written to ``devices.json``, indexed by the "device" column. The
+    parameters after ``directory`` are those of `iter_chunks`.
+
+    Parameters
+    ----------
+    directory : Union[str, Path]
+        The directory to write to, created if needed.
+
+    Returns
+    -------
+    int
+        The number of rows written.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    dtypes = {"timestamp": np.dtype(np.float64), "device": np.dtype(np.int32)}
+    dtypes.update((name, np.dtype(np.float64)) for name in columns)
+    files = {name: open(directory / f"{name}.npy", "wb") for name in dtypes}
+    rows = 0
+    try:
+        for file, dtype in zip(files.values(), dtypes.values()):
+            np.lib.format.write_array_header_1_0(
+                file, {"descr": dtype.str, "fortran_order": False, "shape": (0,)}
+            )
+        for arrays in iter_chunks(reader, devices, start, end, columns, chunk_size):
+            for name, array in arrays.items():
+                files[name].write(array.tobytes())
+            rows += len(arrays["timestamp"])
+        for file, dtype in zip(files.values(), dtypes.values()):
+            header_end = file.tell() - rows * dtype.itemsize
+            file.seek(0)
+            np.lib.format.write_array_header_1_0(
+                file, {"descr": dtype.str, "fortran_order": False, "shape": (rows,)}
+            )
+            # NumPy pads headers so that the length can grow in place.
+            assert file.tell() == header_end
+    finally:
+        for file in files.values():
+            file.close()
+    (directory / "devices.json").write_bytes(
+        orjson.dumps(_device_names(reader, devices))
+    )
+    return rows
+
+
+@click.command()
+@click.argument("journal", type=click.Path(exists=True, dir_okay=False))
+@click.argument("output", type=click.Path())
+@click.option(
+    "--device", "devices", multiple=True, help="Device to export, by default all."
+)
+@click.option(
+    "--start", help="Earliest time, e.g. 2024-03-01 or 2024-03-01T12:00:00+01:00."
+)
+@click.option("--end", help="Latest time.")
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["arrow", "npy"]),
+    default="arrow",
+    show_default=True,
+    help="An Arrow IPC file, or a directory of .npy files.",
+)
+@click.option("--chunk-size", default=65536, show_default=True, help="Rows per chunk.")
+def main(
+    journal: str,
+    output: str,
+    devices: Sequence[str],
+    start: Optional[str],
+    end: Optional[str],
+    output_format: str,
+    chunk_size: int,
+) -> None:
+    """
+    Exports the telemetry recorded in JOURNAL to OUTPUT.
+    """
+    write = write_arrow if output_format == "arrow" else write_npy
+    rows = write(
+        output,
+        JournalReader(journal),
+        devices or None,
+        _timestamp(start),
+        _timestamp(end),
+        chunk_size=chunk_size,
+    )
+    click.echo(f"Exported {rows} rows to {output}")
+
+
+if __name__ == "__main__":
+    main()
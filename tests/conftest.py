@@ -0,0 +1,9 @@
+import pytest
+
+from shelly.log_config import configure_logging
+
+
+@pytest.fixture(scope="session", autouse=True)
+def no_log_files():
+    # Devices set up the log files in the source tree unless told otherwise.
+    configure_logging(directory=None)
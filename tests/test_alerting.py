@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from shelly.alerting import FleetAlerts, Rule
+
+HOT = Rule(
+    "hot", "temperature", ">", 70.0, clear=65.0, for_seconds=30.0, clear_for=30.0
+)
+
+
+def evaluate(alerts, temperatures, now, ok=None):
+    columns = {"temperature": np.array(temperatures, dtype=float)}
+    if ok is not None:
+        columns["ok"] = np.array(ok, dtype=bool)
+    return alerts.evaluate(["a", "b"][: len(temperatures)], columns, now)
+
+
+def test_fires_after_for_seconds_and_resolves_with_hysteresis():
+    alerts = FleetAlerts([HOT])
+    assert evaluate(alerts, [75.0, 60.0], 0.0) == []
+    (fired,) = evaluate(alerts, [76.0, 60.0], 30.0)
+    assert (fired.rule, fired.device, fired.firing) == ("hot", "a", True)
+    assert [alert.device for alert in alerts.active()] == ["a"]
+    # Between the thresholds nothing changes.
+    assert evaluate(alerts, [68.0, 60.0], 40.0) == []
+    assert evaluate(alerts, [64.0, 60.0], 50.0) == []
+    (resolved,) = evaluate(alerts, [64.0, 60.0], 80.0)
+    assert not resolved.firing
+    assert alerts.active() == []
+
+
+def test_short_breach_does_not_fire():
+    alerts = FleetAlerts([HOT])
+    evaluate(alerts, [75.0], 0.0)
+    evaluate(alerts, [60.0], 10.0)
+    assert evaluate(alerts, [75.0], 35.0) == []
+
+
+def test_stale_samples_keep_the_pending_timer():
+    alerts = FleetAlerts([HOT])
+    evaluate(alerts, [75.0], 0.0)
+    # A missed poll in the middle of the breach.
+    assert evaluate(alerts, [0.0], 15.0, ok=[False]) == []
+    (fired,) = evaluate(alerts, [75.0], 30.0)
+    assert fired.firing
+
+
+def test_stale_samples_keep_the_clearing_timer():
+    alerts = FleetAlerts([HOT])
+    evaluate(alerts, [75.0], 0.0)
+    evaluate(alerts, [75.0], 30.0)
+    evaluate(alerts, [60.0], 40.0)
+    assert evaluate(alerts, [99.0], 55.0, ok=[False]) == []
+    (resolved,) = evaluate(alerts, [60.0], 70.0)
+    assert not resolved.firing
+
+
+def test_relative_rule_skips_devices_without_reference():
+    rule = Rule("near", "power", ">", 0.9, relative_to="overpower")
+    alerts = FleetAlerts([rule])
+    columns = {"power": np.array([95.0, 95.0]), "overpower": np.array([100.0, 0.0])}
+    fired = alerts.evaluate(["a", "b"], columns, 0.0)
+    assert [alert.device for alert in fired] == ["a"]
+
+
+def test_unknown_op_is_rejected():
+    with pytest.raises(ValueError):
+        Rule("bad", "power", "==", 1.0)
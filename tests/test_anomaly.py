@@ -0,0 +1,94 @@
+import pytest
+
+from shelly.anomaly import (
+    LAMP_FAILED,
+    LAMP_RECOVERED,
+    LOAD_CHANGED,
+    PowerAnomalyDetector,
+)
+from shelly.fleet import StatusSample
+
+NOISE = [0.1, -0.1, 0.05, -0.05, 0.0]
+
+
+@pytest.fixture
+def detector():
+    detector = PowerAnomalyDetector()
+    detector.events = []
+    detector.add_listener(detector.events.append)
+    return detector
+
+
+def feed(detector, powers, is_on=True, brightness=50, device="a"):
+    return [detector.update(device, power, is_on, brightness, 0.0) for power in powers]
+
+
+def steady(level, count=20):
+    return [level + NOISE[index % len(NOISE)] for index in range(count)]
+
+
+def test_load_change_after_step_samples(detector):
+    feed(detector, steady(20.0))
+    assert detector.baseline("a")[0] == pytest.approx(20.0, abs=0.1)
+    results = feed(detector, [30.0, 30.2, 29.8])
+    assert results[:2] == [None, None]
+    event = results[2]
+    assert event.kind == LOAD_CHANGED
+    assert event.power == pytest.approx(30.0)
+    assert event.expected == pytest.approx(20.0, abs=0.1)
+    assert event.zscore > detector.z_threshold
+    assert detector.baseline("a")[0] == pytest.approx(30.0)
+    # The new level is the baseline now.
+    assert not any(feed(detector, steady(30.0)))
+
+
+def test_transient_is_ignored(detector):
+    feed(detector, steady(20.0))
+    mean, std = detector.baseline("a")
+    assert not any(feed(detector, [35.0, 35.0, 20.0, 20.1, 5.0, 19.9]))
+    assert detector.events == []
+    # Outliers were held back from the average.
+    assert detector.baseline("a")[0] == pytest.approx(mean, abs=0.1)
+
+
+def test_outliers_in_opposite_directions_do_not_add_up(detector):
+    feed(detector, steady(20.0))
+    assert not any(feed(detector, [35.0, 35.0, 5.0, 5.0, 35.0]))
+
+
+def test_lamp_failed_and_recovered(detector):
+    feed(detector, steady(20.0))
+    results = feed(detector, [0.0, 0.1, 0.0, 0.0])
+    assert [event and event.kind for event in results] == [
+        None,
+        None,
+        LAMP_FAILED,
+        None,
+    ]
+    event = feed(detector, [20.0])[0]
+    assert (event.kind, event.power) == (LAMP_RECOVERED, 20.0)
+    assert [event.kind for event in detector.events] == [LAMP_FAILED, LAMP_RECOVERED]
+
+
+def test_off_lamp_is_not_failed(detector):
+    feed(detector, steady(20.0))
+    assert not any(feed(detector, [0.0] * 10, is_on=False))
+    assert not any(feed(detector, [0.0] * 10, brightness=0))
+
+
+def test_brightness_change_restarts_baseline(detector):
+    feed(detector, steady(20.0))
+    # The ramp to the new level is ignored, then a new average starts.
+    results = feed(detector, [5.0, 8.0, 10.0, 10.1, 9.9, 10.0], brightness=25)
+    assert not any(results)
+    assert detector.baseline("a")[0] == pytest.approx(10.0, abs=0.1)
+    assert detector.events == []
+
+
+def test_update_samples_skips_failed_polls(detector):
+    ok = [StatusSample("a", 0.0, True, is_on=True, brightness=50, power=20.0)] * 20
+    assert detector.update_samples(ok) == []
+    failed = [StatusSample("a", 0.0, False, is_on=True, brightness=50, power=0.0)] * 5
+    assert detector.update_samples(failed) == []
+    low = [StatusSample("a", 0.0, True, is_on=True, brightness=50, power=0.0)] * 3
+    assert [event.kind for event in detector.update_samples(low)] == [LAMP_FAILED]
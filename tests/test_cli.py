@@ -0,0 +1,74 @@
+import orjson
+from click.testing import CliRunner
+
+from shelly.benchmarks import simulated_fleet
+from shelly.cli import main, read_addresses
+from shelly.dimmer2 import Dimmer2
+from shelly.log_config import configure_logging
+from shelly.simulator import SimulatorConfig
+
+
+def rows(output):
+    return [orjson.loads(line) for line in output.splitlines() if line.startswith("{")]
+
+
+def test_read_addresses_skips_comments_and_duplicates():
+    source = ["10.0.0.1  # kitchen\n", "\n", "# hall\n", "10.0.0.2\n", "10.0.0.1\n"]
+    assert read_addresses(["10.0.0.3"], source) == ["10.0.0.3", "10.0.0.1", "10.0.0.2"]
+
+
+def test_bench_reports_http_errors():
+    config = SimulatorConfig(latency=0.0, jitter=0.0, failure_rate=1.0)
+    with simulated_fleet(2, config) as fleet:
+        result = CliRunner().invoke(
+            main, ["bench", "--requests", "3", "--format", "jsonl", *fleet.addresses]
+        )
+    assert result.exit_code == 1
+    assert [row["ok"] for row in rows(result.output)] == [False, False]
+
+
+def test_set_and_status():
+    with simulated_fleet(2) as fleet:
+        runner = CliRunner()
+        result = runner.invoke(
+            main, ["set", "--turn", "on", "--brightness", "30", *fleet.addresses]
+        )
+        assert result.exit_code == 0, result.output
+        result = runner.invoke(main, ["status", "--format", "jsonl", *fleet.addresses])
+    assert result.exit_code == 0, result.output
+    assert [(row["is_on"], row["brightness"]) for row in rows(result.output)] == [
+        (True, 30)
+    ] * 2
+
+
+def test_keeps_handlers_of_configured_logging(tmp_path):
+    configure_logging(directory=tmp_path, enqueue=False)
+    try:
+        with simulated_fleet(1) as fleet:
+            for _ in range(2):
+                result = CliRunner().invoke(
+                    main, ["--verbose", "status", *fleet.addresses]
+                )
+                assert result.exit_code == 0, result.output
+    finally:
+        configure_logging(directory=None)
+
+
+def test_closes_devices(monkeypatch):
+    closed = []
+    monkeypatch.setattr(Dimmer2, "close", lambda self: closed.append(self.ip))
+    with simulated_fleet(2) as fleet:
+        runner = CliRunner()
+        for command in (
+            ["status"],
+            ["set", "--turn", "off"],
+            ["bench", "--requests", "1"],
+        ):
+            closed.clear()
+            result = runner.invoke(main, [*command, *fleet.addresses])
+            assert result.exit_code == 0, result.output
+            assert sorted(closed) == sorted(fleet.addresses)
+        closed.clear()
+        result = runner.invoke(main, ["watch", "--count", "1", *fleet.addresses])
+    assert result.exit_code == 0, result.output
+    assert sorted(closed) == sorted(fleet.addresses)
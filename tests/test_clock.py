@@ -0,0 +1,31 @@
+import threading
+
+import pendulum
+import pytest
+
+from shelly.clock import Clock, VirtualClock
+
+START = pendulum.datetime(2024, 3, 4, 12, 0, tz="UTC")
+
+
+def test_clock_is_abstract():
+    with pytest.raises(TypeError):
+        Clock()
+
+
+def test_virtual_clock_moves_only_forward():
+    clock = VirtualClock(START, tz=pendulum.UTC)
+    assert clock.now() == START
+    assert clock.advance(90) == START.add(seconds=90)
+    with pytest.raises(ValueError):
+        clock.set(START)
+    assert not clock.wait(threading.Event(), 30)
+    assert clock.now() == START.add(minutes=2)
+
+
+def test_tick_freezes_now():
+    clock = VirtualClock(START, tz=pendulum.UTC)
+    with clock.tick() as tick_time:
+        clock.advance(60)
+        assert clock.now() == tick_time == START
+    assert clock.now() == START.add(minutes=1)
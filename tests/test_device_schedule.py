@@ -0,0 +1,87 @@
+import pendulum
+from pendulum.day import WeekDay
+
+from shelly.device_schedule import MAX_RULES, compile_schedules
+from shelly.dimmer2 import Dimmer2
+from shelly.scheduling import Repeater, ScheduledEvent, When
+
+START = pendulum.datetime(2024, 3, 4, 0, 0, tz="UTC")
+NOW = START.add(days=1)
+
+
+def event(dimmer, time, weekday, action="on", start=START, end=None):
+    repeater = Repeater(weekday, start=START)
+    return ScheduledEvent(
+        dimmer, When(time, start=start, end=end, repeater=repeater), action
+    )
+
+
+def test_merges_weekdays_into_one_rule():
+    dimmer = Dimmer2("10.0.0.1", autostart=False)
+    weekdays = [
+        WeekDay.MONDAY,
+        WeekDay.TUESDAY,
+        WeekDay.WEDNESDAY,
+        WeekDay.THURSDAY,
+        WeekDay.FRIDAY,
+    ]
+    events = [event(dimmer, "07:00", day) for day in weekdays]
+    events += [
+        event(dimmer, "22:30", WeekDay.SUNDAY, "off"),
+        event(dimmer, "08:05", WeekDay.SATURDAY),
+    ]
+    compiled = compile_schedules(events, NOW)
+    assert compiled.rules == {"10.0.0.1": ["0700-01234-on", "0805-5-on", "2230-6-off"]}
+    assert compiled.devices == {"10.0.0.1": dimmer}
+    assert len(compiled.events["10.0.0.1"]) == len(events)
+    assert compiled.host == []
+
+
+def test_rules_are_per_device():
+    first, second = Dimmer2("10.0.0.1", autostart=False), Dimmer2(
+        "10.0.0.2", autostart=False
+    )
+    compiled = compile_schedules(
+        [
+            event(first, "07:00", WeekDay.MONDAY),
+            event(second, "07:00", WeekDay.MONDAY, "off"),
+        ],
+        NOW,
+    )
+    assert compiled.rules == {"10.0.0.1": ["0700-0-on"], "10.0.0.2": ["0700-0-off"]}
+
+
+def test_inexpressible_events_run_on_the_host():
+    dimmer = Dimmer2("10.0.0.1", autostart=False)
+    host = [
+        event(dimmer, "07:00:30", WeekDay.MONDAY),
+        event(dimmer, "07:00", WeekDay.MONDAY, "on brightness=40"),
+        event(dimmer, "07:00", WeekDay.MONDAY, "toggle"),
+        event(dimmer, "07:00", WeekDay.MONDAY, end=NOW.add(days=7)),
+        event(dimmer, "07:00", WeekDay.MONDAY, start=NOW.add(days=1)),
+        ScheduledEvent(
+            dimmer,
+            When(
+                "07:00",
+                start=START,
+                repeater=Repeater(pendulum.duration(hours=1), start=START),
+            ),
+            "on",
+        ),
+        ScheduledEvent(dimmer, When("07:00", start=START), "on"),
+    ]
+    compiled = compile_schedules(host, NOW)
+    assert compiled.rules == {}
+    assert compiled.host == host
+
+
+def test_rules_beyond_the_limit_run_on_the_host():
+    dimmer = Dimmer2("10.0.0.1", autostart=False)
+    events = [
+        event(dimmer, f"{hour:02d}:00", WeekDay.MONDAY) for hour in range(MAX_RULES + 3)
+    ]
+    compiled = compile_schedules(events, NOW)
+    assert len(compiled.rules["10.0.0.1"]) == MAX_RULES
+    assert compiled.rules["10.0.0.1"][-1] == f"{MAX_RULES - 1:02d}00-0-on"
+    assert compiled.host == events[MAX_RULES:]
+    assert len(compiled.events["10.0.0.1"]) == MAX_RULES
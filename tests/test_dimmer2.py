@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import pytest
+
+from shelly.benchmarks import simulated_fleet
+from shelly.dimmer2 import Dimmer2
+from shelly.simulator import SimulatorConfig
+
+
+@pytest.fixture(scope="module")
+def fleet():
+    with simulated_fleet(200) as fleet:
+        yield fleet
+
+
+def test_devices_have_own_clients(fleet):
+    first, second = (
+        Dimmer2(address, autostart=False) for address in fleet.addresses[:2]
+    )
+    first.get_status()
+    second.get_status()
+    assert first._client() is not second._client()
+    assert first._client() is first._client()
+    assert first.status_age is not None
+
+
+def test_fleet_polling_does_not_serialize():
+    config = SimulatorConfig(latency=0.05, jitter=0.0, max_connections=64)
+    with simulated_fleet(200, config) as fleet:
+        dimmers = [Dimmer2(address, autostart=False) for address in fleet.addresses]
+        with ThreadPoolExecutor(max_workers=64) as executor:
+            list(executor.map(Dimmer2.get_status, dimmers))
+            start = time.perf_counter()
+            list(executor.map(Dimmer2.get_status, dimmers))
+            elapsed = time.perf_counter() - start
+        for dimmer in dimmers:
+            dimmer.close()
+    assert all(dimmer.status_age is not None for dimmer in dimmers)
+    # Requests sent in turn, as through one shared connection pool, take at
+    # least the latency of every device; 64 threads need about 4 of them.
+    assert elapsed < len(dimmers) * config.latency / 4
@@ -0,0 +1,109 @@
+import asyncio
+from contextlib import contextmanager
+import threading
+
+import pytest
+
+from shelly import discovery
+from shelly.discovery import DiscoveredDevice, DiscoveryCache, discover, locate, scan
+from shelly.simulator import SimulatedDimmer, SimulatorConfig
+
+NETWORK = "127.0.0.0/29"
+MACS = ["EC64C9000002", "EC64C9000003", "EC64C9000004"]
+
+
+@contextmanager
+def event_loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield loop
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+@pytest.fixture
+def network():
+    """
+    Serves simulated dimmers on 127.0.0.2-4, all on the same port.
+    """
+    config = SimulatorConfig(latency=0.0, jitter=0.0)
+    with event_loop() as loop:
+
+        def start(mac, host, port):
+            device = SimulatedDimmer(mac, host=host, port=port, config=config)
+            asyncio.run_coroutine_threadsafe(device.start(), loop).result()
+            return device
+
+        def stop(device):
+            asyncio.run_coroutine_threadsafe(device.stop(), loop).result()
+
+        first = start(MACS[0], "127.0.0.2", 0)
+        devices = [first] + [
+            start(mac, f"127.0.0.{index}", first.port)
+            for index, mac in enumerate(MACS[1:], 3)
+        ]
+        yield devices, start, stop
+        for device in devices:
+            stop(device)
+
+
+def test_scan_finds_every_device(network):
+    devices, _, _ = network
+    port = devices[0].port
+    found = asyncio.run(scan(NETWORK, port=port, timeout=1.0))
+    assert [(device.mac, device.ip, device.type) for device in found] == [
+        (mac, f"127.0.0.{index}:{port}", "SHDM-2") for index, mac in enumerate(MACS, 2)
+    ]
+    assert found[0].mqtt_id == f"shellydimmer2-{MACS[0]}"
+    assert asyncio.run(scan(NETWORK, port=port, types=("SHSW-1",), timeout=1.0)) == []
+
+
+def test_cache_round_trip(tmp_path):
+    path = tmp_path / "devices.json"
+    cache = DiscoveryCache(path)
+    cache.update([DiscoveredDevice("EC64C9000002", "10.0.0.2", "SHDM-2", "1.0", 5.0)])
+    cache.save()
+    assert DiscoveryCache(path).get("ec64c9000002") == cache.devices["EC64C9000002"]
+    path.write_bytes(b"[1, 2]")
+    assert DiscoveryCache(path).devices == {}
+
+
+def test_cached_devices_are_not_rescanned(network, tmp_path, monkeypatch):
+    devices, _, _ = network
+    port = devices[0].port
+    cache = DiscoveryCache(tmp_path / "devices.json")
+    assert set(asyncio.run(discover(NETWORK, cache, port=port, timeout=1.0))) == set(
+        MACS
+    )
+
+    async def no_scan(*args, **kwargs):
+        raise AssertionError("scanned although every device was cached")
+
+    monkeypatch.setattr(discovery, "scan", no_scan)
+    cache = DiscoveryCache(tmp_path / "devices.json")
+    assert set(asyncio.run(discover(NETWORK, cache, port=port, timeout=1.0))) == set(
+        MACS
+    )
+
+
+def test_locate_follows_a_moved_device(network, tmp_path):
+    devices, start, stop = network
+    port = devices[0].port
+    path = tmp_path / "devices.json"
+    dimmer = locate(MACS[0], NETWORK, path, port=port, autostart=False)
+    assert dimmer.ip == f"127.0.0.2:{port}"
+    dimmer.close()
+
+    stop(devices[0])
+    devices[0] = start(MACS[0], "127.0.0.5", port)
+    dimmer = locate(MACS[0].lower(), NETWORK, path, port=port, autostart=False)
+    assert dimmer.ip == f"127.0.0.5:{port}"
+    dimmer.close()
+    assert DiscoveryCache(path).get(MACS[0]).ip == f"127.0.0.5:{port}"
+
+    with pytest.raises(LookupError):
+        locate("EC64C9FFFFFF", NETWORK, path, port=port, autostart=False)
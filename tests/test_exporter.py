@@ -0,0 +1,70 @@
+import httpx
+
+from shelly.benchmarks import simulated_fleet
+from shelly.dimmer2 import Dimmer2
+from shelly.exporter import CONTENT_TYPE, FleetExporter
+
+
+def samples(text, name):
+    return [line for line in text.splitlines() if line.startswith(name + "{")]
+
+
+def test_renders_unpolled_devices_with_escaped_labels():
+    dimmer = Dimmer2('a"b\\c\nd', autostart=False)
+    text = FleetExporter([dimmer]).render().decode()
+    assert text.endswith("\n# EOF\n")
+    assert samples(text, "shelly_up") == ['shelly_up{device="a\\"b\\\\c\\nd"} 0']
+    assert samples(text, "shelly_device_info") == []
+    assert samples(text, "shelly_power_watts") == []
+    assert 'shelly_client_requests_total{device="a\\"b\\\\c\\nd"} 0' in text
+
+
+def test_label_set_is_stable_once_the_mac_is_known():
+    with simulated_fleet(1) as fleet:
+        dimmer = Dimmer2(fleet.addresses[0], autostart=False)
+        exporter = FleetExporter([dimmer])
+        before = exporter.render().decode()
+        dimmer.get_status()
+        after = exporter.render().decode()
+        dimmer.close()
+    labels = f'{{device="{dimmer.ip}"}}'
+    assert samples(before, "shelly_up") == [f"shelly_up{labels} 0"]
+    assert samples(after, "shelly_up") == [f"shelly_up{labels} 1"]
+    status = dimmer.cached_status
+    assert samples(after, "shelly_device_info") == [
+        f'shelly_device_info{{device="{dimmer.ip}",mac="{status.mac}"}} 1'
+    ]
+    assert samples(after, "shelly_power_watts") == [
+        f"shelly_power_watts{labels} {status.meters[0].power!r}"
+    ]
+    assert samples(after, "shelly_energy_total") == [
+        f"shelly_energy_total{labels} {status.meters[0].total}"
+    ]
+    assert samples(after, "shelly_light_on") == [
+        f"shelly_light_on{labels} {int(status.lights[0].is_on)}"
+    ]
+    endpoint = f'device="{dimmer.ip}",endpoint="status"'
+    assert (
+        f'shelly_client_request_duration_seconds_bucket{{{endpoint},le="+Inf"}} 1'
+        in after
+    )
+    assert f"shelly_client_request_duration_seconds_count{{{endpoint}}} 1" in after
+    assert f"shelly_client_requests_total{labels} 1" in after
+    # Every family is declared once, before its samples.
+    types = [
+        line.split()[2] for line in after.splitlines() if line.startswith("# TYPE")
+    ]
+    assert len(types) == len(set(types))
+
+
+def test_serves_metrics():
+    exporter = FleetExporter([Dimmer2("10.0.0.1", autostart=False)])
+    exporter.serve("127.0.0.1", 0)
+    try:
+        port = exporter._server.server_address[1]
+        response = httpx.get(f"http://127.0.0.1:{port}/metrics")
+        assert response.headers["content-type"] == CONTENT_TYPE
+        assert response.content == exporter.render()
+        assert httpx.get(f"http://127.0.0.1:{port}/other").status_code == 404
+    finally:
+        exporter.stop()
@@ -0,0 +1,45 @@
+import time
+
+from shelly.benchmarks import simulated_fleet
+from shelly.dimmer2 import Dimmer2
+from shelly.fleet import ShardedPoller, poll
+from shelly.simulator import SimulatorConfig
+
+
+def test_poll_reports_http_errors():
+    config = SimulatorConfig(latency=0.0, jitter=0.0, failure_rate=1.0)
+    with simulated_fleet(1, config) as fleet:
+        dimmer = Dimmer2(fleet.addresses[0], autostart=False)
+        sample = poll(dimmer)
+    assert not sample.ok
+    assert sample.error.startswith("HTTPStatusError")
+    assert dimmer.health()["last_error"] is None
+
+
+def test_poll_reports_fresh_samples():
+    with simulated_fleet(1) as fleet:
+        dimmer = Dimmer2(fleet.addresses[0], autostart=False)
+        sample = poll(dimmer)
+    assert sample.ok
+    assert sample.error is None
+    assert sample.mac == dimmer.cached_status.mac
+    assert dimmer.poll_error is None
+
+
+def test_stop_drains_results_of_busy_workers():
+    with simulated_fleet(50) as fleet:
+        poller = ShardedPoller(fleet.addresses, processes=2, interval=0.0, threads=8)
+        # A slow consumer lets batches pile up in the results queue.
+        poller.add_listener(lambda samples: time.sleep(0.05))
+        poller.start()
+        deadline = time.monotonic() + 30
+        while len(poller.samples) < 50 and time.monotonic() < deadline:
+            time.sleep(0.1)
+        time.sleep(1.0)
+        workers = list(poller._processes)
+        poller.stop()
+    assert len(poller.samples) == 50
+    # The workers exited by themselves rather than being terminated after
+    # the join timeout, and the collector thread is gone.
+    assert [worker.exitcode for worker in workers] == [0, 0]
+    assert poller._collector is None
@@ -0,0 +1,94 @@
+import httpx
+import pytest
+
+from shelly.dimmer2 import Dimmer2
+from shelly.health import BreakerState, CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, jitter=0.0, clock=FakeClock())
+    for _ in range(2):
+        breaker.record_failure(OSError("refused"))
+    assert breaker.state is BreakerState.closed
+    breaker.record_success()
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure(OSError("refused"))
+    assert breaker.state is BreakerState.open
+    assert not breaker.allow()
+    assert breaker.snapshot()["last_error"] == "OSError: refused"
+
+
+def test_single_probe_after_backoff():
+    clock = FakeClock()
+    breaker = CircuitBreaker(
+        failure_threshold=1, base_delay=1.0, jitter=0.0, clock=clock
+    )
+    breaker.record_failure()
+    assert breaker.retry_in == 1.0
+    clock.now = 1.0
+    assert breaker.allow()
+    assert breaker.state is BreakerState.half_open
+    # Only one caller probes the device.
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state is BreakerState.closed
+    assert breaker.allow()
+
+
+def test_backoff_doubles_up_to_max_delay():
+    clock = FakeClock()
+    breaker = CircuitBreaker(
+        failure_threshold=1, base_delay=1.0, max_delay=4.0, jitter=0.0, clock=clock
+    )
+    delays = []
+    for _ in range(4):
+        breaker.record_failure()
+        delays.append(breaker.retry_in)
+        clock.now += breaker.retry_in
+        assert breaker.allow()
+    assert delays == [1.0, 2.0, 4.0, 4.0]
+
+
+def test_jitter_only_shortens_backoff():
+    breaker = CircuitBreaker(
+        failure_threshold=1, base_delay=10.0, jitter=0.2, clock=FakeClock()
+    )
+    breaker.record_failure()
+    assert 8.0 <= breaker.retry_in <= 10.0
+
+
+def test_release_lets_the_next_caller_probe():
+    breaker = CircuitBreaker(
+        failure_threshold=1, base_delay=0.0, jitter=0.0, clock=FakeClock()
+    )
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.state is BreakerState.half_open
+    assert breaker.allow()
+
+
+@pytest.mark.parametrize("error", [httpx.DecodingError("garbage"), KeyboardInterrupt()])
+def test_failed_probe_does_not_short_circuit_forever(monkeypatch, error):
+    dimmer = Dimmer2("127.0.0.1:1", autostart=False)
+    dimmer._breaker = CircuitBreaker(failure_threshold=1, base_delay=0.0, jitter=0.0)
+    dimmer._breaker.record_failure()
+
+    def fail(*args):
+        raise error
+
+    monkeypatch.setattr(dimmer, "_timed_request", fail)
+    with pytest.raises(type(error)):
+        dimmer._request("GET", "status")
+    assert not dimmer._breaker._probing
+    assert dimmer._breaker.allow()
@@ -0,0 +1,110 @@
+import pytest
+
+from models import Status
+from models.status import SAMPLE_STATUS
+from shelly.inputs import HTTP, MQTT, InputEvents, device_mac
+from shelly.mqtt_ingest import MQTTIngest
+
+MAC = SAMPLE_STATUS["mac"]
+
+
+@pytest.fixture
+def inputs():
+    inputs = InputEvents()
+    inputs.events = []
+    inputs.add_listener(inputs.events.append)
+    return inputs
+
+
+def status(uptime, counter, level=0):
+    data = dict(SAMPLE_STATUS, uptime=uptime)
+    data["inputs"] = [{"input": level, "event": "S", "event_cnt": counter}] * 2
+    return Status(**data)
+
+
+def test_device_mac():
+    assert device_mac("shellydimmer2-ec64c9c2efe2") == MAC
+
+
+def test_each_press_is_reported_once(inputs):
+    assert inputs.observe(MAC, 0, 5, "S", MQTT).presses == 1
+    assert inputs.observe(MAC, 0, 5, "S", HTTP) is None
+    assert inputs.observe(MAC, 0, 7, "L", HTTP).presses == 2
+    assert inputs.observe(MAC, 0, 7, "L", MQTT) is None
+    assert [(event.counter, event.source) for event in inputs.events] == [
+        (5, MQTT),
+        (7, HTTP),
+    ]
+
+
+def test_first_poll_is_history(inputs):
+    inputs.listener(None, status(100, 5))
+    assert inputs.events == []
+    inputs.listener(None, status(101, 6))
+    assert [(event.channel, event.presses) for event in inputs.events] == [
+        (0, 1),
+        (1, 1),
+    ]
+
+
+def test_poll_rebases_after_restart(inputs):
+    inputs.listener(None, status(100, 5))
+    inputs.listener(None, status(10, 2))
+    assert [event.presses for event in inputs.events] == [2, 2]
+    inputs.listener(None, status(11, 2))
+    assert len(inputs.events) == 2
+
+
+def test_mqtt_rebases_after_restart_without_polls(inputs):
+    inputs.observe(MAC, 0, 5, "S", MQTT)
+    event = inputs.observe(MAC, 0, 1, "S", MQTT)
+    assert (event.counter, event.presses) == (1, 1)
+    assert inputs.observe(MAC, 0, 2, "S", MQTT).presses == 1
+
+
+def test_mqtt_rebases_after_large_drop(inputs):
+    inputs.listener(None, status(100, 50))
+    event = inputs.observe(MAC, 0, 1, "S", MQTT)
+    assert (event.counter, event.presses) == (1, 1)
+    # The next poll rebases the other input without repeating the press.
+    inputs.listener(None, status(10, 1))
+    assert [(event.channel, event.source) for event in inputs.events] == [
+        (0, MQTT),
+        (1, HTTP),
+    ]
+    inputs.listener(None, status(11, 2))
+    assert [event.presses for event in inputs.events[2:]] == [1, 1]
+
+
+def test_mqtt_behind_a_poll_is_ignored(inputs):
+    inputs.listener(None, status(100, 5))
+    inputs.listener(None, status(101, 7))
+    # Delayed messages of presses the poll already reported.
+    assert inputs.observe(MAC, 0, 6, "S", MQTT) is None
+    assert inputs.observe(MAC, 0, 7, "S", MQTT) is None
+    assert [event.source for event in inputs.events] == [HTTP, HTTP]
+
+
+def test_polled_levels_wait_for_mqtt_grace():
+    inputs = InputEvents(mqtt_grace=60.0)
+    assert inputs.observe_level(MAC, 0, False, MQTT) is None
+    assert inputs.observe_level(MAC, 0, True, HTTP) is None
+    assert inputs.observe_level(MAC, 0, True, MQTT).event == "on"
+
+    inputs = InputEvents(mqtt_grace=0.0)
+    inputs.observe_level(MAC, 0, False, MQTT)
+    assert inputs.observe_level(MAC, 0, True, HTTP).event == "on"
+
+
+def test_mqtt_messages(inputs):
+    ingest = MQTTIngest()
+    inputs.attach(ingest)
+    device = f"shellies/shellydimmer2-{MAC.lower()}"
+    ingest.dispatch(f"{device}/input_event/1", b'{"event":"L","event_cnt":3}')
+    ingest.dispatch(f"{device}/input/1", b"0")
+    ingest.dispatch(f"{device}/input/1", b"1")
+    ingest.dispatch(f"{device}/input_event/1", b"garbage")
+    assert [(event.device, event.channel, event.event) for event in inputs.events] == [
+        (MAC, 1, "L"),
+        (MAC, 1, "on"),
+    ]
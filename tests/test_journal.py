@@ -0,0 +1,48 @@
+import copy
+
+from models.status import SAMPLE_STATUS
+from shelly.journal import JournalReader, StatusJournal, flatten, unflatten
+
+
+def test_flatten_round_trip():
+    assert unflatten(flatten(SAMPLE_STATUS)) == SAMPLE_STATUS
+
+
+def test_records_deltas_and_replays_states(tmp_path):
+    path = tmp_path / "status.jsonl"
+    journal = StatusJournal(path, keyframe_interval=100.0)
+    states = []
+    for second in range(5):
+        state = copy.deepcopy(SAMPLE_STATUS)
+        state["meters"][0]["power"] = float(second)
+        states.append(state)
+        assert journal.record("a", state, 1000.0 + second) > 0
+    # Unchanged snapshots are not written.
+    assert journal.record("a", states[-1], 1005.0) == 0
+    journal.record("b", SAMPLE_STATUS, 1002.5)
+    journal.close()
+
+    reader = JournalReader(path)
+    assert sorted(reader.devices()) == ["a", "b"]
+    assert [timestamp for timestamp, _ in reader.replay("a")] == [
+        1000.0 + s for s in range(5)
+    ]
+    assert [
+        state for _, state in reader.replay("a", start=1001.0, end=1003.0)
+    ] == states[1:4]
+    assert reader.state_at("a", 1002.5) == states[2]
+    assert reader.state_at("a", 999.0) is None
+    assert reader.status_at("b", 1003.0).mac == SAMPLE_STATUS["mac"]
+
+
+def test_keyframes_bound_replays(tmp_path):
+    path = tmp_path / "status.jsonl"
+    journal = StatusJournal(path, keyframe_interval=10.0)
+    for second in range(0, 40, 5):
+        state = copy.deepcopy(SAMPLE_STATUS)
+        state["uptime"] = second
+        journal.record("a", state, float(second))
+    journal.close()
+    reader = JournalReader(path)
+    assert reader.keyframe_offset("a", 25.0) > reader.keyframe_offset("a", 5.0)
+    assert reader.state_at("a", 27.0)["uptime"] == 25
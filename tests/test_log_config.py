@@ -0,0 +1,62 @@
+from loguru import logger
+import pytest
+
+from shelly import log_config
+from shelly.log_config import ChangeSampler, configure_logging
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(log_config.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_sampler_lets_changes_through(clock):
+    sampler = ChangeSampler(interval=60.0)
+    assert [sampler(value) for value in (1, 1, 2, 2, 1)] == [
+        True,
+        False,
+        True,
+        False,
+        True,
+    ]
+
+
+def test_sampler_repeats_unchanged_values_after_interval(clock):
+    sampler = ChangeSampler(interval=60.0)
+    assert sampler("on")
+    clock[0] = 59.0
+    assert not sampler("on")
+    clock[0] = 60.0
+    assert sampler("on")
+    clock[0] = 61.0
+    assert not sampler("on")
+
+
+def test_sampler_without_interval_lets_everything_through(clock):
+    sampler = ChangeSampler(interval=0.0)
+    assert all(sampler("on") for _ in range(3))
+
+
+def test_configure_logging_writes_files(tmp_path):
+    try:
+        handlers = configure_logging(directory=tmp_path, level="INFO", enqueue=False)
+        assert len(handlers) == 2
+        logger.debug("filtered out")
+        logger.info("status line")
+        logger.log("POWER", "power line")
+        main = (tmp_path / "dimmer2.log").read_text()
+        power = (tmp_path / "dimmer_power.log").read_text()
+        assert "filtered out" not in main
+        assert "status line" in main and "power line" in main
+        assert "status line" not in power and "power line" in power
+    finally:
+        configure_logging(directory=None)
+
+
+def test_configure_logging_replaces_previous_setup(tmp_path):
+    configure_logging(directory=tmp_path, enqueue=False)
+    assert configure_logging(directory=None) == []
+    logger.info("after")
+    assert not (tmp_path / "dimmer2.log").read_text()
@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+from shelly.metrics import COUNTERS, DeviceMetrics, LatencyHistogram
+
+
+def test_small_values_are_exact():
+    histogram = LatencyHistogram(sub_bucket_bits=7)
+    for value in range(128):
+        assert histogram._bounds(histogram._index(value)) == (value, value)
+
+
+def test_bucket_edges():
+    histogram = LatencyHistogram(sub_bucket_bits=7)
+    assert histogram._bounds(histogram._index(128)) == (128, 129)
+    assert histogram._bounds(histogram._index(255)) == (254, 255)
+    assert histogram._bounds(histogram._index(256)) == (256, 259)
+    # Buckets are contiguous and every value falls into its own bucket.
+    previous = -1
+    for index in range(histogram._index(1 << 20) + 1):
+        low, high = histogram._bounds(index)
+        assert low == previous + 1 and high >= low
+        assert histogram._index(low) == histogram._index(high) == index
+        previous = high
+
+
+def test_percentiles_within_relative_error():
+    rng = random.Random(1)
+    values = [int(rng.lognormvariate(9, 1)) for _ in range(20000)]
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    values.sort()
+    for percent in (50, 90, 99, 99.9):
+        exact = values[round(len(values) * percent / 100) - 1]
+        assert histogram.percentile(percent) == pytest.approx(exact, rel=2 ** (1 - 7))
+    assert histogram.percentile(100) == histogram.max == values[-1]
+    assert (histogram.count, histogram.total, histogram.min) == (
+        len(values),
+        sum(values),
+        values[0],
+    )
+
+
+def test_empty_and_negative_values():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(99) == 0
+    assert histogram.cumulative([10, 100]) == [0, 0]
+    histogram.record(-5)
+    assert (histogram.min, histogram.max, histogram.percentile(50)) == (0, 0, 0)
+
+
+def test_cumulative_counts():
+    histogram = LatencyHistogram()
+    for value in (5, 50, 129, 500, 5000):
+        histogram.record(value)
+    bounds = [0, 5, 128, 499, 501, 100000]
+    assert histogram.cumulative(bounds) == [
+        histogram.count_at_or_below(b) for b in bounds
+    ]
+    # 129 and 500 share the buckets starting at 128 and 500.
+    assert histogram.cumulative(bounds) == [0, 1, 3, 3, 4, 5]
+    assert list(histogram.buckets()) == [(5, 1), (50, 1), (129, 1), (503, 1), (5055, 1)]
+
+
+def test_merge():
+    first, second = LatencyHistogram(), LatencyHistogram()
+    first.record(10)
+    second.record(100000)
+    second.record(3)
+    first.merge(second)
+    assert (first.count, first.min, first.max, first.total) == (3, 3, 100000, 100013)
+    with pytest.raises(ValueError):
+        first.merge(LatencyHistogram(sub_bucket_bits=5))
+
+
+def test_device_metrics():
+    metrics = DeviceMetrics()
+    metrics.observe("status", 1_500_000, 1024)
+    metrics.observe("status", 2_500_000, 1024)
+    metrics.increment("timeouts")
+    snapshot = metrics.snapshot()
+    assert {key: snapshot[key] for key in COUNTERS} == dict(
+        dict.fromkeys(COUNTERS, 0), requests=2, timeouts=1, bytes_received=2048
+    )
+    assert snapshot["latency_us"]["status"]["count"] == 2
+    assert snapshot["latency_us"]["status"]["min"] == 1500
+    counters, latency = metrics.cumulative([2000, 3000])
+    assert counters["requests"] == 2
+    assert latency == {"status": ([1, 2], 2, 4000)}
+    copies = metrics.histograms()
+    copies["status"].record(1)
+    assert metrics.latency["status"].count == 2
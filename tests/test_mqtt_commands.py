@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import pytest
+
+from shelly.benchmarks import simulated_fleet
+from shelly.dimmer2 import Dimmer2
+from shelly.mqtt_commands import (
+    CommandError,
+    CommandTimeout,
+    MQTTCommandTransport,
+    acknowledges,
+)
+from shelly.mqtt_ingest import MQTTIngest
+
+
+class Broker:
+    """
+    Routes published commands to the simulated devices, whose status
+    messages come back through the ingestion.
+    """
+
+    def __init__(self, fleet):
+        self.fleet = fleet
+        self.ingest = MQTTIngest()
+        self.published = []
+        self.deliver = True
+        self.rc = 0
+        for device in fleet.devices:
+            device.publish = self.ingest.dispatch
+
+    def publish(self, topic, payload):
+        self.published.append(topic)
+        if self.deliver and not self.rc:
+            self.fleet.command(topic, payload)
+        return SimpleNamespace(rc=self.rc)
+
+
+@pytest.fixture
+def setup():
+    with simulated_fleet(1) as fleet:
+        broker = Broker(fleet)
+        transport = MQTTCommandTransport(
+            broker.ingest, timeout=1.0, publish=broker.publish
+        )
+        dimmer = Dimmer2(fleet.addresses[0], autostart=False)
+        dimmer.get_status()
+        dimmer.use_mqtt(transport)
+        yield broker, transport, dimmer, fleet.devices[0]
+        dimmer.close()
+
+
+def light_requests(dimmer):
+    return dimmer.metrics()["latency_us"].get("light/0", {}).get("count", 0)
+
+
+def test_acknowledges():
+    assert acknowledges(
+        {"turn": "on", "brightness": 40}, {"ison": True, "brightness": 40}
+    )
+    assert not acknowledges({"turn": "on"}, {"ison": False, "brightness": 40})
+    assert not acknowledges({"brightness": 40}, {"ison": True, "brightness": 30})
+    assert acknowledges({"brightness": 140}, {"ison": True, "brightness": 100})
+    assert acknowledges({"turn": "toggle"}, {"ison": False})
+
+
+def test_acknowledged_command(setup):
+    broker, transport, dimmer, device = setup
+    dimmer.change_state(turn="on", brightness=40)
+    assert broker.published == [f"shellies/{device.mqtt_id}/light/0/set"]
+    assert device._light["source"] == "mqtt"
+    assert (dimmer.light_status.is_on, dimmer.light_status.brightness) == (True, 40)
+    assert light_requests(dimmer) == 0
+    assert not transport._pending
+
+
+def test_timeout_falls_back_to_http(setup):
+    broker, transport, dimmer, device = setup
+    broker.deliver = False
+    transport.timeout = 0.05
+    with pytest.raises(CommandTimeout):
+        transport.send(device.mqtt_id, {"turn": "on"})
+    dimmer.change_state(turn="on")
+    assert device._light["ison"] and device._light["source"] == "http"
+    assert light_requests(dimmer) == 1
+    assert not transport._pending
+
+
+def test_publish_failure_falls_back_to_http(setup):
+    broker, transport, dimmer, device = setup
+    broker.rc = 4
+    with pytest.raises(CommandError):
+        transport.send(device.mqtt_id, {"turn": "on"})
+    dimmer.change_state(brightness=20)
+    assert device._light["brightness"] == 20 and device._light["source"] == "http"
+    assert light_requests(dimmer) == 1
+
+
+@pytest.mark.parametrize("command", [{"turn": "on", "timer": 5}, {"turn": "toggle"}])
+def test_timer_and_toggle_use_http(setup, command):
+    broker, transport, dimmer, device = setup
+    dimmer.change_state(**command)
+    assert broker.published == []
+    assert device._light["ison"] and device._light["source"] == "http"
+    assert light_requests(dimmer) == 1
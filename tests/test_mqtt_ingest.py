@@ -0,0 +1,81 @@
+from shelly.mqtt_ingest import MQTTIngest, TopicTrie, parse_message
+
+
+def test_plus_matches_one_level():
+    trie = TopicTrie()
+    trie.add("shellies/+/light/0/power", "power")
+    assert trie.match("shellies/a/light/0/power") == ["power"]
+    assert trie.match("shellies/a/b/light/0/power") == []
+    assert trie.match("shellies/a/light/0") == []
+
+
+def test_hash_matches_parent_and_children():
+    trie = TopicTrie()
+    trie.add("shellies/a/#", "a")
+    trie.add("#", "all")
+    assert sorted(trie.match("shellies/a")) == ["a", "all"]
+    assert sorted(trie.match("shellies/a/light/0/status")) == ["a", "all"]
+    assert trie.match("shellies/b/light/0") == ["all"]
+
+
+def test_add_and_remove_clear_cached_matches():
+    trie = TopicTrie()
+    trie.add("shellies/+/input/0", "first")
+    assert trie.match("shellies/a/input/0") == ["first"]
+    trie.add("shellies/a/#", "second")
+    assert sorted(trie.match("shellies/a/input/0")) == ["first", "second"]
+    trie.remove("shellies/+/input/0", "first")
+    assert trie.match("shellies/a/input/0") == ["second"]
+    # Removing a pattern that was never added changes nothing.
+    trie.remove("shellies/x/input/0", "second")
+    assert trie.match("shellies/a/input/0") == ["second"]
+
+
+def test_parses_payloads_by_topic():
+    message = parse_message("shellies/a/light/0/power", b"12.5")
+    assert (message.device_id, message.subtopic, message.value) == (
+        "a",
+        "light/0/power",
+        12.5,
+    )
+    assert parse_message("shellies/a/input/0", b"1").value is True
+    assert parse_message(
+        "shellies/a/input_event/0", b'{"event":"S","event_cnt":3}'
+    ).value == {
+        "event": "S",
+        "event_cnt": 3,
+    }
+    assert parse_message("shellies/a/unknown", b"x").value == b"x"
+    assert parse_message("other/a/light/0", b"on") is None
+
+
+def test_dispatch_calls_device_handlers():
+    mqtt = MQTTIngest()
+    device, every = [], []
+    mqtt.add_handler("a", device.append)
+    mqtt.add_handler(None, every.append)
+    assert mqtt.dispatch("shellies/a/light/0", b"on") == 2
+    assert mqtt.dispatch("shellies/b/light/0", b"off") == 1
+    assert mqtt.dispatch("elsewhere/a/light/0", b"on") == 0
+    assert [message.value for message in device] == [True]
+    assert [message.device_id for message in every] == ["a", "b"]
+    mqtt.remove_handler("a", device.append)
+    assert mqtt.dispatch("shellies/a/light/0", b"on") == 1
+    assert mqtt.received == 4
+
+
+def test_unparsable_payloads_reach_handlers_raw():
+    mqtt = MQTTIngest()
+    received = []
+    mqtt.subscribe("shellies/+/light/0/power", received.append)
+    assert mqtt.dispatch("shellies/a/light/0/power", b"n/a") == 1
+    assert received[0].value == received[0].payload == b"n/a"
+
+
+def test_failing_handler_does_not_stop_others():
+    mqtt = MQTTIngest()
+    received = []
+    mqtt.add_handler("a", lambda message: 1 / 0)
+    mqtt.add_handler("a", received.append)
+    assert mqtt.dispatch("shellies/a/online", b"true") == 2
+    assert received[0].value is True
@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from shelly.request_queue import Priority, RequestQueue
+
+
+def test_rejects_zero_slots():
+    with pytest.raises(ValueError):
+        RequestQueue(0)
+
+
+def test_commands_go_before_polls():
+    queue = RequestQueue(max_in_flight=1)
+    release = threading.Event()
+    order = []
+
+    def blocker():
+        release.wait()
+        return "blocker"
+
+    def request(name):
+        order.append(name)
+        return name
+
+    threads = [threading.Thread(target=queue.run, args=(blocker,))]
+    threads[0].start()
+    while queue.snapshot()["in_flight"] == 0:
+        time.sleep(0.001)
+    for name, priority in (
+        ("poll", Priority.poll),
+        ("query", Priority.query),
+        ("command", Priority.command),
+    ):
+        thread = threading.Thread(
+            target=queue.run, args=(lambda name=name: request(name), priority)
+        )
+        thread.start()
+        threads.append(thread)
+        while queue.snapshot()["queued"] < len(threads) - 1:
+            time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert order == ["command", "query", "poll"]
+
+
+def test_queued_polls_share_one_response():
+    queue = RequestQueue(max_in_flight=1)
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def poll():
+        calls.append(1)
+        return len(calls)
+
+    blocker = threading.Thread(target=queue.run, args=(release.wait,))
+    blocker.start()
+    while queue.snapshot()["in_flight"] == 0:
+        time.sleep(0.001)
+    pollers = [
+        threading.Thread(
+            target=lambda: results.append(queue.run(poll, Priority.poll, "status"))
+        )
+        for _ in range(5)
+    ]
+    for thread in pollers:
+        thread.start()
+    while queue.merged < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in [blocker, *pollers]:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [1] * 5
+    assert queue.snapshot() == {"queued": 0, "in_flight": 0, "merged": 4}
+
+
+def test_errors_reach_every_merged_caller():
+    queue = RequestQueue()
+
+    def fail():
+        raise OSError("refused")
+
+    with pytest.raises(OSError):
+        queue.run(fail, Priority.poll, "status")
+    assert queue.snapshot()["in_flight"] == 0
+
+
+def test_interrupted_wait_leaves_the_queue():
+    queue = RequestQueue(max_in_flight=1)
+    release = threading.Event()
+    interrupt = threading.Event()
+    wait = queue._condition.wait
+    errors = {}
+
+    def interruptible_wait(timeout=None):
+        if interrupt.is_set() and threading.current_thread().name == "interrupted":
+            raise KeyboardInterrupt
+        return wait(timeout)
+
+    queue._condition.wait = interruptible_wait
+
+    def poll(name):
+        try:
+            queue.run(lambda: name, Priority.poll, "status")
+        except BaseException as error:
+            errors[name] = error
+
+    blocker = threading.Thread(target=queue.run, args=(release.wait,))
+    blocker.start()
+    while queue.snapshot()["in_flight"] == 0:
+        time.sleep(0.001)
+    interrupted = threading.Thread(
+        target=poll, args=("interrupted",), name="interrupted"
+    )
+    interrupted.start()
+    while queue.snapshot()["queued"] == 0:
+        time.sleep(0.001)
+    merged = threading.Thread(target=poll, args=("merged",))
+    merged.start()
+    while queue.merged == 0:
+        time.sleep(0.001)
+    interrupt.set()
+    with queue._condition:
+        queue._condition.notify_all()
+    interrupted.join()
+    merged.join()
+    assert isinstance(errors["interrupted"], KeyboardInterrupt)
+    assert isinstance(errors["merged"], KeyboardInterrupt)
+    assert queue.snapshot()["queued"] == 0
+
+    release.set()
+    blocker.join()
+    assert queue.run(lambda: "next", Priority.poll, "status") == "next"
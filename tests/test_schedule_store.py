@@ -0,0 +1,114 @@
+import pendulum
+import pytest
+
+from shelly.clock import VirtualClock, system_clock
+from shelly.schedule_store import MAX_CATCH_UP, CatchUp, ScheduleStore
+from shelly.scheduler import Scheduler
+from shelly.scheduling import Repeater, When
+
+START = pendulum.datetime(2024, 3, 4, 0, 0, tz="UTC")
+
+
+def when(time, repeater=None):
+    return When(time, start=START, repeater=repeater)
+
+
+def test_add_and_due():
+    store = ScheduleStore()
+    schedule_id = store.add("dimmer", when("07:00"), "on", after=START)
+    assert len(store) == 1
+    assert store.next_fire_time() == START.at(7)
+    assert store.due(START.at(6)) == []
+    (due,) = store.due(START.at(7))
+    assert due.id == schedule_id
+    assert due.action == "on"
+    assert store.mark_fired(schedule_id, START.at(7)) is None
+    assert store.due(START.add(days=1)) == []
+
+
+def test_add_rejects_invalid_action():
+    store = ScheduleStore()
+    with pytest.raises(ValueError):
+        store.add("dimmer", when("07:00"), "dance", after=START)
+    assert len(store) == 0
+
+
+def test_repeating_schedule_survives_reopen(tmp_path):
+    path = tmp_path / "schedules.db"
+    store = ScheduleStore(path)
+    hourly = Repeater(pendulum.duration(hours=1), start=START)
+    schedule_id = store.add("dimmer", when("00:00", hourly), "off", after=START)
+    store.close()
+
+    store = ScheduleStore(path)
+    schedule = store.get(schedule_id)
+    assert schedule is not None
+    assert schedule.next_fire == START.add(hours=1)
+    assert store.mark_fired(schedule_id, START.add(hours=1)) == START.add(hours=2)
+
+
+def test_recover_policies():
+    store = ScheduleStore()
+    hourly = Repeater(pendulum.duration(hours=1), start=START)
+    skip = store.add("a", when("00:00", hourly), "on", CatchUp.skip, after=START)
+    once = store.add("b", when("00:00", hourly), "on", CatchUp.once, after=START)
+    every = store.add("c", when("00:00", hourly), "on", CatchUp.all, after=START)
+    missed = store.recover(START.add(hours=3, minutes=30))
+    ids = [schedule.id for schedule, _ in missed]
+    assert skip not in ids
+    assert ids.count(once) == 1
+    assert ids.count(every) == 3
+    assert store.get(skip).next_fire == START.add(hours=4)
+
+
+def test_catch_up_limit_is_per_schedule():
+    store = ScheduleStore()
+    for index in range(MAX_CATCH_UP):
+        store.add(f"device-{index}", when("00:30"), "on", after=START)
+    hourly = Repeater(pendulum.duration(hours=1), start=START)
+    every = store.add("dimmer", when("00:00", hourly), "off", CatchUp.all, after=START)
+    missed = store.recover(START.add(hours=23, minutes=45))
+    assert sum(schedule.id == every for schedule, _ in missed) == 23
+    assert len(missed) == MAX_CATCH_UP + 23
+
+
+def test_catch_up_all_is_capped():
+    store = ScheduleStore()
+    minutely = Repeater(pendulum.duration(minutes=1), start=START)
+    store.add("dimmer", when("00:00", minutely), "on", CatchUp.all, after=START)
+    assert len(store.recover(START.add(days=1))) == MAX_CATCH_UP
+
+
+def test_reloaded_schedules_use_store_clock(tmp_path):
+    path = tmp_path / "schedules.db"
+    clock = VirtualClock(START)
+    hourly = Repeater(pendulum.duration(hours=1), start=START, clock=clock)
+    end = START.add(days=1)
+    store = ScheduleStore(path, clock)
+    schedule_id = store.add(
+        "dimmer",
+        When("00:00", start=START, end=end, repeater=hourly, clock=clock),
+        "on",
+    )
+    store.close()
+
+    store = ScheduleStore(path, clock)
+    schedule = store.get(schedule_id)
+    assert schedule.when.clock is clock
+    assert schedule.when.repeater.clock is clock
+    # The wall clock is long past the end of the schedule.
+    assert not schedule.when.expired
+    assert not schedule.when.repeater.expired
+    clock.set(end.add(seconds=1))
+    assert schedule.when.expired
+
+
+def test_scheduler_clock_becomes_store_clock(tmp_path):
+    path = tmp_path / "schedules.db"
+    store = ScheduleStore(path)
+    schedule_id = store.add("dimmer", When("07:00", start=START), "on", after=START)
+    assert store.get(schedule_id).when.clock is system_clock
+    clock = VirtualClock(START)
+    scheduler = Scheduler(store, clock=clock)
+    assert store.clock is clock
+    assert scheduler.store.get(schedule_id).when.clock is clock
@@ -0,0 +1,84 @@
+import pendulum
+
+from shelly.clock import VirtualClock
+from shelly.schedule_store import ScheduleStore
+from shelly.scheduler import Scheduler
+from shelly.scheduling import Repeater, When
+
+START = pendulum.datetime(2024, 3, 4, 0, 0, tz="UTC")
+
+
+class FakeDimmer:
+    def __init__(self, ip, error=None):
+        self.ip = ip
+        self.error = error
+        self.commands = []
+
+    def change_state(self, **command):
+        if self.error is not None:
+            raise self.error
+        self.commands.append(command)
+
+
+def make_scheduler(*dimmers):
+    clock = VirtualClock(START)
+    return Scheduler(ScheduleStore(), dimmers, clock=clock), clock
+
+
+def test_tick_merges_actions_per_device():
+    dimmer = FakeDimmer("a")
+    scheduler, clock = make_scheduler(dimmer)
+    scheduler.store.add("a", When("07:00", start=START), "on timer=300", after=START)
+    scheduler.store.add("a", When("07:00", start=START), "off", after=START)
+    clock.set(START.at(7))
+    assert len(scheduler.tick()) == 2
+    assert dimmer.commands == [{"turn": "off"}]
+
+
+def test_run_until_fires_every_run():
+    dimmer = FakeDimmer("a")
+    scheduler, clock = make_scheduler(dimmer)
+    hourly = Repeater(pendulum.duration(hours=1), start=START, clock=clock)
+    scheduler.store.add(
+        "a", When("00:00", start=START, repeater=hourly), "on", after=START
+    )
+    assert scheduler.run_until(START.add(hours=10)) == 10
+    assert len(dimmer.commands) == 10
+    assert clock.now() == START.add(hours=10)
+
+
+def test_failures_do_not_stop_other_devices():
+    broken = FakeDimmer("a", RuntimeError("boom"))
+    invalid = FakeDimmer("b")
+    healthy = FakeDimmer("c")
+    scheduler, clock = make_scheduler(broken, invalid, healthy)
+    store = scheduler.store
+    first = store.add("a", When("07:00", start=START), "on", after=START)
+    second = store.add("b", When("07:00", start=START), "on", after=START)
+    third = store.add("c", When("07:00", start=START), "on", after=START)
+    # Rows written by an older version, before actions were validated.
+    with store._db:
+        store._db.execute(
+            "UPDATE schedules SET action = 'dance' WHERE id = ?", (second,)
+        )
+    clock.set(START.at(7))
+    assert len(scheduler.tick()) == 3
+    assert invalid.commands == []
+    assert healthy.commands == [{"turn": "on"}]
+    assert all(store.get(i).next_fire is None for i in (first, second, third))
+
+
+def test_loop_survives_failing_tick():
+    scheduler, clock = make_scheduler()
+    calls = []
+
+    def tick():
+        calls.append(clock.now())
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        scheduler._stop_event.set()
+        return []
+
+    scheduler.tick = tick
+    scheduler._loop()
+    assert len(calls) == 2
@@ -0,0 +1,41 @@
+from shelly.scheduling import merge_commands, parse_action
+
+
+def test_parse_action():
+    assert parse_action("on brightness=40 timer=300") == {
+        "turn": "on",
+        "brightness": 40,
+        "timer": 300,
+    }
+
+
+def test_merge_off_beats_on():
+    assert merge_commands([(0, parse_action("on")), (0, parse_action("off"))]) == {
+        "turn": "off"
+    }
+
+
+def test_merge_drops_timer_of_losing_turn():
+    commands = [(0, parse_action("on timer=300")), (0, parse_action("off"))]
+    assert merge_commands(commands) == {"turn": "off"}
+    assert merge_commands(reversed(commands)) == {"turn": "off"}
+
+
+def test_merge_keeps_timer_of_winning_turn():
+    commands = [
+        (1, parse_action("on timer=300")),
+        (0, parse_action("off brightness=10")),
+    ]
+    assert merge_commands(commands) == {"turn": "on", "timer": 300, "brightness": 10}
+
+
+def test_merge_keeps_timer_without_turn():
+    commands = [
+        (0, parse_action("brightness=40 timer=60")),
+        (0, parse_action("transition=500")),
+    ]
+    assert merge_commands(commands) == {
+        "brightness": 40,
+        "timer": 60,
+        "transition": 500,
+    }
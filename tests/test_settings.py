@@ -0,0 +1,44 @@
+import pytest
+
+from shelly.benchmarks import simulated_fleet
+from shelly.dimmer2 import Dimmer2
+
+
+@pytest.fixture
+def setup():
+    with simulated_fleet(1) as fleet:
+        dimmer = Dimmer2(fleet.addresses[0], autostart=False)
+        dimmer.get_status()
+        yield dimmer, fleet.devices[0]
+        dimmer.close()
+
+
+def fetches(dimmer):
+    return dimmer.metrics()["latency_us"].get("settings", {}).get("count", 0)
+
+
+def test_settings_are_cached_until_the_config_counter_changes(setup):
+    dimmer, device = setup
+    settings = dimmer.settings
+    assert dimmer.settings is settings
+    dimmer.get_status()
+    assert dimmer.settings is settings
+    assert fetches(dimmer) == 1
+
+    # Changed elsewhere, e.g. in the web interface of the device.
+    device._status["cfg_changed_cnt"] += 1
+    assert dimmer.settings is settings
+    dimmer.get_status()
+    assert dimmer.settings is not settings
+    assert fetches(dimmer) == 2
+
+
+def test_own_changes_invalidate_settings(setup):
+    dimmer, _ = setup
+    settings = dimmer.settings
+    dimmer.set_schedule_rules(["0700-01234-on"])
+    assert dimmer.settings is not settings
+    settings = dimmer.settings
+    dimmer.invalidate_settings()
+    assert dimmer.settings is not settings
+    assert fetches(dimmer) == 3
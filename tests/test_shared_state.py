@@ -0,0 +1,56 @@
+import os
+import time
+
+import pytest
+
+from shelly.fleet import StatusSample
+from shelly.shared_state import SEQ, SharedStatusTable
+
+
+@pytest.fixture
+def table():
+    table = SharedStatusTable.create(f"shelly-test-{os.getpid()}", capacity=8)
+    yield table
+    table.close()
+    table.unlink()
+
+
+def sample(mac, power=10.0):
+    return StatusSample("10.0.0.1", time.time(), True, mac, True, 50, power)
+
+
+def test_reader_sees_published_rows(table):
+    table.publish(sample("EC64C9C2EFE2", 12.5))
+    reader = SharedStatusTable.attach(table.name)
+    try:
+        row = reader.read("ec64c9c2efe2")
+        assert row.mac == "EC64C9C2EFE2"
+        assert row.power == 12.5
+        assert row.is_on and row.ok
+        table.publish(sample("EC64C9C2EFE2", 20.0))
+        assert reader.read("EC64C9C2EFE2").power == 20.0
+        assert [row.mac for row in reader.rows()] == ["EC64C9C2EFE2"]
+    finally:
+        reader.close()
+
+
+def test_read_short_mac(table):
+    table.publish(sample("A1B2C3"))
+    reader = SharedStatusTable.attach(table.name)
+    try:
+        assert reader.read("A1B2C3").mac == "A1B2C3"
+        assert reader.read("FFFFFFFFFFFF") is None
+    finally:
+        reader.close()
+
+
+def test_read_gives_up_on_row_left_mid_write(table):
+    table.publish(sample("EC64C9C2EFE2"))
+    # A writer that died between making the counter odd and even again.
+    offset = table._offset(0)
+    SEQ.pack_into(table._buffer, offset, SEQ.unpack_from(table._buffer, offset)[0] + 1)
+    table.read_timeout = 0.05
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        table.read("EC64C9C2EFE2")
+    assert time.monotonic() - start < 1.0
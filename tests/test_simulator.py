@@ -0,0 +1,13 @@
+from shelly.simulator import SimulatedDimmer
+
+
+def test_energy_accumulates_at_one_poll_per_second():
+    dimmer = SimulatedDimmer("EC64C9C2EFE2")
+    dimmer._set_light({"turn": "on", "brightness": "100"})
+    start = dimmer.status()["meters"][0]["total"]
+    for _ in range(120):
+        # Pretend a second passed since the last poll.
+        dimmer._energy_at -= 1.0
+        dimmer.status()
+    # 40 W for two minutes, within the +-2% noise of the simulated meter.
+    assert 78 <= dimmer.status()["meters"][0]["total"] - start <= 82
@@ -0,0 +1,61 @@
+import orjson
+import pytest
+
+from models import Status
+from models.status import SAMPLE_STATUS
+from shelly.dimmer2 import Dimmer2
+from shelly.state_cache import StateCache
+
+
+@pytest.fixture
+def status():
+    return Status(**SAMPLE_STATUS)
+
+
+def test_round_trip(tmp_path, status):
+    path = tmp_path / "state.json"
+    cache = StateCache(path, flush_interval=60.0)
+    cache.put("10.0.0.1", status, 1000.0)
+    assert cache.get("10.0.0.1") == (status, 1000.0)
+    cache.close()
+
+    loaded, timestamp = StateCache(path).get("10.0.0.1")
+    assert timestamp == 1000.0
+    assert loaded.mac == status.mac
+    assert loaded.meters[0].total == status.meters[0].total
+    assert StateCache(path).get("10.0.0.2") is None
+
+
+@pytest.mark.parametrize("content", [b"[]", b"42", b'"state"', b"null", b"{not json"])
+def test_ignores_files_that_are_not_an_object(tmp_path, content):
+    path = tmp_path / "state.json"
+    path.write_bytes(content)
+    cache = StateCache(path)
+    assert cache.get("10.0.0.1") is None
+    cache.close()
+
+
+def test_ignores_invalid_entries(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_bytes(
+        orjson.dumps(
+            {"a": [], "b": {"t": 1.0, "s": {"mac": 1}}, "c": {"t": "x", "s": {}}}
+        )
+    )
+    cache = StateCache(path)
+    assert [cache.get(device) for device in "abc"] == [None, None, None]
+    cache.close()
+
+
+def test_warm_start(tmp_path, status):
+    path = tmp_path / "state.json"
+    cache = StateCache(path)
+    cache.put("127.0.0.1:1", status, 1000.0)
+    cache.close()
+    dimmer = Dimmer2("127.0.0.1:1", autostart=False, state_cache=StateCache(path))
+    assert dimmer.is_stale
+    assert dimmer.cached_status.mac == status.mac
+
+    path.write_bytes(b"[]")
+    dimmer = Dimmer2("127.0.0.1:1", autostart=False, state_cache=StateCache(path))
+    assert dimmer.cached_status is None
@@ -0,0 +1,67 @@
+import copy
+
+import orjson
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from models.status import SAMPLE_STATUS  # noqa: E402
+from shelly.journal import JournalReader, StatusJournal  # noqa: E402
+from shelly.telemetry_export import write_arrow, write_npy  # noqa: E402
+
+
+@pytest.fixture
+def reader(tmp_path):
+    journal = StatusJournal(tmp_path / "status.jsonl", keyframe_interval=3.0)
+    for second in range(10):
+        for device in ("a", "b"):
+            state = copy.deepcopy(SAMPLE_STATUS)
+            state["meters"][0]["power"] = float(second)
+            if device == "b" and second == 4:
+                del state["tmp"]
+            journal.record(device, state, 1000.0 + second)
+    journal.close()
+    return JournalReader(tmp_path / "status.jsonl")
+
+
+def test_write_npy_round_trip(tmp_path, reader):
+    out = tmp_path / "npy"
+    # Small chunks, so the headers are rewritten after several appends.
+    assert write_npy(out, reader, start=1002.0, end=1007.0, chunk_size=3) == 12
+    assert orjson.loads((out / "devices.json").read_bytes()) == ["a", "b"]
+    timestamps = np.load(out / "timestamp.npy", mmap_mode="r")
+    devices = np.load(out / "device.npy")
+    power = np.load(out / "power.npy")
+    temperature = np.load(out / "temperature.npy")
+    assert timestamps.dtype == np.float64 and devices.dtype == np.int32
+    assert list(timestamps) == [1000.0 + s for s in range(2, 8) for _ in "ab"]
+    assert list(devices) == [0, 1] * 6
+    assert list(power) == [float(s) for s in range(2, 8) for _ in "ab"]
+    missing = np.isnan(temperature)
+    assert list(np.flatnonzero(missing)) == [5]
+    assert set(temperature[~missing]) == {SAMPLE_STATUS["tmp"]["tC"]}
+
+
+def test_write_npy_of_one_device(tmp_path, reader):
+    out = tmp_path / "npy"
+    assert write_npy(out, reader, devices=["b"]) == 10
+    assert orjson.loads((out / "devices.json").read_bytes()) == ["b"]
+    assert set(np.load(out / "device.npy")) == {0}
+
+
+def test_write_arrow_round_trip(tmp_path, reader):
+    pa = pytest.importorskip("pyarrow")
+    path = tmp_path / "out.arrow"
+    assert write_arrow(path, reader, end=1004.0, chunk_size=4) == 10
+    table = pa.ipc.open_file(str(path)).read_all()
+    assert table.num_rows == 10
+    assert table.schema.field("timestamp").type == pa.timestamp("us", tz="UTC")
+    assert table.schema.field("device").type == pa.dictionary(pa.int32(), pa.string())
+    rows = table.to_pylist()
+    assert [row["timestamp"].timestamp() for row in rows] == [
+        1000.0 + s for s in range(5) for _ in "ab"
+    ]
+    assert [row["device"] for row in rows] == ["a", "b"] * 5
+    assert [row["power"] for row in rows] == [float(s) for s in range(5) for _ in "ab"]
+    assert np.isnan(rows[9]["temperature"])
+    assert rows[9]["is_on"] == float(SAMPLE_STATUS["lights"][0]["ison"])